@@ -6,10 +6,13 @@ import os
 import requests
 import shutil
 import subprocess
+import threading
 import time
 import yaml
 
 from base64 import b64encode
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from copy import copy
 from datetime import datetime, timezone
 
 from anarchygovernor import AnarchyGovernor
@@ -44,7 +47,16 @@ class AnarchyRunner:
     domain = os.environ.get('ANARCHY_DOMAIN', 'anarchy.gpte.redhat.com')
     output_dir = os.environ.get('OUTPUT_DIR', '/opt/app-root/anarchy-runner/output')
     polling_interval = int(os.environ.get('POLLING_INTERVAL', 5))
+    run_concurrency = int(os.environ.get('RUN_CONCURRENCY', 1))
+    run_wait = int(os.environ.get('RUN_WAIT', 20))
     runner_dir = os.environ.get('RUNNER_DIR', '/opt/app-root/anarchy-runner/ansible-runner')
+    runs_dir = os.environ.get('RUNS_DIR', '/opt/app-root/anarchy-runner/runs')
+
+    # Requirements paths set per run when runs are concurrent
+    ansible_collections_path = None
+    ansible_roles_path = None
+    # Serialize setup of shared virtualenvs and galaxy requirements
+    setup_lock = threading.Lock()
 
     ansible_collections_dir = f"{ansible_private_dir}/collections"
     ansible_roles_dir = f"{ansible_private_dir}/roles"
@@ -60,18 +72,46 @@ class AnarchyRunner:
     else:
         namespace = os.environ.get('ANARCHY_NAMESPACE')
 
-    def get_run(self):
+    def get_run(self, running_run_names=()):
+        params = dict(wait=self.run_wait)
+        if running_run_names:
+            params['running'] = ','.join(running_run_names)
         try:
             response = requests.get(
                 f"{self.anarchy_url}/run",
-                headers = dict(Authorization=self.auth_header)
+                headers = dict(Authorization=self.auth_header),
+                params = params,
+                timeout = self.run_wait + 30,
             )
             if response.status_code != 200:
                 raise AnarchyGetRunException(f"{response.status_code} {response.text}")
             return response.json()
-        except requests.exceptions.ConnectionError as e:
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
             raise AnarchyGetRunException(f"{e}")
 
+    def for_run(self, run_name):
+        """
+        Copy of runner with private data and output directories for a run
+        executing concurrently with others.
+        """
+        run_dir = os.path.join(self.runs_dir, run_name)
+        run_runner = copy(self)
+        run_runner.runner_dir = os.path.join(run_dir, 'ansible-runner')
+        run_runner.output_dir = os.path.join(run_dir, 'output')
+        run_runner.anarchy_run_data_path = os.path.join(run_runner.output_dir, 'anarchy-run-data.yaml')
+        run_runner.anarchy_result_path = os.path.join(run_runner.output_dir, 'anarchy-result.yaml')
+        run_runner.inventory_path = os.path.join(run_runner.runner_dir, 'inventory')
+        run_runner.playbook_path = os.path.join(run_runner.runner_dir, 'project/main.yml')
+
+        shutil.rmtree(run_dir, ignore_errors=True)
+        shutil.copytree(
+            self.runner_dir, run_runner.runner_dir,
+            ignore = shutil.ignore_patterns('__pycache__', 'artifacts'),
+            symlinks = True,
+        )
+        os.makedirs(run_runner.output_dir)
+        return run_runner
+
     def post_result(self, anarchy_run, result, retries=10):
         for i in range(retries):
             try:
@@ -148,7 +188,12 @@ class AnarchyRunner:
             playbook = 'main.yml',
             private_data_dir = self.runner_dir
         )
+        ansible_run.config.env['ANSIBLE_ANARCHY_OUTPUT_DIR'] = self.output_dir
         ansible_run.config.env['ANSIBLE_STDOUT_CALLBACK'] = 'anarchy'
+        if self.ansible_collections_path:
+            ansible_run.config.env['ANSIBLE_COLLECTIONS_PATH'] = self.ansible_collections_path
+        if self.ansible_roles_path:
+            ansible_run.config.env['ANSIBLE_ROLES_PATH'] = self.ansible_roles_path
 
         if virtual_env:
             ansible_run.config.env['PATH'] = '{}/bin:{}'.format(virtual_env, os.environ['PATH'])
@@ -208,18 +253,56 @@ class AnarchyRunner:
                 else:
                     raise
 
+    def run_in_private_dir(self, run_data):
+        run_dir = os.path.join(self.runs_dir, run_data['run']['metadata']['name'])
+        try:
+            self.for_run(run_data['run']['metadata']['name']).run(run_data)
+        finally:
+            shutil.rmtree(run_dir, ignore_errors=True)
+
     def run_loop(self):
+        if self.run_concurrency > 1:
+            return self.run_loop_concurrent()
         while True:
             try:
+                get_run_start = time.monotonic()
                 run_data = self.get_run()
                 if run_data:
                     self.run(run_data)
-                else:
+                elif time.monotonic() - get_run_start < self.run_wait:
+                    # API returned without waiting, such as when pod is terminating
                     time.sleep(self.polling_interval)
             except AnarchyGetRunException as e:
                 logging.error(f"Failed to get run: {e}")
                 time.sleep(30)
 
+    def run_loop_concurrent(self):
+        """
+        Execute up to RUN_CONCURRENCY runs at once, each in its own thread
+        and private data directory.
+        """
+        runs = {}
+        with ThreadPoolExecutor(max_workers=self.run_concurrency) as executor:
+            while True:
+                for future in [future for future in runs if future.done()]:
+                    run_name = runs.pop(future)
+                    if future.exception():
+                        logging.error(f"Unhandled exception in AnarchyRun {run_name}", exc_info=future.exception())
+                if len(runs) >= self.run_concurrency:
+                    wait(runs, return_when=FIRST_COMPLETED)
+                    continue
+                try:
+                    get_run_start = time.monotonic()
+                    run_data = self.get_run(running_run_names=sorted(runs.values()))
+                    if run_data:
+                        future = executor.submit(self.run_in_private_dir, run_data)
+                        runs[future] = run_data['run']['metadata']['name']
+                    elif time.monotonic() - get_run_start < self.run_wait:
+                        time.sleep(self.polling_interval)
+                except AnarchyGetRunException as e:
+                    logging.error(f"Failed to get run: {e}")
+                    time.sleep(30)
+
     def setup_inventory(self,
         anarchy_action,
         anarchy_governor,
@@ -307,23 +390,34 @@ class AnarchyRunner:
             os.mkdir(requirements_roles_dir)
             with open(requirements_file, 'w') as f:
                 yaml.safe_dump(requirements, stream=f)
-        if os.path.lexists(self.ansible_collections_dir):
-            os.unlink(self.ansible_collections_dir)
-        if os.path.lexists(self.ansible_roles_dir):
-            os.unlink(self.ansible_roles_dir)
-        os.symlink(requirements_collections_dir, self.ansible_collections_dir)
-        os.symlink(requirements_roles_dir, self.ansible_roles_dir)
+        if self.run_concurrency > 1:
+            # Shared symlinks would switch requirements under other runs
+            self.ansible_collections_path = f"{requirements_collections_dir}:{self.ansible_collections_dir}"
+            self.ansible_roles_path = f"{requirements_roles_dir}:{self.ansible_roles_dir}"
+        else:
+            if os.path.lexists(self.ansible_collections_dir):
+                os.unlink(self.ansible_collections_dir)
+            if os.path.lexists(self.ansible_roles_dir):
+                os.unlink(self.ansible_roles_dir)
+            os.symlink(requirements_collections_dir, self.ansible_collections_dir)
+            os.symlink(requirements_roles_dir, self.ansible_roles_dir)
 
         if requirements and 'collections' in requirements:
             try:
-                self.run_command(['ansible-galaxy', 'collection', 'install', '-r', requirements_file])
+                self.run_command([
+                    'ansible-galaxy', 'collection', 'install', '-r', requirements_file,
+                    '-p', requirements_collections_dir,
+                ])
             except subprocess.CalledProcessError as e:
                 shutil.rmtree(requirements_dir)
                 raise AnarchyRunSetupException(f"Failed ansible-galaxy collection install: {e.stdout.decode('utf-8')}")
 
         if requirements and 'roles' in requirements:
             try:
-                self.run_command(['ansible-galaxy', 'role', 'install', '-r', requirements_file])
+                self.run_command([
+                    'ansible-galaxy', 'role', 'install', '-r', requirements_file,
+                    '-p', requirements_roles_dir,
+                ])
             except subprocess.CalledProcessError as e:
                 shutil.rmtree(requirements_dir)
                 raise AnarchyRunSetupException(f"Failed ansible-galaxy role install: {e.stdout.decode('utf-8')}")
@@ -382,8 +476,9 @@ class AnarchyRunner:
         else:
             raise AnarchyRunSetupException(f"Unknown handler type: {handler_type}")
 
-        virtual_env = self.setup_virtual_env(anarchy_governor)
-        self.setup_ansible_galaxy_requirements(anarchy_governor)
+        with self.setup_lock:
+            virtual_env = self.setup_virtual_env(anarchy_governor)
+            self.setup_ansible_galaxy_requirements(anarchy_governor)
         self.setup_output_dir()
         self.setup_inventory(
             anarchy_action = anarchy_action,
@@ -3,7 +3,16 @@ import logging
 import os
 
 class Anarchy():
+    cache_max_bytes = int(os.environ.get('CACHE_MAX_BYTES', 100 * 1024 * 1024))
+    cache_max_objects = int(os.environ.get('CACHE_MAX_OBJECTS', 0))
     domain = os.environ.get('ANARCHY_DOMAIN', 'anarchy.gpte.redhat.com')
+    kube_write_burst = int(os.environ.get('KUBE_WRITE_BURST', 100))
+    kube_write_rate = float(os.environ.get('KUBE_WRITE_RATE', 50))
+    result_blob_store = os.environ.get('RESULT_BLOB_STORE', '')
+    result_blob_store_path = os.environ.get('RESULT_BLOB_STORE_PATH', '/var/lib/anarchy/results')
+    result_inline_max_bytes = int(os.environ.get('RESULT_INLINE_MAX_BYTES', 16 * 1024))
+    run_wait_max = float(os.environ.get('RUN_WAIT_MAX', 30))
+    runner_status_interval = float(os.environ.get('RUNNER_STATUS_INTERVAL', 2))
     running_all_in_one = 'true' == os.environ.get('ANARCHY_RUNNING_ALL_IN_ONE', '')
     version = os.environ.get('ANARCHY_VERSION', 'v1')
 
@@ -21,8 +30,7 @@ class Anarchy():
 
     @classmethod
     async def on_shutdown(cls):
-        cls.core_v1_api.api_client.close()
-        cls.custom_objects_api.api_client.close()
+        await cls.api_client.close()
 
     @classmethod
     async def on_startup(cls):
@@ -40,5 +48,6 @@ class Anarchy():
                     'Please set OPERATOR_NAMESPACE environment variable.'
                 )
 
-        cls.core_v1_api = kubernetes_asyncio.client.CoreV1Api()
-        cls.custom_objects_api = kubernetes_asyncio.client.CustomObjectsApi()
+        cls.api_client = kubernetes_asyncio.client.ApiClient()
+        cls.core_v1_api = kubernetes_asyncio.client.CoreV1Api(cls.api_client)
+        cls.custom_objects_api = kubernetes_asyncio.client.CustomObjectsApi(cls.api_client)
@@ -1,11 +1,17 @@
+import asyncio
+import json
 import kubernetes_asyncio
 import logging
+import time
 
 from copy import deepcopy
 from datetime import datetime, timedelta, timezone
 
 from anarchy import Anarchy
 from anarchywatchobject import AnarchyWatchObject
+from blob_store import BlobStore
+from bounded_cache import BoundedCache
+from run_queue import RunQueue
 
 import anarchyaction
 import anarchygovernor
@@ -14,20 +20,28 @@ import anarchysubject
 import anarchyrunnerpod
 
 class AnarchyRun(AnarchyWatchObject):
-    cache = {}
+    # Runs which are pending or assigned to runner pods are never evicted
+    cache = BoundedCache(
+        evictable = lambda anarchy_run: anarchy_run.runner_state in ('queued', 'failed', 'lost', 'canceled', 'successful'),
+        max_bytes = Anarchy.cache_max_bytes,
+        max_objects = Anarchy.cache_max_objects,
+        sizeof = lambda anarchy_run: len(json.dumps(anarchy_run.definition)),
+    )
     kind = 'AnarchyRun'
     plural = 'anarchyruns'
     preload = True
-    pending_run_names = []
+    pending_run_conditions = {}
+    pending_runs = RunQueue()
+    # Runner pod assignments indexed by run name and by runner pod name
     runner_assignments = {}
+    runner_pod_assignments = {}
     runner_states = {'queued', 'pending', 'failed', 'lost', 'canceled', 'successful'}
 
     @classmethod
     def cache_remove(cls, name):
         super().cache_remove(name)
-        if name in cls.pending_run_names:
-            cls.pending_run_names.remove(name)
-        runner_pod_name = cls.runner_assignments.pop(name, None)
+        cls.pending_runs.discard(name)
+        runner_pod_name = cls.remove_runner_assignment(name)
         if runner_pod_name:
             logging.warning(f"Removed AnarchyRun {name} that was assigned to AnarchyRunnerPod {runner_pod_name}")
 
@@ -76,17 +90,35 @@ class AnarchyRun(AnarchyWatchObject):
         return anarchy_run
 
     @classmethod
-    def get_run_assigned_to_runner_pod(cls, anarchy_runner_pod):
-        for run_name, runner_pod_name in cls.runner_assignments.items():
-            if runner_pod_name == anarchy_runner_pod.name:
-                return cls.cache[run_name]
+    async def delete_ansible_run_blob(cls, key):
+        try:
+            await BlobStore.store.delete(key)
+        except Exception:
+            logging.exception(f"Failed to delete ansibleRun blob {key}")
+
+    @classmethod
+    def get_run_assigned_to_runner_pod(cls, anarchy_runner_pod, subject_name=None):
+        """
+        Get run assigned to runner pod, for subject if the pod runs
+        concurrently for several subjects.
+        """
+        for anarchy_run in cls.get_runs_assigned_to_runner_pod(anarchy_runner_pod):
+            if not subject_name or anarchy_run.subject_name == subject_name:
+                return anarchy_run
+
+    @classmethod
+    def get_runs_assigned_to_runner_pod(cls, anarchy_runner_pod):
+        return [
+            cls.cache[run_name] for run_name in sorted(cls.runner_pod_assignments.get(anarchy_runner_pod.name, ()))
+        ]
 
     @classmethod
     async def get_run_for_runner_pod(cls, anarchy_runner, anarchy_runner_pod):
         while True:
-            if not cls.pending_run_names:
+            name = cls.pending_runs.dequeue(anarchy_runner.name)
+            if not name:
                 return None
-            anarchy_run = cls.cache[cls.pending_run_names.pop(0)]
+            anarchy_run = cls.cache[name]
             while anarchy_run.runner_state == 'pending':
                 try:
                     await anarchy_run.assign_runner_pod(anarchy_runner, anarchy_runner_pod)
@@ -98,12 +130,49 @@ class AnarchyRun(AnarchyWatchObject):
                         await anarchy_run.refetch()
 
     @classmethod
-    async def handle_any_lost_runs(cls, anarchy_runner_pod):
-        lost_run_names = []
-        for run_name, runner_pod_name in cls.runner_assignments.items():
-            if runner_pod_name == anarchy_runner_pod.name:
-                anarchy_runner_pod.consecutive_failure_count += 1
-                lost_run_names.append(run_name)
+    def get_pending_run_condition(cls, runner_name):
+        condition = cls.pending_run_conditions.get(runner_name)
+        if not condition:
+            condition = cls.pending_run_conditions[runner_name] = asyncio.Condition()
+        return condition
+
+    @classmethod
+    async def wait_for_run_for_runner_pod(cls, anarchy_runner, anarchy_runner_pod, timeout):
+        """
+        Get run for runner pod, waiting up to timeout seconds for a run to
+        become pending for the runner.
+        """
+        condition = cls.get_pending_run_condition(anarchy_runner.name)
+        deadline = time.monotonic() + timeout
+        while True:
+            if anarchy_runner_pod.is_deleting or anarchy_runner_pod.is_marked_for_termination:
+                return None
+            anarchy_run = await cls.get_run_for_runner_pod(anarchy_runner, anarchy_runner_pod)
+            if anarchy_run:
+                return anarchy_run
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            try:
+                async with condition:
+                    await asyncio.wait_for(
+                        condition.wait_for(lambda: cls.pending_runs.count(anarchy_runner.name) > 0),
+                        remaining,
+                    )
+            except asyncio.TimeoutError:
+                return None
+
+    @classmethod
+    async def handle_any_lost_runs(cls, anarchy_runner_pod, running_run_names=()):
+        """
+        Mark runs assigned to runner pod as lost unless the pod reports they
+        are still running.
+        """
+        lost_run_names = [
+            run_name for run_name in cls.runner_pod_assignments.get(anarchy_runner_pod.name, ())
+            if run_name not in running_run_names
+        ]
+        anarchy_runner_pod.consecutive_failure_count += len(lost_run_names)
         for lost_run_name in lost_run_names:
             anarchy_run = cls.cache.get(lost_run_name)
             if not anarchy_run:
@@ -114,6 +183,33 @@ class AnarchyRun(AnarchyWatchObject):
             except Exception as e:
                 logging.exception("Error resetting {anarchy_run} to lost")
 
+    @classmethod
+    def handle_watch_deleted(cls, event_object):
+        super().handle_watch_deleted(event_object)
+        if not BlobStore.store:
+            return
+        key = event_object.get('status', {}).get('result', {}).get('ansibleRunRef', {}).get('key')
+        if key:
+            asyncio.create_task(cls.delete_ansible_run_blob(key))
+
+    @classmethod
+    def remove_runner_assignment(cls, run_name):
+        runner_pod_name = cls.runner_assignments.pop(run_name, None)
+        if runner_pod_name:
+            run_names = cls.runner_pod_assignments[runner_pod_name]
+            run_names.discard(run_name)
+            if not run_names:
+                del cls.runner_pod_assignments[runner_pod_name]
+        return runner_pod_name
+
+    @classmethod
+    def set_runner_assignment(cls, run_name, runner_pod_name):
+        if cls.runner_assignments.get(run_name) == runner_pod_name:
+            return
+        cls.remove_runner_assignment(run_name)
+        cls.runner_assignments[run_name] = runner_pod_name
+        cls.runner_pod_assignments.setdefault(runner_pod_name, set()).add(run_name)
+
     @classmethod
     async def on_startup(cls):
         await super().on_startup()
@@ -192,12 +288,33 @@ class AnarchyRun(AnarchyWatchObject):
                 "vars": spec_vars,
             }
 
-    def update_pending_run_names(self):
+    async def get_runner_name_for_queue(self):
+        """
+        Get name of AnarchyRunner that should run this AnarchyRun, as set by
+        the governor runner.
+        """
+        if Anarchy.running_all_in_one:
+            return 'default'
+        try:
+            anarchy_governor = await self.get_governor()
+        except kubernetes_asyncio.client.rest.ApiException as e:
+            if e.status != 404:
+                raise
+            logging.warning(f"{self} queued for default AnarchyRunner, AnarchyGovernor {self.governor_name} not found")
+            return 'default'
+        return anarchy_governor.spec.get('runner', 'default')
+
+    async def update_pending_runs(self):
         if self.runner_state == 'pending':
-            if self.name not in self.pending_run_names:
-                self.pending_run_names.append(self.name)
-        elif self.name in self.pending_run_names:
-            self.pending_run_names.remove(self.name)
+            if self.name not in self.pending_runs:
+                runner_name = await self.get_runner_name_for_queue()
+                self.pending_runs.enqueue(runner_name, self.name)
+                # Wake runner pods waiting in GET /run
+                condition = self.get_pending_run_condition(runner_name)
+                async with condition:
+                    condition.notify_all()
+        else:
+            self.pending_runs.discard(self.name)
 
     async def assign_runner_pod(self, anarchy_runner, anarchy_runner_pod):
         definition = deepcopy(self.definition)
@@ -223,7 +340,7 @@ class AnarchyRun(AnarchyWatchObject):
 
     async def cache_put(self):
         await super().cache_put()
-        self.update_pending_run_names()
+        await self.update_pending_runs()
         await self.update_runner_assignment()
 
     async def export(self):
@@ -248,7 +365,17 @@ class AnarchyRun(AnarchyWatchObject):
     async def get_subject(self):
         return await anarchysubject.AnarchySubject.get(self.subject_name)
 
+    async def get_result(self):
+        """
+        Get result with ansibleRun read back from the blob store.
+        """
+        return await BlobStore.load_result(self.status.get('result', {}))
+
+    async def offload_result(self, result):
+        return await BlobStore.offload_result(f"anarchyruns/{self.uid}.json.gz", result)
+
     async def set_runner_state_failed(self, result):
+        result = await self.offload_result(result)
         await self.json_patch_status([{
             "op": "add",
             "path": "/status/failures",
@@ -309,6 +436,7 @@ class AnarchyRun(AnarchyWatchObject):
         await runner.update_status()
 
     async def set_runner_state_successful(self, result):
+        result = await self.offload_result(result)
         await self.json_patch_status([{
             "op": "add",
             "path": "/status/result",
@@ -326,16 +454,18 @@ class AnarchyRun(AnarchyWatchObject):
 
     async def update_definition(self, definition):
         await super().update_definition(definition)
-        self.update_pending_run_names()
+        if self.cache.get(self.name) is self:
+            self.cache.updated(self.name)
+        await self.update_pending_runs()
         await self.update_runner_assignment()
 
     async def update_runner_assignment(self):
         runner_pod_name = self.runner_state
         if runner_pod_name in self.runner_states:
-            self.runner_assignments.pop(self.name, None)
+            self.remove_runner_assignment(self.name)
             return
         if runner_pod_name in anarchyrunnerpod.AnarchyRunnerPod.cache:
-            self.runner_assignments[self.name] = self.runner_state
+            self.set_runner_assignment(self.name, runner_pod_name)
         else:
             logging.warning(f"{self} reset to pending due to missing AnarchyRunnerPod {runner_pod_name}")
             try:
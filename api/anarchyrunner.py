@@ -1,7 +1,10 @@
+import asyncio
 import logging
+import time
 
 from anarchy import Anarchy
 from anarchywatchobject import AnarchyWatchObject
+from rate_limiter import RateLimiter
 
 import anarchyrun
 import anarchyrunnerpod
@@ -12,6 +15,14 @@ class AnarchyRunner(AnarchyWatchObject):
     plural = 'anarchyrunners'
     preload = True
 
+    @classmethod
+    async def on_shutdown(cls):
+        for anarchy_runner in cls.cache.values():
+            if anarchy_runner.status_flush_task:
+                anarchy_runner.status_flush_task.cancel()
+        if not Anarchy.running_all_in_one:
+            await super().on_shutdown()
+
     @classmethod
     async def on_startup(cls):
         if Anarchy.running_all_in_one:
@@ -38,23 +49,63 @@ class AnarchyRunner(AnarchyWatchObject):
         await cls.cache_put(default)
         logging.info(f"Cache preloaded {default}")
 
+    def __init__(self, definition):
+        super().__init__(definition)
+        self.status_dirty = False
+        self.status_flush_task = None
+        self.status_written = 0
+
+    async def flush_status(self):
+        while self.status_dirty:
+            delay = self.status_written + Anarchy.runner_status_interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.status_dirty = False
+            try:
+                await self.write_status()
+            except Exception:
+                logging.exception(f"Failed to update status of {self}")
+            self.status_written = time.monotonic()
+
     async def update_status(self):
+        """
+        Mark status as changed, written at most once per RUNNER_STATUS_INTERVAL.
+        """
         if Anarchy.running_all_in_one:
             return
+        self.status_dirty = True
+        if not self.status_flush_task or self.status_flush_task.done():
+            self.status_flush_task = asyncio.create_task(self.flush_status())
+
+    async def write_status(self):
+        """
+        Write pending runs and pods for this runner where changed.
+        """
         pods_status = []
         for pod in anarchyrunnerpod.AnarchyRunnerPod.cache.values():
-            run = anarchyrun.AnarchyRun.get_run_assigned_to_runner_pod(pod)
-            pods_status.append({
+            if pod.runner_name != self.name:
+                continue
+            pod_status = {
                 "consecutiveFailureCount": pod.consecutive_failure_count,
                 "name": pod.name,
-                "run": run.as_reference() if run else None,
                 "runCount": pod.run_count,
-            })
-        await self.merge_patch_status({
+            }
+            runs = anarchyrun.AnarchyRun.get_runs_assigned_to_runner_pod(pod)
+            if runs:
+                pod_status['run'] = runs[0].as_reference()
+            if len(runs) > 1:
+                pod_status['runs'] = [run.as_reference() for run in runs]
+            pods_status.append(pod_status)
+        status = {
             "pendingRuns": [
                 {
                     "name": name,
-                } for name in anarchyrun.AnarchyRun.pending_run_names
+                } for name in anarchyrun.AnarchyRun.pending_runs.names(self.name)
             ],
             "pods": pods_status,
-        })
+        }
+        patch = {key: value for key, value in status.items() if self.status.get(key) != value}
+        if not patch:
+            return
+        with RateLimiter.priority(RateLimiter.housekeeping):
+            await self.merge_patch_status(patch)
@@ -1,4 +1,3 @@
-import kubernetes_asyncio
 import logging
 import os
 import re
@@ -7,15 +6,18 @@ from asgi_tools import ResponseError
 
 from anarchy import Anarchy
 from anarchywatchobject import AnarchyWatchObject
+from runner_pod import RunnerPod
 
 import anarchyrunner
 
-class AnarchyRunnerPod(AnarchyWatchObject):
+class AnarchyRunnerPod(RunnerPod, AnarchyWatchObject):
     api_version = 'v1'
     cache = {}
     kind = 'Pod'
     plural = 'pods'
     preload = True
+    # Watch pods as dicts rather than V1Pod models
+    watch_return_type = 'object'
 
     @classmethod
     def get_from_request(cls, request):
@@ -61,42 +63,41 @@ class AnarchyRunnerPod(AnarchyWatchObject):
 
     @classmethod
     async def on_startup_running_all_in_one(cls):
-        all_in_one = cls(
-            kubernetes_asyncio.client.V1Pod(
-                api_version = "v1",
-                kind = "Pod",
-                metadata = kubernetes_asyncio.client.V1ObjectMeta(
-                    labels = {
-                        Anarchy.runner_label: "default",
-                    },
-                    name = os.environ['HOSTNAME'],
-                    namespace = Anarchy.namespace,
-                    resource_version = 0,
-                    uid = "00000000-0000-0000-0000-000000000000",
-                ),
-                spec = kubernetes_asyncio.client.V1PodSpec(
-                    containers = [
-                        kubernetes_asyncio.client.V1Container(
-                            env = [
-                                kubernetes_asyncio.client.V1EnvVar(
-                                    name = "RUNNER_NAME",
-                                    value = "default",
-                                ),
-                                kubernetes_asyncio.client.V1EnvVar(
-                                    name = "RUNNER_TOKEN",
-                                    value = os.environ['RUNNER_TOKEN'],
-                                ),
-                            ],
-                            name = "runner",
-                        )
-                    ]
-                ),
-                status = kubernetes_asyncio.client.V1PodStatus()
-            )
-        )
+        all_in_one = cls({
+            "apiVersion": "v1",
+            "kind": "Pod",
+            "metadata": {
+                "labels": {
+                    Anarchy.runner_label: "default",
+                },
+                "name": os.environ['HOSTNAME'],
+                "namespace": Anarchy.namespace,
+                "resourceVersion": "0",
+                "uid": "00000000-0000-0000-0000-000000000000",
+            },
+            "spec": {
+                "containers": [{
+                    "env": [{
+                        "name": "RUNNER_NAME",
+                        "value": "default",
+                    }, {
+                        "name": "RUNNER_TOKEN",
+                        "value": os.environ['RUNNER_TOKEN'],
+                    }],
+                    "name": "runner",
+                }],
+            },
+            "status": {},
+        })
         await cls.cache_put(all_in_one)
         logging.info(f"Cache preloaded {all_in_one}")
 
+    @classmethod
+    async def preload_cache(cls):
+        for anarchy_runner_pod in await cls.list(label_selector=Anarchy.runner_label):
+            await anarchy_runner_pod.cache_put()
+            logging.info(f"Preloaded cache {anarchy_runner_pod}")
+
     def __init__(self, definition):
         super().__init__(definition)
         self.consecutive_failure_count = 0
@@ -104,63 +105,3 @@ class AnarchyRunnerPod(AnarchyWatchObject):
 
     def __str__(self):
         return f"AnarchyRunnerPod {self.name} [{self.pod_ip}]"
-
-    @property
-    def is_deleting(self):
-        return True if self.metadata.deletion_timestamp else False
-
-    @property
-    def is_marked_for_termination(self):
-        return Anarchy.runner_terminating_label in self.labels
-
-    @property
-    def labels(self):
-        return self.metadata.labels
-
-    @property
-    def metadata(self):
-        return self.definition.metadata
-
-    @property
-    def name(self):
-        return self.metadata.name
-
-    @property
-    def namespace(self):
-        return self.metadata.namespace
-
-    @property
-    def pod_ip(self):
-        self.status.pod_ip
-
-    @property
-    def resource_version(self):
-        return self.metadata.resource_version
-
-    @property
-    def runner_name(self):
-        return self.metadata.labels.get(Anarchy.runner_label)
-
-    @property
-    def runner_token(self):
-        for env_var in self.spec.containers[0].env:
-            if env_var.name == 'RUNNER_TOKEN':
-                return env_var.value
-
-    @property
-    def spec(self):
-        return self.definition.spec
-
-    @property
-    def status(self):
-        return self.definition.status
-
-    @property
-    def uid(self):
-        return self.metadata.uid
-
-    async def delete(self):
-        await Anarchy.core_v1_api.delete_namespaced_pod(
-            name = self.name,
-            namespace = self.namespace,
-        )
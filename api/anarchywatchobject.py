@@ -9,6 +9,7 @@ from anarchyobject import AnarchyObject
 class AnarchyWatchObject(AnarchyObject):
     label_selector = None
     preload = False
+    watch_return_type = None
 
     @classmethod
     def cache_remove(cls, name):
@@ -63,7 +64,9 @@ class AnarchyWatchObject(AnarchyObject):
         obj = cls.cache.get(name)
         if obj:
             return obj
-        await cls.fetch(name)
+        obj = await cls.fetch(name)
+        await obj.cache_put()
+        return obj
 
     @classmethod
     async def on_shutdown(cls):
@@ -98,7 +101,7 @@ class AnarchyWatchObject(AnarchyObject):
 
     @classmethod
     async def watch(cls):
-        watch = kubernetes_asyncio.watch.Watch()
+        watch = kubernetes_asyncio.watch.Watch(return_type=cls.watch_return_type)
         async for event in watch.stream(cls.watch_method(), **cls.watch_method_kwargs()):
             event_object = event['object']
             event_type = event['type']
@@ -1,8 +1,9 @@
 import kubernetes_asyncio
 import logging
+import prometheus_client
 import re
 
-from asgi_tools import App, ResponseError
+from asgi_tools import App, ResponseError, ResponseText
 from datetime import datetime, timezone
 
 from anarchy import Anarchy
@@ -12,12 +13,16 @@ from anarchyrun import AnarchyRun
 from anarchyrunner import AnarchyRunner
 from anarchyrunnerpod import AnarchyRunnerPod
 from anarchysubject import AnarchySubject
+from blob_store import BlobNotFoundError, BlobStore
+from rate_limiter import RateLimiter
 
 app = App()
 
 @app.on_startup
 async def on_startup():
     await Anarchy.on_startup()
+    await RateLimiter.on_startup()
+    await BlobStore.on_startup()
     await AnarchyGovernor.on_startup()
     await AnarchyRunner.on_startup()
     await AnarchyRunnerPod.on_startup()
@@ -33,6 +38,8 @@ async def on_shutdown():
     await AnarchyRunnerPod.on_shutdown()
     await AnarchyRunner.on_shutdown()
     await AnarchyGovernor.on_shutdown()
+    await BlobStore.on_shutdown()
+    await RateLimiter.on_shutdown()
     await Anarchy.on_shutdown()
 
 @app.route('/action/{anarchy_action_name}', methods=['POST'])
@@ -83,9 +90,20 @@ async def handle_action_callback(request):
 
 @app.route('/run', methods=['GET'])
 async def get_run(request):
+    """
+    Get AnarchyRun for runner pod. With wait parameter, wait up to that many
+    seconds for a run rather than returning nothing immediately.
+    """
     anarchy_runner, anarchy_runner_pod = AnarchyRunnerPod.get_from_request(request)
 
-    await AnarchyRun.handle_any_lost_runs(anarchy_runner_pod)
+    try:
+        wait = min(max(float(request.query.get('wait', 0)), 0), Anarchy.run_wait_max)
+    except ValueError:
+        raise ResponseError.BAD_REQUEST("Invalid wait parameter")
+
+    # Runner pods with concurrent runs list runs still in progress
+    running = request.query.get('running')
+    await AnarchyRun.handle_any_lost_runs(anarchy_runner_pod, running.split(',') if running else ())
 
     if anarchy_runner_pod.is_deleting:
         logging.info(f"Not giving AnarchyRun to {anarchy_runner_pod} because it is being deleted")
@@ -95,7 +113,7 @@ async def get_run(request):
         await anarchy_runner_pod.delete()
         return None
 
-    anarchy_run = await AnarchyRun.get_run_for_runner_pod(anarchy_runner, anarchy_runner_pod)
+    anarchy_run = await AnarchyRun.wait_for_run_for_runner_pod(anarchy_runner, anarchy_runner_pod, wait)
     if not anarchy_run:
         return None
 
@@ -128,7 +146,15 @@ async def get_run(request):
         'run': await anarchy_run.export(),
     }
 
+@app.route('/metrics', methods=['GET'])
+async def get_metrics(request):
+    return ResponseText(
+        prometheus_client.generate_latest(),
+        content_type = prometheus_client.CONTENT_TYPE_LATEST,
+    )
+
 @app.route('/run/{anarchy_run_name}', methods=['POST'])
+@RateLimiter.prioritized(RateLimiter.critical)
 async def post_run(request):
     """
     Receive result from AnarchyRun
@@ -165,6 +191,31 @@ async def post_run(request):
 
     return {"success": True}
 
+@app.route('/run/{anarchy_run_name}/result', methods=['GET'])
+async def get_run_result(request):
+    """
+    Get AnarchyRun result including ansibleRun kept in the result blob store
+    """
+    anarchy_runner, anarchy_runner_pod = AnarchyRunnerPod.get_from_request(request)
+    anarchy_run_name = request.path_params['anarchy_run_name']
+    try:
+        anarchy_run = await AnarchyRun.get(anarchy_run_name)
+    except kubernetes_asyncio.client.rest.ApiException as e:
+        if e.status == 404:
+            raise ResponseError.NOT_FOUND(f"AnarchyRun {anarchy_run_name} not found.")
+        raise
+
+    if anarchy_run.runner_name != anarchy_runner.name:
+        logging.info(
+            f"{anarchy_run} has runner {anarchy_run.runner_name} but result requested by {anarchy_runner_pod}"
+        )
+        raise ResponseError.BAD_REQUEST("Runner mismatch")
+
+    try:
+        return await anarchy_run.get_result()
+    except BlobNotFoundError as e:
+        raise ResponseError.NOT_FOUND(f"AnarchyRun {anarchy_run_name} ansibleRun unavailable: {e}")
+
 @app.route('/run/subject/{anarchy_subject_name}', methods=['PATCH'])
 async def patch_subject(request):
     """
@@ -172,18 +223,12 @@ async def patch_subject(request):
     """
     anarchy_runner, anarchy_runner_pod = AnarchyRunnerPod.get_from_request(request)
     anarchy_subject_name = request.path_params['anarchy_subject_name']
-    anarchy_run = AnarchyRun.get_run_assigned_to_runner_pod(anarchy_runner_pod)
+    anarchy_run = AnarchyRun.get_run_assigned_to_runner_pod(anarchy_runner_pod, anarchy_subject_name)
 
     if not anarchy_run:
-        logging.info(
-            f"{anarchy_runner_pod} attempted to patch {anarchy_subject_name} when no "
-            f"when no run should be running on this pod"
-        )
-        raise ResponseError.BAD_REQUEST("AnarchySubject {anarchy_subject_name} not assigned to runner")
-    elif anarchy_run.subject_name != anarchy_subject_name:
         logging.info(
             f"{anarchy_runner_pod} attempted to patch {anarchy_subject_name} "
-            f"when it is running {anarchy_run} for AnarchySubject {anarchy_run.subject_name}"
+            f"when no run for it should be running on this pod"
         )
         raise ResponseError.BAD_REQUEST(f"AnarchySubject {anarchy_subject_name} not assigned to runner")
 
@@ -205,18 +250,12 @@ async def run_subject_action_post(request):
     """
     anarchy_runner, anarchy_runner_pod = AnarchyRunnerPod.get_from_request(request)
     anarchy_subject_name = request.path_params['anarchy_subject_name']
-    anarchy_run = AnarchyRun.get_run_assigned_to_runner_pod(anarchy_runner_pod)
+    anarchy_run = AnarchyRun.get_run_assigned_to_runner_pod(anarchy_runner_pod, anarchy_subject_name)
 
     if not anarchy_run:
         logging.info(
             f"{anarchy_runner_pod} attempted to create run for {anarchy_subject_name} "
-            f"when no run should be running on this pod"
-        )
-        raise ResponseError.BAD_REQUEST("AnarchySubject {anarchy_subject_name} not assigned to runner")
-    elif anarchy_run.subject_name != anarchy_subject_name:
-        logging.info(
-            f"{anarchy_runner_pod} attempted to create run for {anarchy_subject_name} "
-            f"when it is running {anarchy_run} for AnarchySubject {anarchy_run.subject_name}"
+            f"when no run for it should be running on this pod"
         )
         raise ResponseError.BAD_REQUEST(f"AnarchySubject {anarchy_subject_name} not assigned to runner")
 
@@ -0,0 +1,145 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+
+from copy import deepcopy
+
+from anarchy import Anarchy
+
+class BlobNotFoundError(Exception):
+    pass
+
+class BlobStore:
+    """
+    Storage for AnarchyRun output that is too large to keep in AnarchyRun
+    status. Backends register by name and are selected with RESULT_BLOB_STORE.
+    """
+    backends = {}
+    store = None
+
+    @classmethod
+    def register(cls, name):
+        def decorator(backend):
+            backend.name = name
+            cls.backends[name] = backend
+            return backend
+        return decorator
+
+    @classmethod
+    async def load_result(cls, result):
+        """
+        Return copy of AnarchyRun result with offloaded ansibleRun restored.
+        """
+        result = deepcopy(result)
+        ref = result.pop('ansibleRunRef', None)
+        if not ref:
+            return result
+        if not cls.store or cls.store.name != ref.get('store'):
+            raise BlobNotFoundError(f"Blob store {ref.get('store')} is not configured")
+        try:
+            result['ansibleRun'] = await cls.store.get(ref['key'])
+        except FileNotFoundError:
+            raise BlobNotFoundError(f"Blob {ref['key']} not found")
+        result.pop('ansibleRunSummary', None)
+        return result
+
+    @classmethod
+    async def offload_result(cls, key, result):
+        """
+        Move ansibleRun out of AnarchyRun result into the blob store when too
+        large to keep in status, leaving a reference and summary.
+        """
+        ansible_run = result.get('ansibleRun')
+        if not ansible_run or not cls.store:
+            return result
+        if len(json.dumps(ansible_run)) <= Anarchy.result_inline_max_bytes:
+            return result
+
+        try:
+            await cls.store.put(key, ansible_run)
+        except Exception:
+            logging.exception(f"Failed to store ansibleRun as {key}, keeping in status")
+            return result
+
+        result = {k: v for k, v in result.items() if k != 'ansibleRun'}
+        result['ansibleRunRef'] = {
+            "key": key,
+            "store": cls.store.name,
+        }
+        result['ansibleRunSummary'] = {
+            "plays": len(ansible_run.get('plays', [])),
+            "stats": ansible_run.get('stats', {}),
+            "tasks": sum(len(play.get('tasks', [])) for play in ansible_run.get('plays', [])),
+        }
+        return result
+
+    @classmethod
+    async def on_shutdown(cls):
+        cls.store = None
+
+    @classmethod
+    async def on_startup(cls):
+        if not Anarchy.result_blob_store:
+            logging.info("Result blob store disabled, AnarchyRun results are kept in status")
+            return
+        backend = cls.backends.get(Anarchy.result_blob_store)
+        if not backend:
+            raise Exception(f"Unknown RESULT_BLOB_STORE {Anarchy.result_blob_store}")
+        cls.store = backend()
+        logging.info(f"Using {cls.store} for AnarchyRun results")
+
+    async def delete(self, key):
+        raise NotImplementedError()
+
+    async def get(self, key):
+        raise NotImplementedError()
+
+    async def put(self, key, value):
+        raise NotImplementedError()
+
+@BlobStore.register('filesystem')
+class FilesystemBlobStore(BlobStore):
+    """
+    Store blobs as gzipped JSON files under RESULT_BLOB_STORE_PATH, which
+    should be a persistent volume shared by all API replicas.
+    """
+    def __init__(self, path=None):
+        self.path = path or Anarchy.result_blob_store_path
+
+    def __str__(self):
+        return f"filesystem blob store {self.path}"
+
+    def blob_path(self, key):
+        path = os.path.normpath(os.path.join(self.path, key))
+        if not path.startswith(os.path.join(self.path, '')):
+            raise ValueError(f"Invalid blob key {key}")
+        return path
+
+    async def delete(self, key):
+        await asyncio.get_running_loop().run_in_executor(None, self.delete_blob, key)
+
+    async def get(self, key):
+        return await asyncio.get_running_loop().run_in_executor(None, self.read_blob, key)
+
+    async def put(self, key, value):
+        await asyncio.get_running_loop().run_in_executor(None, self.write_blob, key, value)
+
+    def delete_blob(self, key):
+        try:
+            os.unlink(self.blob_path(key))
+        except FileNotFoundError:
+            pass
+
+    def read_blob(self, key):
+        with gzip.open(self.blob_path(key), 'rt') as f:
+            return json.load(f)
+
+    def write_blob(self, key, value):
+        path = self.blob_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so that readers never see a partial blob
+        with gzip.open(f"{path}.tmp", 'wt') as f:
+            json.dump(value, f)
+        os.replace(f"{path}.tmp", path)
@@ -0,0 +1,70 @@
+import itertools
+
+from collections import deque
+
+class RunQueue:
+    """
+    FIFO of pending AnarchyRun names for each AnarchyRunner.
+
+    Names are indexed to the runner and sequence number of their queue entry.
+    Removal only drops the name from the index and stale entries are skipped
+    when dequeued, so enqueue, dequeue and removal are all O(1).
+    """
+    def __init__(self):
+        self.counts = {}
+        self.index = {}
+        self.queues = {}
+        self.sequence = itertools.count()
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def compact(self, runner_name):
+        queue = self.queues[runner_name]
+        self.queues[runner_name] = deque(
+            entry for entry in queue if self.index.get(entry[0]) == (runner_name, entry[1])
+        )
+
+    def count(self, runner_name):
+        return self.counts.get(runner_name, 0)
+
+    def dequeue(self, runner_name):
+        queue = self.queues.get(runner_name)
+        while queue:
+            name, sequence = queue.popleft()
+            if self.index.get(name) == (runner_name, sequence):
+                self.discard(name)
+                return name
+
+    def discard(self, name):
+        entry = self.index.pop(name, None)
+        if not entry:
+            return
+        runner_name = entry[0]
+        self.counts[runner_name] -= 1
+        # Keep queue from growing with stale entries when not dequeued
+        if len(self.queues[runner_name]) > 2 * self.counts[runner_name] + 100:
+            self.compact(runner_name)
+
+    def enqueue(self, runner_name, name):
+        entry = self.index.get(name)
+        if entry:
+            if entry[0] == runner_name:
+                return
+            self.discard(name)
+        sequence = next(self.sequence)
+        self.index[name] = (runner_name, sequence)
+        self.counts[runner_name] = self.count(runner_name) + 1
+        self.queues.setdefault(runner_name, deque()).append((name, sequence))
+
+    def names(self, runner_name):
+        """
+        Pending run names for runner in queue order.
+        """
+        return [
+            name for name, sequence in self.queues.get(runner_name, [])
+            if self.index.get(name) == (runner_name, sequence)
+        ]
@@ -0,0 +1,133 @@
+import json
+import kubernetes_asyncio
+
+from anarchy import Anarchy
+
+class RunnerPod:
+    """
+    Runner Pod as the dict returned by the Kubernetes API.
+
+    Pods are requested with _preload_content=False and parsed once rather
+    than deserialized into V1Pod models and converted back to dicts.
+    """
+    @classmethod
+    async def create(cls, definition):
+        response = await Anarchy.core_v1_api.create_namespaced_pod(
+            Anarchy.namespace, definition, _preload_content=False
+        )
+        return cls(await cls.read_response(response))
+
+    @classmethod
+    async def list(cls, label_selector):
+        pods = []
+        _continue = None
+        while True:
+            response = await Anarchy.core_v1_api.list_namespaced_pod(
+                Anarchy.namespace,
+                label_selector = label_selector,
+                limit = 50,
+                _continue = _continue,
+                _preload_content = False,
+            )
+            pod_list = await cls.read_response(response)
+            pods.extend(cls(definition) for definition in pod_list['items'])
+            _continue = pod_list['metadata'].get('continue')
+            if not _continue:
+                return pods
+
+    @classmethod
+    async def read_response(cls, response):
+        """
+        Parse response body, raising ApiException for error status as when
+        content is preloaded.
+        """
+        data = await response.read()
+        if not 200 <= response.status <= 299:
+            raise kubernetes_asyncio.client.rest.ApiException(
+                http_resp = kubernetes_asyncio.client.rest.RESTResponse(response, data)
+            )
+        return json.loads(data)
+
+    def __init__(self, definition):
+        self.definition = definition
+
+    def __str__(self):
+        return f"Pod {self.name}"
+
+    @property
+    def annotations(self):
+        return self.metadata.get('annotations', {})
+
+    @property
+    def is_deleting(self):
+        return 'deletionTimestamp' in self.metadata
+
+    @property
+    def is_marked_for_termination(self):
+        return Anarchy.runner_terminating_label in self.labels
+
+    @property
+    def is_running(self):
+        return self.status.get('phase') == 'Running'
+
+    @property
+    def labels(self):
+        return self.metadata.get('labels', {})
+
+    @property
+    def metadata(self):
+        return self.definition['metadata']
+
+    @property
+    def name(self):
+        return self.metadata['name']
+
+    @property
+    def namespace(self):
+        return self.metadata['namespace']
+
+    @property
+    def pod_ip(self):
+        return self.status.get('podIP')
+
+    @property
+    def resource_version(self):
+        return self.metadata['resourceVersion']
+
+    @property
+    def runner_name(self):
+        return self.labels.get(Anarchy.runner_label)
+
+    @property
+    def runner_token(self):
+        for env_var in self.spec['containers'][0].get('env', []):
+            if env_var['name'] == 'RUNNER_TOKEN':
+                return env_var.get('value')
+
+    @property
+    def spec(self):
+        return self.definition['spec']
+
+    @property
+    def status(self):
+        return self.definition.get('status', {})
+
+    @property
+    def uid(self):
+        return self.metadata['uid']
+
+    async def delete(self):
+        response = await Anarchy.core_v1_api.delete_namespaced_pod(
+            name = self.name,
+            namespace = self.namespace,
+            _preload_content = False,
+        )
+        await self.read_response(response)
+
+    async def merge_patch(self, patch):
+        response = await Anarchy.core_v1_api.patch_namespaced_pod(
+            self.name, self.namespace, patch,
+            _content_type = 'application/merge-patch+json',
+            _preload_content = False,
+        )
+        self.definition = await self.read_response(response)
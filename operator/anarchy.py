@@ -6,10 +6,21 @@ import os
 
 class Anarchy():
     action_check_interval = int(os.environ.get('ACTION_CHECK_INTERVAL', 3))
+    cache_max_bytes = int(os.environ.get('CACHE_MAX_BYTES', 100 * 1024 * 1024))
+    cache_max_objects = int(os.environ.get('CACHE_MAX_OBJECTS', 0))
+    cleanup_batch_size = int(os.environ.get('CLEANUP_BATCH_SIZE', 20))
     cleanup_interval = int(os.environ.get('CLEANUP_INTERVAL', 60))
     domain = os.environ.get('ANARCHY_DOMAIN', 'anarchy.gpte.redhat.com')
-    run_check_interval = int(os.environ.get('RUN_CHECK_INTERVAL', 3))
+    kube_write_burst = int(os.environ.get('KUBE_WRITE_BURST', 100))
+    kube_write_rate = float(os.environ.get('KUBE_WRITE_RATE', 50))
+    metrics_port = int(os.environ.get('METRICS_PORT', 8000))
+    missing_cache_ttl = int(os.environ.get('MISSING_CACHE_TTL', 10))
+    resume_rate = float(os.environ.get('RESUME_RATE', 20))
+    runner_autoscale_window = int(os.environ.get('RUNNER_AUTOSCALE_WINDOW', 600))
+    runner_pod_audit_interval = int(os.environ.get('RUNNER_POD_AUDIT_INTERVAL', 600))
     running_all_in_one = 'true' == os.environ.get('ANARCHY_RUNNING_ALL_IN_ONE', '')
+    shard_lease_duration = int(os.environ.get('SHARD_LEASE_DURATION', 30))
+    sharding_enabled = 'true' == os.environ.get('ANARCHY_SHARDING', '')
     version = os.environ.get('ANARCHY_VERSION', 'v1')
 
     api_version = f"{domain}/{version}"
@@ -20,6 +31,7 @@ class Anarchy():
     finished_label = f"{domain}/finished"
     governor_label = f"{domain}/governor"
     ignore_label = f"{domain}/ignore"
+    pod_template_hash_annotation = f"{domain}/pod-template-sha256"
     runner_label = f"{domain}/runner"
     runner_terminating_label = f"{domain}/runner-terminating"
     spec_sha256_annotation = f"{domain}/spec-sha256"
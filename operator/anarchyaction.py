@@ -6,17 +6,95 @@ from datetime import datetime, timezone
 
 from anarchy import Anarchy
 from anarchycachedkopfobject import AnarchyCachedKopfObject
+from indexed_cache import IndexedCache
+from metrics import Metrics
 from random_string import random_string
+from scheduler import Scheduler
+from sharding import Sharding
 
 import anarchygovernor
 import anarchyrun
 import anarchysubject
 
 class AnarchyAction(AnarchyCachedKopfObject):
-    cache = {}
+    cache = IndexedCache(
+        evictable = lambda anarchy_action: anarchy_action.is_finished,
+        indexes = {
+            "governor": lambda anarchy_action: anarchy_action.governor_name,
+            "subject": lambda anarchy_action: anarchy_action.spec.get('subjectRef', {}).get('name'),
+        },
+        max_bytes = Anarchy.cache_max_bytes,
+        max_objects = Anarchy.cache_max_objects,
+        sizeof = lambda anarchy_action: anarchy_action.definition_size,
+    )
     kind = 'AnarchyAction'
+    missing = {}
     plural = 'anarchyactions'
 
+    @classmethod
+    def handle_watch_event(cls, event_type, definition):
+        anarchy_action = super().handle_watch_event(event_type, definition)
+        if anarchy_action and Sharding.enabled \
+        and Sharding.owns(anarchy_action.subject_name):
+            # Lifecycle handlers only run on one replica when sharded
+            anarchy_action.schedule_manage()
+        return anarchy_action
+
+    @classmethod
+    @Metrics.timed_handler(kind, 'manage')
+    async def manage_scheduled(cls, name):
+        """
+        Called by scheduler when AnarchyAction is due to be managed.
+        """
+        with cls.cache.pinned(name):
+            try:
+                anarchy_action = await cls.get(name)
+            except kubernetes_asyncio.client.rest.ApiException as e:
+                if e.status == 404:
+                    return
+                raise
+            if anarchy_action.ignore \
+            or not Sharding.owns(anarchy_action.subject_name):
+                return
+            anarchy_subject = await anarchy_action.get_subject()
+            if not anarchy_subject:
+                await anarchy_action.raise_error_if_still_exists(
+                    f"{anarchy_action} references missing AnarchySubject {anarchy_action.subject_name}"
+                )
+                return
+            await anarchy_subject.refresh()
+            if anarchy_subject.ignore:
+                raise kopf.TemporaryError(
+                    f"Refusing to handle {anarchy_action} when {anarchy_subject} is marked with ignore",
+                    delay=30
+                )
+            return await anarchy_action.manage(anarchy_subject)
+
+    @classmethod
+    async def on_cleanup(cls):
+        await super().on_cleanup()
+        await cls.scheduler.stop()
+
+    @classmethod
+    async def on_startup(cls):
+        cls.scheduler = Scheduler(name=cls.kind, callback=cls.manage_scheduled)
+        Metrics.register_scheduler(cls.scheduler)
+        Sharding.on_rebalance(cls.rebalance)
+        await super().on_startup()
+        await cls.scheduler.start()
+
+    @classmethod
+    def rebalance(cls):
+        for anarchy_action in list(cls.cache.values()):
+            if Sharding.owns(anarchy_action.subject_name):
+                anarchy_action.schedule_manage()
+            else:
+                cls.scheduler.cancel(anarchy_action.name)
+
+    @classmethod
+    def schedule_manage_by_name(cls, name, delay=0):
+        cls.scheduler.schedule(name, delay)
+
     @property
     def action(self):
         return self.spec['action']
@@ -114,15 +192,17 @@ class AnarchyAction(AnarchyCachedKopfObject):
         """
         anarchy_subject = await self.get_subject()
         anarchy_governor = anarchy_subject.get_governor()
-        await anarchy_subject.check_set_active_action(self)
-        if anarchy_subject.active_action_name != self.name:
-            return
-        if not anarchy_governor.has_action(self.action):
-            raise kopf.TemporaryError(
-                f"{self} cannot run {anarchy_governor} does not support action {self.action}",
-                delay = 60,
-            )
-        anarchy_run = await self.create_anarchy_run()
+        # Locked so that only one action becomes active and starts a run
+        async with anarchy_subject.locked():
+            await anarchy_subject.check_set_active_action(self)
+            if anarchy_subject.active_action_name != self.name:
+                return
+            if not anarchy_governor.has_action(self.action):
+                raise kopf.TemporaryError(
+                    f"{self} cannot run {anarchy_governor} does not support action {self.action}",
+                    delay = 60,
+                )
+            anarchy_run = await self.create_anarchy_run()
         logging.info(f"Created {anarchy_run.runner_state} {anarchy_run} to start {self}")
 
     async def create_anarchy_run(self):
@@ -205,6 +285,12 @@ class AnarchyAction(AnarchyCachedKopfObject):
             await anarchy_subject.add_action_to_status(self)
 
     async def initialize(self, anarchy_subject):
+        patch = self.initialize_patch(anarchy_subject)
+        if patch:
+            logging.info("Set references for {self}")
+            await self.json_patch(patch)
+
+    def initialize_patch(self, anarchy_subject):
         anarchy_governor = anarchy_subject.get_governor()
         patch = []
         governor_reference = anarchy_governor.as_reference()
@@ -266,13 +352,14 @@ class AnarchyAction(AnarchyCachedKopfObject):
                 "path": "/spec/callbackToken",
                 "value": random_string(32),
             })
-        if patch:
-            logging.info("Set references for {self}")
-            await self.json_patch(patch)
+        return patch
 
     async def manage(self, anarchy_subject):
         """
-        Called by daemon loop to periodically manage this action.
+        Called by scheduler to manage this action.
+
+        Returns seconds until the action should be managed again or None if
+        only a change to the action should cause it to be managed again.
         """
         if self.is_finished:
             return await self.manage_finished(anarchy_subject)
@@ -282,28 +369,43 @@ class AnarchyAction(AnarchyCachedKopfObject):
         await anarchy_subject.add_action_to_status(self)
 
         if self.state in ('run pending', 'running'):
-            pass
+            # AnarchyRun state changes update the action and reschedule it
+            return None
         elif self.is_labeled_for_cancelation:
             await self.finish('canceled')
+            return 0
         elif self.is_started:
-            pass
-        else:
-            seconds_to_start = (
-                self.after_datetime - datetime.now(timezone.utc)
-            ).total_seconds()
-            if seconds_to_start <= 0:
-                await self.check_start()
-                return 1
-            if seconds_to_start < Anarchy.action_check_interval:
-                return seconds_to_start
+            return None
+
+        seconds_to_start = (
+            self.after_datetime - datetime.now(timezone.utc)
+        ).total_seconds()
+        if seconds_to_start > 0:
+            return seconds_to_start
+
+        await self.check_start()
+        if self.is_started:
+            return None
 
+        # Waiting for another action to complete on the subject.
+        # Removal of the active action from the subject will also wake this action.
         return Anarchy.action_check_interval
 
     async def manage_finished(self, anarchy_subject):
         await anarchy_subject.remove_action_from_status(self)
-        if self.cleanup_after_datetime <= datetime.now(timezone.utc):
-            await self.delete()
-        return Anarchy.action_check_interval
+        if Anarchy.finished_label in self.labels:
+            # Deleted by garbage collector
+            return
+        seconds_to_cleanup = (
+            self.cleanup_after_datetime - datetime.now(timezone.utc)
+        ).total_seconds()
+        if seconds_to_cleanup > 0:
+            return seconds_to_cleanup
+        await self.delete()
+
+    def remove_from_cache(self):
+        super().remove_from_cache()
+        self.scheduler.cancel(self.name)
 
     async def reschedule(self, after=None, vars={}):
         patch = [{
@@ -330,6 +432,19 @@ class AnarchyAction(AnarchyCachedKopfObject):
             "value": {**self.vars, **vars}
         }])
 
+    def resume_required(self, anarchy_subject):
+        """
+        Check cached state for changes that resume handling would make.
+        """
+        if self.initialize_patch(anarchy_subject):
+            return True
+        if self.is_finished:
+            return anarchy_subject.has_action_in_status(self)
+        return not anarchy_subject.has_action_in_status(self)
+
+    def schedule_manage(self, delay=0):
+        self.scheduler.schedule(self.name, delay)
+
     async def set_state(self, state):
         await self.json_patch_status([{
             "op": "add",
@@ -1,16 +1,63 @@
+import asyncio
+import json
+import kubernetes_asyncio
+import logging
+import time
+
 from anarchy import Anarchy
 from anarchykopfobject import AnarchyKopfObject
+from metrics import Metrics
 
 class AnarchyCachedKopfObject(AnarchyKopfObject):
+    watch_resource_version = None
+    watch_task = None
+
+    @classmethod
+    def cache_missing(cls, name):
+        cls.missing[name] = time.monotonic() + Anarchy.missing_cache_ttl
+
+    @classmethod
+    def is_cached_missing(cls, name):
+        expires = cls.missing.get(name)
+        if expires is None:
+            return False
+        if expires < time.monotonic():
+            del cls.missing[name]
+            return False
+        return True
+
     @classmethod
     async def get(cls, name):
         obj = cls.cache.get(name)
         if obj:
+            cls.cache.touch(name)
+            Metrics.cache_hits.labels(cls.kind).inc()
             return obj
-        obj = await cls.fetch(name)
-        if not obj.ignore:
-            cls.cache[name] = obj
-        return obj
+        Metrics.cache_misses.labels(cls.kind).inc()
+        if cls.is_cached_missing(name):
+            raise kubernetes_asyncio.client.rest.ApiException(status=404, reason="Not Found")
+        try:
+            definition = await cls.fetch_definition(name)
+        except kubernetes_asyncio.client.rest.ApiException as e:
+            if e.status == 404:
+                cls.cache_missing(name)
+            raise
+        return cls.load_definition(definition)
+
+    @classmethod
+    def handle_watch_event(cls, event_type, definition):
+        """
+        Update cache from watch event, returns cached object unless deleted.
+        """
+        name = definition['metadata']['name']
+        if event_type == 'DELETED':
+            obj = cls.cache.get(name)
+            if obj:
+                obj.remove_from_cache()
+            cls.cache_missing(name)
+            return None
+        cls.missing.pop(name, None)
+        return cls.load_definition(definition)
 
     @classmethod
     def load(cls, definition=None, **kwargs):
@@ -24,7 +71,8 @@ class AnarchyCachedKopfObject(AnarchyKopfObject):
         name = metadata['name']
         obj = cls.cache.get(name)
         if obj:
-            obj.update_from_definition(definition)
+            if not obj.is_newer_than(metadata):
+                obj.update_from_definition(definition)
         else:
             obj = cls.from_definition(definition)
             cls.cache[name] = obj
@@ -34,11 +82,138 @@ class AnarchyCachedKopfObject(AnarchyKopfObject):
     def load_kopf_object(cls, name, **kwargs):
         obj = cls.cache.get(name)
         if obj:
-            obj.update(**kwargs)
+            if not obj.is_newer_than(kwargs['meta']):
+                obj.update(**kwargs)
         else:
             obj = cls(name=name, **kwargs)
             cls.cache[name] = obj
         return obj
 
+    @classmethod
+    async def on_cleanup(cls):
+        if cls.watch_task:
+            cls.watch_task.cancel()
+            await cls.watch_task
+
+    @classmethod
+    async def on_startup(cls):
+        Metrics.register_cache(cls.kind, cls.cache)
+        await cls.preload()
+        cls.watch_task = asyncio.create_task(cls.watch_loop())
+
+    @classmethod
+    async def preload(cls):
+        _continue = None
+        names = set()
+        while True:
+            object_list = await Anarchy.custom_objects_api.list_namespaced_custom_object(
+                group = Anarchy.domain,
+                namespace = Anarchy.namespace,
+                plural = cls.plural,
+                version = Anarchy.version,
+                limit = 50,
+                _continue = _continue,
+            )
+            for definition in object_list['items']:
+                names.add(definition['metadata']['name'])
+                cls.handle_watch_event('ADDED', definition)
+            _continue = object_list['metadata'].get('continue')
+            if not _continue:
+                break
+        # Remove objects deleted while not watching
+        for name in [name for name in cls.cache if name not in names]:
+            cls.handle_watch_event('DELETED', {"metadata": {"name": name}})
+        cls.watch_resource_version = object_list['metadata']['resourceVersion']
+        logging.info(f"Cache preloaded {len(cls.cache)} {cls.kind} objects")
+
+    @classmethod
+    async def watch(cls):
+        watch = kubernetes_asyncio.watch.Watch()
+        async for event in watch.stream(
+            Anarchy.custom_objects_api.list_namespaced_custom_object,
+            group = Anarchy.domain,
+            namespace = Anarchy.namespace,
+            plural = cls.plural,
+            resource_version = cls.watch_resource_version,
+            version = Anarchy.version,
+        ):
+            definition = event['raw_object']
+            cls.watch_resource_version = definition['metadata']['resourceVersion']
+            if event['type'] != 'BOOKMARK':
+                cls.handle_watch_event(event['type'], definition)
+
+    @classmethod
+    async def watch_loop(cls):
+        while True:
+            watch_start_time = time.monotonic()
+            try:
+                await cls.watch()
+            except asyncio.CancelledError:
+                logging.info(f"Watch {cls.kind} exiting")
+                return
+            except kubernetes_asyncio.client.rest.ApiException as e:
+                if e.status == 410:
+                    logging.info(f"Watch {cls.kind} expired, reloading cache")
+                    try:
+                        await cls.preload()
+                    except asyncio.CancelledError:
+                        return
+                    except Exception:
+                        logging.exception(f"Watch {cls.kind} failed to reload cache")
+                else:
+                    logging.exception(f"Watch {cls.kind} exception")
+            except Exception:
+                logging.exception(f"Watch {cls.kind} exception")
+
+            # If watch is repeatedly failing then backoff retry
+            watch_duration = time.monotonic() - watch_start_time
+            if watch_duration < 10:
+                try:
+                    await asyncio.sleep(10 - watch_duration)
+                except asyncio.CancelledError:
+                    return
+
+    @property
+    def definition_size(self):
+        """
+        Approximate memory used by object state for cache accounting.
+        """
+        return len(json.dumps(
+            {"metadata": self.metadata, "spec": self.spec, "status": self.status},
+            default=dict,
+        ))
+
+    def update(self, **kwargs):
+        super().update(**kwargs)
+        self.cache_updated()
+
+    def update_from_definition(self, definition):
+        super().update_from_definition(definition)
+        self.cache_updated()
+
+    def is_newer_than(self, metadata):
+        """
+        Check if cached state is newer than the given metadata so that stale
+        events do not overwrite the result of writes.
+        """
+        try:
+            return int(self.metadata['resourceVersion']) > int(metadata['resourceVersion'])
+        except (KeyError, TypeError, ValueError):
+            return False
+
+    async def refresh(self, force=False):
+        """
+        Refresh state from the API unless it is maintained from the watch.
+
+        Pass force when the cached state is known to be stale, such as after a
+        failed patch.
+        """
+        if force or not self.watch_task:
+            await super().refresh()
+
+    def cache_updated(self):
+        if self.cache.get(self.name) is self:
+            self.cache.updated(self.name)
+
     def remove_from_cache(self):
         self.cache.pop(self.name, None)
@@ -3,8 +3,10 @@ import logging
 import pytimeparse
 
 from datetime import timedelta
+from types import MappingProxyType
 
 from anarchy import Anarchy
+from metrics import Metrics
 
 class AnarchyGovernor:
     cache = {}
@@ -41,7 +43,8 @@ class AnarchyGovernor:
                 if anarchy_governor.resource_version == resource_version:
                     logging.debug(f"Already cached {anarchy_governor}")
                 else:
-                    anarchy_governor.definition = obj
+                    anarchy_governor = AnarchyGovernor(obj)
+                    cls.cache[name] = anarchy_governor
                     logging.info(f"Cache updated {anarchy_governor}")
             else:
                 anarchy_governor = AnarchyGovernor(obj)
@@ -51,6 +54,7 @@ class AnarchyGovernor:
 
     @classmethod
     async def preload(cls):
+        Metrics.register_cache(cls.kind, cls.cache)
         _continue = None
         while True:
             anarchy_governor_list = await Anarchy.custom_objects_api.list_namespaced_custom_object(
@@ -70,15 +74,40 @@ class AnarchyGovernor:
                 break
 
     def __init__(self, definition):
+        """
+        Compile derived configuration once. Cached governors are replaced
+        rather than updated when the resourceVersion changes.
+        """
         self.definition = definition
+        spec = definition['spec']
+        self.actions = MappingProxyType({
+            name: ActionConfig(name, action_definition)
+            for name, action_definition in spec.get('actions', {}).items()
+        })
+        self.subject_event_handlers = MappingProxyType(spec.get('subjectEventHandlers', {}))
+        self.has_create_handler = 'create' in self.subject_event_handlers
+        self.has_delete_handler = 'delete' in self.subject_event_handlers
+        self.has_update_handler = 'update' in self.subject_event_handlers
+        self.remove_finished_actions_after_seconds = self.parse_time_interval(
+            spec.get('removeFinishedActions', {}).get('after')
+        )
+        self.remove_finished_actions_after_timedelta = timedelta(seconds=self.remove_finished_actions_after_seconds)
+        self.remove_successful_runs_after_seconds = self.parse_time_interval(
+            spec.get('removeSuccessfulRuns', {}).get('after')
+        )
+        self.remove_successful_runs_after_timedelta = timedelta(seconds=self.remove_successful_runs_after_seconds)
+        # Shared by all subjects using this governor, must not be modified
+        self.supported_actions = MappingProxyType({
+            name: MappingProxyType({
+                field: action_definition[field]
+                for field in ('description', 'timeEstimate')
+                if action_definition.get(field)
+            }) for name, action_definition in spec.get('actions', {}).items()
+        })
 
     def __str__(self):
         return f"AnarchyGovernor {self.name} [{self.resource_version}]"
 
-    @property
-    def action_configs(self):
-        return self.spec.get('actions', {})
-
     @property
     def ansible_galaxy_requirements(self):
         return self.spec.get('ansibleGalaxyRequirements', [])
@@ -87,18 +116,6 @@ class AnarchyGovernor:
     def api_version(self):
         return self.definition['api_version']
 
-    @property
-    def has_create_handler(self):
-        return 'create' in self.subject_event_handlers
-
-    @property
-    def has_delete_handler(self):
-        return 'delete' in self.subject_event_handlers
-
-    @property
-    def has_update_handler(self):
-        return 'update' in self.subject_event_handlers
-
     @property
     def metadata(self):
         return self.definition['metadata']
@@ -115,30 +132,6 @@ class AnarchyGovernor:
     def python_requirements(self):
         return self.spec.get('pythonRequirements', None)
 
-    @property
-    def remove_finished_actions_after_seconds(self):
-        time_interval = self.spec.get('removeFinishedActions', {}).get('after')
-        if time_interval:
-            return pytimeparse.parse(time_interval)
-        else:
-            return pytimeparse.parse('1d')
-
-    @property
-    def remove_finished_actions_after_timedelta(self):
-        return timedelta(seconds=self.remove_finished_actions_after_seconds)
-
-    @property
-    def remove_successful_runs_after_seconds(self):
-        time_interval = self.spec.get('removeSuccessfulRuns', {}).get('after')
-        if time_interval:
-            return pytimeparse.parse(time_interval)
-        else:
-            return pytimeparse.parse('1d')
-
-    @property
-    def remove_successful_runs_after_timedelta(self):
-        return timedelta(seconds=self.remove_successful_runs_after_seconds)
-
     @property
     def resource_version(self):
         return self.metadata['resourceVersion']
@@ -147,20 +140,6 @@ class AnarchyGovernor:
     def spec(self):
         return self.definition['spec']
 
-    @property
-    def subject_event_handlers(self):
-        return self.spec['subjectEventHandlers']
-
-    @property
-    def supported_actions(self):
-        ret = {}
-        for k, v in self.action_configs.items():
-            ret[k] = {}
-            for f in ('description', 'timeEstimate'):
-                if v.get(f):
-                    ret[k][f] = v[f]
-        return ret
-
     @property
     def uid(self):
         return self.metadata['uid']
@@ -175,12 +154,24 @@ class AnarchyGovernor:
         }
 
     def get_action_config(self, name):
-        definition = self.action_configs.get(name)
-        if definition:
-            return ActionConfig(name, definition)
+        return self.actions.get(name)
+
+    def get_supported_actions_status(self):
+        """
+        Copy of supported actions for AnarchySubject status.
+        """
+        return {name: dict(action) for name, action in self.supported_actions.items()}
 
     def has_action(self, name):
-        return name in self.spec.get('actions', {})
+        return name in self.actions
+
+    def parse_time_interval(self, time_interval, default='1d'):
+        if time_interval:
+            seconds = pytimeparse.parse(time_interval)
+            if seconds is not None:
+                return seconds
+            logging.warning(f"Invalid time interval {time_interval} in {self}, using {default}")
+        return pytimeparse.parse(default)
 
 class RunConfig:
     def __init__(self, name, definition):
@@ -188,10 +179,7 @@ class RunConfig:
         self.name = name
 
 class ActionConfig(RunConfig):
-    @property
-    def finish_on_successful_run(self):
-        return self.definition.get('finishOnSuccessfulRun', True)
-
-    @property
-    def has_callback_handlers(self):
-        return True if self.definition.get('callbackHandlers') else False
+    def __init__(self, name, definition):
+        super().__init__(name, definition)
+        self.finish_on_successful_run = definition.get('finishOnSuccessfulRun', True)
+        self.has_callback_handlers = True if definition.get('callbackHandlers') else False
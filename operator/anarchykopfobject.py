@@ -175,7 +175,8 @@ class AnarchyKopfObject:
 
     async def raise_error_if_still_exists(self, msg):
         try:
-            await self.refresh()
+            definition = await self.fetch_definition(self.name)
+            self.update_from_definition(definition)
             raise kopf.TemporaryError(msg, delay=60)
         except kubernetes_asyncio.client.rest.ApiException as e:
             if e.status != 404:
@@ -6,24 +6,125 @@ from datetime import datetime, timezone
 
 from anarchy import Anarchy
 from anarchycachedkopfobject import AnarchyCachedKopfObject
+from indexed_cache import IndexedCache
+from metrics import Metrics
+from rate_limiter import RateLimiter
+from scheduler import Scheduler
+from sharding import Sharding
 
 import anarchyaction
 import anarchygovernor
+import anarchyrunner
 import anarchysubject
 
 class AnarchyRun(AnarchyCachedKopfObject):
-    cache = {}
+    cache = IndexedCache(
+        evictable = lambda anarchy_run: anarchy_run.is_finished,
+        indexes = {
+            "action": lambda anarchy_run: anarchy_run.action_name,
+            "governor": lambda anarchy_run: anarchy_run.spec.get('governor', {}).get('name'),
+            "runner": lambda anarchy_run: anarchy_run.runner_state,
+            "subject": lambda anarchy_run: anarchy_run.spec.get('subject', {}).get('name'),
+        },
+        max_bytes = Anarchy.cache_max_bytes,
+        max_objects = Anarchy.cache_max_objects,
+        sizeof = lambda anarchy_run: anarchy_run.definition_size,
+    )
     kind = 'AnarchyRun'
+    missing = {}
     plural = 'anarchyruns'
+    preloading = False
 
     @classmethod
     def have_unfinished_runs_for_action(cls, anarchy_action):
-        for anarchy_run in cls.cache.values():
-            if anarchy_run.action_name == anarchy_action.name \
-            and not anarchy_run.is_finished:
+        for anarchy_run in cls.cache.lookup('action', anarchy_action.name):
+            if not anarchy_run.is_finished:
                 return True
         return False
 
+    @classmethod
+    def handle_watch_event(cls, event_type, definition):
+        anarchyrunner.RunStatistics.handle_watch_event(event_type, definition, preload=cls.preloading)
+        anarchy_run = super().handle_watch_event(event_type, definition)
+        if anarchy_run and Sharding.owns(anarchy_run.subject_name):
+            # Run state comes from the watch, schedule management for any change
+            anarchy_run.schedule_manage()
+        return anarchy_run
+
+    @classmethod
+    async def preload(cls):
+        cls.preloading = True
+        try:
+            await super().preload()
+        finally:
+            cls.preloading = False
+
+    @classmethod
+    @Metrics.timed_handler(kind, 'manage')
+    async def manage_scheduled(cls, name):
+        """
+        Called by scheduler when AnarchyRun is due to be managed.
+        """
+        with cls.cache.pinned(name):
+            try:
+                anarchy_run = await cls.get(name)
+            except kubernetes_asyncio.client.rest.ApiException as e:
+                if e.status == 404:
+                    return
+                raise
+            if anarchy_run.ignore \
+            or not Sharding.owns(anarchy_run.subject_name):
+                return
+            anarchy_subject = await anarchy_run.get_subject()
+            if not anarchy_subject:
+                await anarchy_run.raise_error_if_still_exists(
+                    f"{anarchy_run} references missing AnarchySubject {anarchy_run.subject_name}"
+                )
+                return
+            if anarchy_subject.ignore:
+                return
+
+            if anarchy_run.has_action:
+                anarchy_action = await anarchy_run.get_action()
+                if not anarchy_action:
+                    await anarchy_run.raise_error_if_still_exists(
+                        f"{anarchy_run} references missing AnarchyAction {anarchy_run.action_name}"
+                    )
+                    return
+                if anarchy_action.ignore:
+                    raise kopf.TemporaryError(
+                        f"Refusing to handle {anarchy_run} when {anarchy_action} is marked with ignore",
+                        delay=30
+                    )
+            else:
+                anarchy_action = None
+
+            if anarchy_run.is_delete_handler:
+                with RateLimiter.priority(RateLimiter.critical):
+                    return await anarchy_run.manage(anarchy_subject, anarchy_action)
+            return await anarchy_run.manage(anarchy_subject, anarchy_action)
+
+    @classmethod
+    async def on_cleanup(cls):
+        await super().on_cleanup()
+        await cls.scheduler.stop()
+
+    @classmethod
+    async def on_startup(cls):
+        cls.scheduler = Scheduler(name=cls.kind, callback=cls.manage_scheduled)
+        Metrics.register_scheduler(cls.scheduler)
+        Sharding.on_rebalance(cls.rebalance)
+        await super().on_startup()
+        await cls.scheduler.start()
+
+    @classmethod
+    def rebalance(cls):
+        for anarchy_run in list(cls.cache.values()):
+            if Sharding.owns(anarchy_run.subject_name):
+                anarchy_run.schedule_manage()
+            else:
+                cls.scheduler.cancel(anarchy_run.name)
+
     @classmethod
     async def create(cls,
         handler,
@@ -32,60 +133,62 @@ class AnarchyRun(AnarchyCachedKopfObject):
     ):
         if anarchy_action:
             anarchy_subject = await anarchy_action.get_subject()
-        anarchy_governor = anarchy_subject.get_governor()
-
-        labels = {
-            Anarchy.governor_label: anarchy_governor.name,
-            Anarchy.runner_label: 'queued' if anarchy_subject.has_active_runs else 'pending',
-            Anarchy.subject_label: anarchy_subject.name,
-        }
-        # Mark this AnarchyRun for delete handling.
-        if anarchy_subject.is_deleting:
-            labels[Anarchy.delete_handler_label] = ''
-
-        if 'name' in handler:
-            labels[Anarchy.event_label] = handler['name']
-
-        run_spec = {
-            "governor": anarchy_governor.as_reference(),
-            "handler": handler,
-            "subject": {
-                "vars": anarchy_subject.vars,
-                **anarchy_subject.as_reference(),
+        # Locked so that only one run is created pending
+        async with anarchy_subject.locked():
+            anarchy_governor = anarchy_subject.get_governor()
+
+            labels = {
+                Anarchy.governor_label: anarchy_governor.name,
+                Anarchy.runner_label: 'queued' if anarchy_subject.has_active_runs else 'pending',
+                Anarchy.subject_label: anarchy_subject.name,
             }
-        }
+            # Mark this AnarchyRun for delete handling.
+            if anarchy_subject.is_deleting:
+                labels[Anarchy.delete_handler_label] = ''
 
-        if anarchy_action:
-            owner = anarchy_action
-            labels[Anarchy.action_label] = anarchy_action.name
-            run_spec['action'] = anarchy_action.as_reference()
             if 'name' in handler:
-                generate_name = f"{anarchy_action.name}-{handler['name']}-"
-            else:
-                generate_name = f"{anarchy_action.name}-"
-        else:
-            owner = anarchy_subject
-            generate_name = f"{anarchy_subject.name}-{handler['name']}-"
-
-        definition = await Anarchy.custom_objects_api.create_namespaced_custom_object(
-            group = Anarchy.domain,
-            namespace = Anarchy.namespace,
-            plural = 'anarchyruns',
-            version = Anarchy.version,
-            body = {
-                "apiVersion": Anarchy.api_version,
-                "kind": "AnarchyRun",
-                "metadata": {
-                    "generateName": generate_name,
-                    "labels": labels,
-                    "namespace": Anarchy.namespace,
-                    "ownerReferences": [owner.as_owner_ref()],
-                },
-                "spec": run_spec,
+                labels[Anarchy.event_label] = handler['name']
+
+            run_spec = {
+                "governor": anarchy_governor.as_reference(),
+                "handler": handler,
+                "subject": {
+                    "vars": anarchy_subject.vars,
+                    **anarchy_subject.as_reference(),
+                }
             }
-        )
-        anarchy_run = cls.load_definition(definition)
-        await anarchy_subject.add_run_to_status(anarchy_run)
+
+            if anarchy_action:
+                owner = anarchy_action
+                labels[Anarchy.action_label] = anarchy_action.name
+                run_spec['action'] = anarchy_action.as_reference()
+                if 'name' in handler:
+                    generate_name = f"{anarchy_action.name}-{handler['name']}-"
+                else:
+                    generate_name = f"{anarchy_action.name}-"
+            else:
+                owner = anarchy_subject
+                generate_name = f"{anarchy_subject.name}-{handler['name']}-"
+
+            definition = await Anarchy.custom_objects_api.create_namespaced_custom_object(
+                group = Anarchy.domain,
+                namespace = Anarchy.namespace,
+                plural = 'anarchyruns',
+                version = Anarchy.version,
+                body = {
+                    "apiVersion": Anarchy.api_version,
+                    "kind": "AnarchyRun",
+                    "metadata": {
+                        "generateName": generate_name,
+                        "labels": labels,
+                        "namespace": Anarchy.namespace,
+                        "ownerReferences": [owner.as_owner_ref()],
+                    },
+                    "spec": run_spec,
+                }
+            )
+            anarchy_run = cls.load_definition(definition)
+            await anarchy_subject.add_run_to_status(anarchy_run)
         return anarchy_run
 
     @property
@@ -206,11 +309,13 @@ class AnarchyRun(AnarchyCachedKopfObject):
             }])
 
     async def finish(self, state):
-        await self.json_patch_status([{
-            "op": "add",
-            "path": "/status/runPostTimestamp",
-            "value": datetime.now(timezone.utc).strftime('%FT%TZ'),
-        }])
+        # Successful runs keep the timestamp of the posted result
+        if state != 'successful' or 'runPostTimestamp' not in self.status:
+            await self.json_patch_status([{
+                "op": "add",
+                "path": "/status/runPostTimestamp",
+                "value": datetime.now(timezone.utc).strftime('%FT%TZ'),
+            }])
         await self.json_patch([{
             "op": "add",
             "path": f"/metadata/labels/{Anarchy.finished_label.replace('/', '~1')}",
@@ -282,6 +387,15 @@ class AnarchyRun(AnarchyCachedKopfObject):
             await anarchy_action.set_state('running')
 
     async def handle_success(self, anarchy_subject, anarchy_action):
+        await self.handle_success_result(anarchy_subject, anarchy_action)
+        # Label as finished for removal by the garbage collector
+        try:
+            await self.finish('successful')
+        except kubernetes_asyncio.client.rest.ApiException as e:
+            if e.status != 404:
+                raise
+
+    async def handle_success_result(self, anarchy_subject, anarchy_action):
         await anarchy_subject.set_run_status('successful')
 
         if self.delete_subject_finalizers:
@@ -342,6 +456,12 @@ class AnarchyRun(AnarchyCachedKopfObject):
                 await self.set_to_pending()
 
     async def manage(self, anarchy_subject, anarchy_action):
+        """
+        Called by scheduler when the AnarchyRun changes or a deadline is reached.
+
+        Returns seconds until the next deadline, either retry or cleanup, or None
+        if only a change to the run should cause it to be managed again.
+        """
         if self.is_finished:
             return await self.manage_finished(anarchy_subject, anarchy_action)
         else:
@@ -364,27 +484,46 @@ class AnarchyRun(AnarchyCachedKopfObject):
             seconds_to_retry = (
                 self.retry_after_datetime - datetime.now(timezone.utc)
             ).total_seconds()
-            if seconds_to_retry < 0:
-                await self.retry()
-            elif seconds_to_retry < Anarchy.run_check_interval:
+            if seconds_to_retry > 0:
                 return seconds_to_retry
+            await self.retry()
         elif self.runner_state == 'queued':
             await anarchy_subject.add_run_to_status(self)
             if self.name == anarchy_subject.active_run_name:
                 logging.info(f"{self} transition to pending")
                 await self.set_to_pending()
 
-        return Anarchy.run_check_interval
-
     async def manage_finished(self, anarchy_subject, anarchy_action):
-        if self.cleanup_after_datetime <= datetime.now(timezone.utc):
-            await self.delete()
-        return Anarchy.run_check_interval
+        if Anarchy.finished_label in self.labels:
+            # Deleted by garbage collector
+            return
+        seconds_to_cleanup = (
+            self.cleanup_after_datetime - datetime.now(timezone.utc)
+        ).total_seconds()
+        if seconds_to_cleanup > 0:
+            return seconds_to_cleanup
+        await self.delete()
+
+    def remove_from_cache(self):
+        super().remove_from_cache()
+        self.scheduler.cancel(self.name)
+
+    def resume_required(self, anarchy_subject):
+        """
+        Check cached state for changes that resume handling would make.
+        """
+        if self.is_finished:
+            return anarchy_subject.has_run_in_status(self)
+        return not anarchy_subject.has_run_in_status(self) \
+            or (self.runner_state == 'queued' and self.name == anarchy_subject.active_run_name)
 
     async def retry(self):
         logging.info(f"{self} retrying")
         await self.set_to_pending()
 
+    def schedule_manage(self, delay=0):
+        self.scheduler.schedule(self.name, delay)
+
     async def set_to_pending(self):
         await self.json_patch([{
             "op": "add",
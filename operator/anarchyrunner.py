@@ -1,20 +1,31 @@
 import asyncio
+import hashlib
+import json
 import kubernetes_asyncio
 import logging
+import math
 import os
 import pytimeparse
+import time
 
+from collections import deque
 from copy import deepcopy
 from datetime import datetime, timezone
 
 from anarchy import Anarchy
 from anarchycachedkopfobject import AnarchyCachedKopfObject
 from deep_merge import deep_merge
+from indexed_cache import IndexedCache
+from metrics import Metrics
 from random_string import random_string
+from runner_pod import RunnerPod
+
+import anarchygovernor
 
 class AnarchyRunner(AnarchyCachedKopfObject):
-    cache = {}
+    cache = IndexedCache()
     kind = 'AnarchyRunner'
+    missing = {}
     plural = 'anarchyrunners'
 
     def __init__(self, **kwargs):
@@ -22,7 +33,12 @@ class AnarchyRunner(AnarchyCachedKopfObject):
         self.lock = asyncio.Lock()
         self.pods = {}
         self.pods_preloaded = False
+        self.last_pod_audit = time.monotonic()
+        self.last_scale_down_datetime = datetime.now(timezone.utc)
         self.last_scale_up_datetime = datetime.now(timezone.utc)
+        # Pod name to run count and time when pod was last seen to be busy
+        self.pod_activity = {}
+        self.pod_template_hash_cache = (None, None)
 
     @property
     def consecutive_failure_limit(self):
@@ -42,6 +58,29 @@ class AnarchyRunner(AnarchyCachedKopfObject):
             return False
         return len(self.pods) >= self.max_replicas
 
+    @property
+    def desired_replicas(self):
+        """
+        Replicas needed for pending runs to wait no longer than
+        targetQueueWait, predicted from recent run arrival rate and durations.
+
+        Run slots for expected arrivals by Little's law, or at least the runs
+        currently assigned, plus slots to clear the pending backlog within the
+        target wait, divided among pods by runConcurrency.
+        """
+        run_duration = RunStatistics.expected_duration(self.name)
+        backlog = len(self.status.get('pendingRuns', []))
+        busy_count = sum(self.get_pod_status_run_count(entry) for entry in self.status.get('pods', []))
+        slots = max(
+            math.ceil(RunStatistics.arrival_rate(self.name) * run_duration),
+            busy_count,
+        ) + min(backlog, math.ceil(backlog * run_duration / self.target_queue_wait))
+        replicas = math.ceil(slots / self.run_concurrency)
+        replicas = max(replicas, self.min_replicas)
+        if self.max_replicas:
+            replicas = min(replicas, self.max_replicas)
+        return replicas
+
     @property
     def min_scale_up_delay_exceeded(self):
         return (
@@ -56,6 +95,30 @@ class AnarchyRunner(AnarchyCachedKopfObject):
     def pod_template(self):
         return self.spec.get('podTemplate', {})
 
+    @property
+    def pod_template_hash(self):
+        """
+        Hash of rendered pod template, computed once per generation so that
+        status updates do not trigger recalculation.
+        """
+        generation = self.metadata.get('generation')
+        if self.pod_template_hash_cache[0] != generation or generation is None:
+            # Runner token differs for every pod so is excluded from the hash
+            pod_template = self.make_pod_template(runner_token='-')
+            pod_template_hash = hashlib.sha256(
+                json.dumps(pod_template, sort_keys=True, separators=(',', ':')).encode('utf-8')
+            ).hexdigest()
+            self.pod_template_hash_cache = (generation, pod_template_hash)
+        return self.pod_template_hash_cache[1]
+
+    @property
+    def predictive_scaling_enabled(self):
+        return self.target_queue_wait is not None
+
+    @property
+    def run_concurrency(self):
+        return self.spec.get('runConcurrency', 1)
+
     @property
     def run_limit(self):
         return self.spec.get('runLimit')
@@ -64,6 +127,17 @@ class AnarchyRunner(AnarchyCachedKopfObject):
     def runner_image(self):
         return os.environ.get('RUNNER_IMAGE', Anarchy.pod.spec.containers[0].image)
 
+    @property
+    def scale_down_delay(self):
+        return pytimeparse.parse(self.spec.get('scaleDownDelay', '10m'))
+
+    @property
+    def scale_down_delay_exceeded(self):
+        last_scale_datetime = max(self.last_scale_down_datetime, self.last_scale_up_datetime)
+        return (
+            datetime.now(timezone.utc) - last_scale_datetime
+        ).total_seconds() > self.scale_down_delay
+
     @property
     def scale_up_delay(self):
         return pytimeparse.parse(self.spec.get('scaleUpDelay', '5m'))
@@ -82,8 +156,7 @@ class AnarchyRunner(AnarchyCachedKopfObject):
     def scale_up_threshold_exceeded(self):
         idle_runner_count = 0
         for pod in self.status.get('pods', []):
-            if 'run' not in pod:
-                idle_runner_count += 1
+            idle_runner_count += self.run_concurrency - self.get_pod_status_run_count(pod)
         return self.scale_up_threshold < len(self.status.get('pendingRuns', [])) - idle_runner_count
 
     @property
@@ -94,6 +167,12 @@ class AnarchyRunner(AnarchyCachedKopfObject):
     def scaling_enabled(self):
         return self.scale_up_threshold != None and self.scale_up_threshold > 1
 
+    @property
+    def target_queue_wait(self):
+        if 'targetQueueWait' not in self.spec:
+            return None
+        return max(pytimeparse.parse(self.spec['targetQueueWait']) or 0, 1)
+
     @property
     def service_account_name(self):
         """
@@ -162,15 +241,47 @@ class AnarchyRunner(AnarchyCachedKopfObject):
             }
         ])
 
+        # Only set when used so that existing pods match the template
+        if self.run_concurrency > 1:
+            container['env'].append({
+                'name': 'RUN_CONCURRENCY',
+                'value': str(self.run_concurrency),
+            })
+
         return ret
 
     async def create_runner_pod(self, logger):
         pod_template = self.make_pod_template()
-        pod = await Anarchy.core_v1_api.create_namespaced_pod(Anarchy.namespace, pod_template)
-        logger.info(f"Created pod {pod.metadata.name} for {self}")
-        self.pods[pod.metadata.name] = pod
+        pod_template['metadata'].setdefault('annotations', {})[Anarchy.pod_template_hash_annotation] = self.pod_template_hash
+        pod = await RunnerPod.create(pod_template)
+        logger.info(f"Created pod {pod.name} for {self}")
+        self.pods[pod.name] = pod
         self.last_scale_up_datetime = datetime.now(timezone.utc)
 
+    def get_pod_status_run_count(self, entry):
+        """
+        Count of runs assigned to pod in status pods entry.
+        """
+        if 'runs' in entry:
+            return len(entry['runs'])
+        return 1 if entry.get('run') else 0
+
+    def get_pod_for_scale_down(self):
+        """
+        Return pod which has been idle longest if idle for at least
+        scaleDownDelay. Pods with an assigned run are never returned.
+        """
+        idle_pod = None
+        idle_since = time.monotonic() - self.scale_down_delay
+        for name, pod in self.pods.items():
+            if not pod.is_running:
+                continue
+            run_count, last_active = self.pod_activity.get(name, (None, None))
+            if last_active is not None and last_active <= idle_since:
+                idle_pod = pod
+                idle_since = last_active
+        return idle_pod
+
     async def handle_create(self, logger):
         await self.manage_service_account()
         await self.manage_pods(logger=logger)
@@ -183,21 +294,21 @@ class AnarchyRunner(AnarchyCachedKopfObject):
         await self.manage_pods(logger=logger)
 
     async def handle_runner_pod_deleted(self, pod, logger):
-        self.pods.pop(pod.metadata.name, None)
+        self.pods.pop(pod.name, None)
         await self.manage_pods(logger=logger)
 
     async def handle_runner_pod_deleting(self, pod, logger):
-        self.pods.pop(pod.metadata.name, None)
+        self.pods.pop(pod.name, None)
         await self.manage_pods(logger=logger)
 
     async def handle_runner_pod_labeled_for_temination(self, pod, logger):
-        self.pods.pop(pod.metadata.name, None)
+        self.pods.pop(pod.name, None)
         await self.manage_pods(logger=logger)
 
     async def handle_runner_pod_event(self, pod, logger):
-        if pod.metadata.deletion_timestamp:
+        if pod.is_deleting:
             await self.handle_runner_pod_deleting(pod=pod, logger=logger)
-        elif Anarchy.runner_terminating_label in pod.metadata.labels:
+        elif pod.is_marked_for_termination:
             await self.handle_runner_pod_labeled_for_temination(pod=pod, logger=logger)
         else:
             await self.handle_runner_pod_update(pod=pod, logger=logger)
@@ -212,15 +323,41 @@ class AnarchyRunner(AnarchyCachedKopfObject):
         await self.manage_service_account()
         await self.manage_pods(logger=logger)
 
+    @Metrics.timed_handler(kind, 'manage_pods')
     async def manage_pods(self, logger):
         if not self.pods_preloaded:
             await self.preload_pods()
 
+        audit = time.monotonic() - self.last_pod_audit >= Anarchy.runner_pod_audit_interval
         have_pod_not_running = False
         for pod in list(self.pods.values()):
-            await self.manage_pod(pod=pod, logger=logger)
-            if pod.status.phase != 'Running':
+            await self.manage_pod(pod=pod, logger=logger, audit=audit)
+            if not pod.is_running:
                 have_pod_not_running = True
+        if audit:
+            self.last_pod_audit = time.monotonic()
+
+        self.update_pod_activity()
+        desired_replicas = self.desired_replicas if self.predictive_scaling_enabled else self.min_replicas
+        if (
+            len(self.pods) > desired_replicas and
+            not self.status.get('pendingRuns') and
+            self.scale_down_delay_exceeded
+        ):
+            pod = self.get_pod_for_scale_down()
+            if pod:
+                logger.info(f"Scaling down {self}, {pod} is idle")
+                await self.mark_pod_for_termination(pod)
+                self.last_scale_down_datetime = datetime.now(timezone.utc)
+                return
+
+        if self.predictive_scaling_enabled:
+            # Starting pods are included in the count so scale up without waiting for them
+            if len(self.pods) < desired_replicas and self.min_scale_up_delay_exceeded:
+                logger.info(f"Scaling up {self} from {len(self.pods)} to {desired_replicas} replicas")
+                for i in range(desired_replicas - len(self.pods)):
+                    await self.create_runner_pod(logger=logger)
+            return
 
         if (
             have_pod_not_running or
@@ -241,9 +378,15 @@ class AnarchyRunner(AnarchyCachedKopfObject):
             logger.info(f"Scaling up {self}")
             await self.create_runner_pod(logger=logger)
 
-    async def manage_pod(self, pod, logger):
+    async def manage_pod(self, pod, logger, audit=False):
+        """
+        Mark pod for termination if over limits or if it does not match the
+        pod template. Template drift is detected by the hash annotation set
+        at creation and only compared in full on periodic audit or for pods
+        without the annotation.
+        """
         for entry in self.status.get('pods', []):
-            if entry['name'] == pod.metadata.name:
+            if entry['name'] == pod.name:
                 consecutive_failure_count = entry.get('consecutiveFailureCount', 0)
                 run_count = entry.get('runCount', 0)
                 break
@@ -252,7 +395,7 @@ class AnarchyRunner(AnarchyCachedKopfObject):
 
         if self.consecutive_failure_limit and consecutive_failure_count >= self.consecutive_failure_limit:
             logging.info(
-                f"Marking {self} pod {pod.metadata.name} for deletion "
+                f"Marking {self} pod {pod.name} for deletion "
                 f"after {consecutive_failure_count} consecutive failures"
             )
             await self.mark_pod_for_termination(pod)
@@ -260,30 +403,52 @@ class AnarchyRunner(AnarchyCachedKopfObject):
 
         if self.run_limit and run_count > self.run_limit:
             logging.info(
-                f"Marking {self} pod {pod.metadata.name} for deletion "
+                f"Marking {self} pod {pod.name} for deletion "
                 f"after {run_count} consecutive runs"
             )
             await self.mark_pod_for_termination(pod)
             return
 
-        # Get runner token to feed into pod template to prevent auto-generation
-        runner_token = None
-        for env_var in pod.spec.containers[0].env:
-            if env_var.name == 'RUNNER_TOKEN':
-                runner_token = env_var.value
-                break
-
-        pod_dict = Anarchy.k8s_obj_to_dict(pod)
-        pod_template = self.make_pod_template(runner_token)
-
-        cmp = deepcopy(pod_dict)
-        deep_merge(cmp, pod_template)
-        if pod_dict != cmp:
-            logging.info(f"Marking {self} pod {pod.metadata.name} for deletion on template mismatch")
+        pod_template_hash = pod.annotations.get(Anarchy.pod_template_hash_annotation)
+        if pod_template_hash and pod_template_hash != self.pod_template_hash:
+            logging.info(f"Marking {self} pod {pod.name} for deletion on template hash mismatch")
             await self.mark_pod_for_termination(pod)
             return
 
-        self.pods[pod.metadata.name] = pod
+        if audit or not pod_template_hash:
+            if not self.pod_matches_template(pod):
+                logging.info(f"Marking {self} pod {pod.name} for deletion on template mismatch")
+                await self.mark_pod_for_termination(pod)
+                return
+            if not pod_template_hash:
+                # Annotate pods created before template hashing so later checks are by hash
+                await pod.merge_patch({
+                    "metadata": {
+                        "annotations": {
+                            Anarchy.pod_template_hash_annotation: self.pod_template_hash,
+                        }
+                    }
+                })
+
+        self.pods[pod.name] = pod
+
+    def update_pod_activity(self):
+        """
+        Track when each pod was last busy from pod status reported by the
+        API. A pod is busy while it has a run assigned or if its run count
+        changed since last checked.
+        """
+        now = time.monotonic()
+        pods_status = {entry['name']: entry for entry in self.status.get('pods', [])}
+        pod_activity = {}
+        for name in self.pods:
+            entry = pods_status.get(name, {})
+            run_count = entry.get('runCount', 0)
+            previous_run_count, last_active = self.pod_activity.get(name, (None, now))
+            if entry.get('run') or run_count != previous_run_count:
+                last_active = now
+            pod_activity[name] = (run_count, last_active)
+        self.pod_activity = pod_activity
 
     async def manage_service_account(self):
         try:
@@ -294,36 +459,143 @@ class AnarchyRunner(AnarchyCachedKopfObject):
                 raise
         service_account = await Anarchy.core_v1_api.create_namespaced_service_account(
             Anarchy.namespace,
-            kubernetes.client.V1ServiceAccount(
-                metadata = kubernetes.client.V1ObjectMeta(
-                    name = self.service_account_name,
-                    owner_references = [self.as_owner_ref()],
-                )
-            )
+            {
+                "apiVersion": "v1",
+                "kind": "ServiceAccount",
+                "metadata": {
+                    "name": self.service_account_name,
+                    "ownerReferences": [self.as_owner_ref()],
+                },
+            }
         )
         logging.info(f"Created ServiceAccount {service_account.metadata.name} for {self}")
 
     async def mark_pod_for_termination(self, pod):
-        pod = await Anarchy.core_v1_api.patch_namespaced_pod(
-            pod.metadata.name,
-            pod.metadata.namespace,
-            {
-                "metadata": {
-                    "labels": {
-                        Anarchy.runner_terminating_label: ""
-                    }
+        await pod.merge_patch({
+            "metadata": {
+                "labels": {
+                    Anarchy.runner_terminating_label: ""
                 }
             }
-        )
-        logging.info(f"Labeled AnarchyRunner pod {pod.metadata.name} for termination")
-        self.pods.pop(pod.metadata.name, None)
+        })
+        logging.info(f"Labeled AnarchyRunner pod {pod.name} for termination")
+        self.pods.pop(pod.name, None)
+
+    def pod_matches_template(self, pod):
+        # Feed runner token into pod template to prevent auto-generation
+        pod_template = self.make_pod_template(pod.runner_token)
+
+        cmp = deepcopy(pod.definition)
+        deep_merge(cmp, pod_template)
+        return pod.definition == cmp
 
     async def preload_pods(self):
-        pod_list = await Anarchy.core_v1_api.list_namespaced_pod(
-            Anarchy.namespace, label_selector=f"{Anarchy.runner_label}={self.name}"
-        )
-        for pod in pod_list.items:
-            if not pod.metadata.deletion_timestamp \
-            and not Anarchy.runner_terminating_label in pod.metadata.labels:
-                self.pods[pod.metadata.name] = pod
+        for pod in await RunnerPod.list(label_selector=f"{Anarchy.runner_label}={self.name}"):
+            if not pod.is_deleting \
+            and not pod.is_marked_for_termination:
+                self.pods[pod.name] = pod
         self.pods_preloaded = True
+
+class RunStatistics:
+    """
+    Recent AnarchyRun arrivals and durations for each AnarchyRunner, observed
+    from the AnarchyRun watch, for predictive runner scaling.
+
+    A run arrives when first seen pending, starts when assigned to a runner
+    pod and finishes on any final runner state. Runs are counted for the
+    runner of their governor.
+    """
+    arrivals = {}
+    default_duration = 60
+    durations = {}
+    pending = {}
+    started = {}
+
+    @classmethod
+    def arrival_rate(cls, runner_name):
+        """
+        Runs arriving per second for runner over the statistics window.
+        """
+        cls.prune()
+        return len(cls.arrivals.get(runner_name, ())) / Anarchy.runner_autoscale_window
+
+    @classmethod
+    def clear(cls):
+        cls.arrivals.clear()
+        cls.durations.clear()
+        cls.pending.clear()
+        cls.started.clear()
+
+    @classmethod
+    def expected_duration(cls, runner_name):
+        """
+        Mean run duration for runner weighted by recent arrivals for each
+        governor.
+        """
+        cls.prune()
+        governor_durations = {
+            governor_name: sum(duration for _, duration in durations) / len(durations)
+            for governor_name, durations in cls.durations.get(runner_name, {}).items() if durations
+        }
+        if not governor_durations:
+            return cls.default_duration
+        overall_duration = sum(governor_durations.values()) / len(governor_durations)
+        arrivals = cls.arrivals.get(runner_name)
+        if not arrivals:
+            return overall_duration
+        return sum(
+            governor_durations.get(governor_name, overall_duration)
+            for _, governor_name in arrivals
+        ) / len(arrivals)
+
+    @classmethod
+    def get_runner_name(cls, governor_name):
+        """
+        Name of AnarchyRunner for runs of governor, from the governor runner.
+        """
+        if Anarchy.running_all_in_one:
+            return 'default'
+        anarchy_governor = anarchygovernor.AnarchyGovernor.cache.get(governor_name)
+        if not anarchy_governor:
+            return 'default'
+        return anarchy_governor.spec.get('runner', 'default')
+
+    @classmethod
+    def handle_watch_event(cls, event_type, definition, preload=False):
+        """
+        Update statistics from AnarchyRun watch event. Runs already pending
+        when preloaded are tracked without counting as arrivals.
+        """
+        name = definition['metadata']['name']
+        labels = definition['metadata'].get('labels', {})
+        runner_state = labels.get(Anarchy.runner_label)
+        governor_name = labels.get(Anarchy.governor_label)
+        now = time.monotonic()
+
+        if event_type == 'DELETED' or runner_state in ('canceled', 'failed', 'lost', 'successful'):
+            cls.pending.pop(name, None)
+            started = cls.started.pop(name, None)
+            if started and runner_state in ('failed', 'successful'):
+                runner_name, start = started
+                cls.durations.setdefault(runner_name, {}).setdefault(governor_name, deque()).append((now, now - start))
+        elif runner_state == 'pending':
+            if name not in cls.pending:
+                runner_name = cls.get_runner_name(governor_name)
+                cls.pending[name] = runner_name
+                if not preload:
+                    cls.arrivals.setdefault(runner_name, deque()).append((now, governor_name))
+        elif runner_state and runner_state != 'queued':
+            # Runner state is the name of the runner pod once assigned
+            runner_name = cls.pending.pop(name, None) or cls.get_runner_name(governor_name)
+            cls.started.setdefault(name, (runner_name, now))
+
+    @classmethod
+    def prune(cls):
+        expired = time.monotonic() - Anarchy.runner_autoscale_window
+        for arrivals in cls.arrivals.values():
+            while arrivals and arrivals[0][0] < expired:
+                arrivals.popleft()
+        for governor_durations in cls.durations.values():
+            for durations in governor_durations.values():
+                while durations and durations[0][0] < expired:
+                    durations.popleft()
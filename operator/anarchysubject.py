@@ -1,27 +1,45 @@
 import asyncio
 import hashlib
 import json
+import jsonpatch
 import kopf
 import kubernetes_asyncio
 import logging
+import time
 
 from base64 import b64encode
+from contextlib import asynccontextmanager
 
 from anarchy import Anarchy
 from anarchycachedkopfobject import AnarchyCachedKopfObject
+from indexed_cache import IndexedCache
+from metrics import Metrics
 
 import anarchyaction
 import anarchygovernor
 import anarchyrun
 
 class AnarchySubject(AnarchyCachedKopfObject):
-    cache = {}
+    cache = IndexedCache(
+        # Subjects are only evicted when idle so that locks are not lost
+        evictable = lambda anarchy_subject: anarchy_subject.is_idle,
+        indexes = {
+            "governor": lambda anarchy_subject: anarchy_subject.governor_name,
+        },
+        max_bytes = Anarchy.cache_max_bytes,
+        max_objects = Anarchy.cache_max_objects,
+        sizeof = lambda anarchy_subject: anarchy_subject.definition_size,
+    )
     kind = 'AnarchySubject'
+    missing = {}
     plural = 'anarchysubjects'
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.lock = asyncio.Lock()
+        self.lock_task = None
+        self.status_patch = None
+        self.status_patch_task = None
 
     @property
     def active_action_name(self):
@@ -73,10 +91,51 @@ class AnarchySubject(AnarchyCachedKopfObject):
     def has_subject_finalizer(self):
         return Anarchy.subject_label in self.finalizers
 
+    @property
+    def is_buffering_status(self):
+        """
+        Status patches are only buffered for the task which started buffering,
+        writes from other tasks are made directly.
+        """
+        return self.status_patch is not None and self.status_patch_task is asyncio.current_task()
+
+    @property
+    def is_idle(self):
+        return not self.lock.locked() \
+            and self.status_patch is None \
+            and not self.has_active_action \
+            and not self.has_active_runs \
+            and not self.has_pending_actions
+
     @property
     def pending_actions(self):
         return self.status.get('pendingActions', [])
 
+    @property
+    def resume_required(self):
+        """
+        Check cached state for changes that resume handling would make.
+        """
+        governor = anarchygovernor.AnarchyGovernor.cache.get(self.governor_name)
+        if not governor \
+        or self.initialize_metadata_patch() \
+        or 'pendingActions' not in self.status \
+        or 'runs' not in self.status \
+        or self.status.get('supportedActions') != governor.supported_actions:
+            return True
+        action_names = [item['name'] for item in self.pending_actions]
+        if self.active_action_name:
+            action_names.append(self.active_action_name)
+        for action_name in action_names:
+            anarchy_action = anarchyaction.AnarchyAction.cache.get(action_name)
+            if not anarchy_action or anarchy_action.is_finished:
+                return True
+        for run_ref in self.active_runs:
+            anarchy_run = anarchyrun.AnarchyRun.cache.get(run_ref['name'])
+            if not anarchy_run or anarchy_run.is_finished:
+                return True
+        return False
+
     @property
     def spec_sha256(self):
         return b64encode(hashlib.sha256(json.dumps(
@@ -87,6 +146,36 @@ class AnarchySubject(AnarchyCachedKopfObject):
     def vars(self):
         return self.spec.get('vars', {})
 
+    def apply_status_patch(self, patch):
+        """
+        Apply JSON patch to cached status, raising the same error the API
+        would return if the patch cannot be applied.
+        """
+        try:
+            self.status = jsonpatch.apply_patch({"status": dict(self.status)}, patch)['status']
+        except jsonpatch.JsonPatchException as e:
+            raise kubernetes_asyncio.client.rest.ApiException(status=422, reason=str(e))
+
+    def update(self, **kwargs):
+        super().update(**kwargs)
+        self.reapply_status_patch()
+
+    def update_from_definition(self, definition):
+        super().update_from_definition(definition)
+        self.reapply_status_patch()
+
+    def reapply_status_patch(self):
+        """
+        Keep buffered status changes visible when cached state is replaced.
+        """
+        if not self.status_patch:
+            return
+        try:
+            self.apply_status_patch(self.status_patch)
+        except kubernetes_asyncio.client.rest.ApiException:
+            # Conflict is detected when the buffer is flushed
+            pass
+
     def get_governor(self):
         if not self.governor_name:
             raise kopf.PermanentError("{self} spec.governor is required")
@@ -107,55 +196,77 @@ class AnarchySubject(AnarchyCachedKopfObject):
         return False
 
     async def add_action_to_status(self, anarchy_action):
-        if self.has_action_in_status(anarchy_action):
-            return
-        entry = {
-            "after": anarchy_action.after_timestamp,
-            **anarchy_action.as_reference(),
-        }
-        if not 'pendingActions' in self.status:
-            await self.json_patch_status([{
-                "op": "add",
-                "path": "/status/pendingActions",
-                "value": [entry],
-            }])
-            return
-        for i, item in enumerate(self.pending_actions):
-            if item['after'] > anarchy_action.after_timestamp:
-                await self.json_patch_status([{
+        def build_patch():
+            if self.has_action_in_status(anarchy_action):
+                return
+            entry = {
+                "after": anarchy_action.after_timestamp,
+                **anarchy_action.as_reference(),
+            }
+            if not 'pendingActions' in self.status:
+                return [{
                     "op": "add",
-                    "path": f"/status/pendingActions/{i}",
-                    "value": entry,
-                }])
-                break
-        else:
-            await self.json_patch_status([{
+                    "path": "/status/pendingActions",
+                    "value": [entry],
+                }]
+            for i, item in enumerate(self.pending_actions):
+                if item['after'] > anarchy_action.after_timestamp:
+                    return [{
+                        "op": "add",
+                        "path": f"/status/pendingActions/{i}",
+                        "value": entry,
+                    }]
+            return [{
                 "op": "add",
                 "path": f"/status/pendingActions/-",
                 "value": entry,
-            }])
+            }]
+        await self.update_status(build_patch)
 
     async def add_run_to_status(self, anarchy_run):
-        if self.has_run_in_status(anarchy_run):
+        def build_patch():
+            if self.has_run_in_status(anarchy_run):
+                return
+            if not 'runs' in self.status:
+                return [{
+                    "op": "add",
+                    "path": f"/status/runs",
+                    "value": {"active": [anarchy_run.as_reference()]},
+                }]
+            elif not 'active' in self.status['runs']:
+                return [{
+                    "op": "add",
+                    "path": f"/status/runs/active",
+                    "value": [anarchy_run.as_reference()],
+                }]
+            else:
+                return [{
+                    "op": "add",
+                    "path": f"/status/runs/active/-",
+                    "value": anarchy_run.as_reference(),
+                }]
+        await self.update_status(build_patch)
+
+    @asynccontextmanager
+    async def buffered_status_patch(self):
+        """
+        Collect status patches made within the context and write them as a
+        single conditional JSON patch on exit.
+        """
+        if self.is_buffering_status:
+            # Already buffering for an outer context
+            yield
             return
-        if not 'runs' in self.status:
-            await self.json_patch_status([{
-                "op": "add",
-                "path": f"/status/runs",
-                "value": {"active": [anarchy_run.as_reference()]},
-            }])
-        elif not 'active' in self.status['runs']:
-            await self.json_patch_status([{
-                "op": "add",
-                "path": f"/status/runs/active",
-                "value": [anarchy_run.as_reference()],
-            }])
-        else:
-            await self.json_patch_status([{
-                "op": "add",
-                "path": f"/status/runs/active/-",
-                "value": anarchy_run.as_reference(),
-            }])
+        self.status_patch = []
+        self.status_patch_task = asyncio.current_task()
+        try:
+            yield
+        finally:
+            try:
+                await self.flush_status_patch()
+            finally:
+                self.status_patch = None
+                self.status_patch_task = None
 
     async def check_complete_delete(self):
         """
@@ -167,32 +278,32 @@ class AnarchySubject(AnarchyCachedKopfObject):
             logging.warning("check_complete_delete called on {self} which is not deleting?")
             return
 
-        if not self.has_active_runs \
-        and not self.has_active_action \
-        and not self.has_pending_actions:
-            await self.remove_subject_finalizer()
-            self.remove_from_cache()
-            return True
+        async with self.locked():
+            if not self.has_active_runs \
+            and not self.has_active_action \
+            and not self.has_pending_actions:
+                await self.remove_subject_finalizer()
+                self.remove_from_cache()
+                return True
 
     async def check_set_active_action(self, anarchy_action):
-        if self.active_action_name:
-            return
-        if not self.pending_actions:
-            raise kopf.TemporaryError(f"{self} has no pending actions when checking {anarchy_action}")
-        if self.pending_actions[0]['name'] == anarchy_action.name:
-            await self.json_patch_status([{
-                "op": "test",
-                "path": "/status/activeAction",
-                "value": None,
-            }, {
-                "op": "test",
-                "path": "/status/pendingActions/0/name",
-                "value": anarchy_action.name,
-            }, {
-                "op": "move",
-                "from": "/status/pendingActions/0",
-                "path": "/status/activeAction",
-            }])
+        # Locked so that only one pending action becomes active
+        async with self.locked():
+            await self.update_status(self.build_set_active_action_patch(anarchy_action))
+
+    def build_set_active_action_patch(self, anarchy_action):
+        def build_patch():
+            if self.active_action_name:
+                return
+            if not self.pending_actions:
+                raise kopf.TemporaryError(f"{self} has no pending actions when checking {anarchy_action}")
+            if self.pending_actions[0]['name'] == anarchy_action.name:
+                return [{
+                    "op": "move",
+                    "from": "/status/pendingActions/0",
+                    "path": "/status/activeAction",
+                }]
+        return build_patch
 
     async def create_anarchy_run(self, event_name=None, event_vars=None):
         anarchy_run = await anarchyrun.AnarchyRun.create(
@@ -207,6 +318,17 @@ class AnarchySubject(AnarchyCachedKopfObject):
         await self.add_run_to_status(anarchy_run)
         return anarchy_run
 
+    @asynccontextmanager
+    async def critical_section(self):
+        """
+        Hold the subject lock and buffer status changes within context.
+
+        Used for subject event handling, action and run handling only lock
+        where activation decisions depend on subject status.
+        """
+        async with self.locked(), self.buffered_status_patch():
+            yield
+
     async def delete_backwards_compatibility_fixup(self):
         """
         Previous versions of anarchy did not have the same model for delete handling.
@@ -270,6 +392,43 @@ class AnarchySubject(AnarchyCachedKopfObject):
                 else:
                     raise
 
+    async def delete(self):
+        if self.is_buffering_status:
+            await self.flush_status_patch()
+        await super().delete()
+
+    async def flush_status_patch(self):
+        """
+        Write buffered status patch conditional on the resourceVersion of the
+        cached state. On conflict the patch is discarded and the handler is
+        retried against current state.
+        """
+        patch = self.status_patch
+        if not patch:
+            return
+        # Keep buffering while the write is in progress
+        self.status_patch = []
+        try:
+            await super().json_patch_status([{
+                "op": "test",
+                "path": "/metadata/resourceVersion",
+                "value": self.metadata['resourceVersion'],
+            }, *patch])
+            return
+        except kubernetes_asyncio.client.rest.ApiException as e:
+            if e.status == 404:
+                logging.info(f"Discarding status patch for {self}, it has been deleted")
+                return
+            if e.status not in (409, 422):
+                logging.error(f"Failed to apply {patch} to {self}")
+                raise
+            reason = e.reason
+        # Buffered patch may address array entries by position, which is not
+        # safe to replay after another writer changed status.
+        self.status_patch = []
+        await super().refresh(force=True)
+        raise kopf.TemporaryError(f"{self} status changed during update: {reason}", delay=1)
+
     async def get_active_action(self):
         action_name = self.active_action_name
         if action_name:
@@ -344,8 +503,9 @@ class AnarchySubject(AnarchyCachedKopfObject):
             await self.remove_subject_finalizer()
 
     async def handle_resume(self):
-        await self.initialize_metadata()
-        await self.manage_status()
+        async with self.critical_section():
+            await self.initialize_metadata()
+            await self.manage_status()
 
     async def handle_update(self, previous_state):
         anarchy_governor = self.get_governor()
@@ -373,6 +533,11 @@ class AnarchySubject(AnarchyCachedKopfObject):
         '''
         Set subject finalizer and governor label
         '''
+        patch = self.initialize_metadata_patch()
+        if patch:
+            await self.json_patch(patch)
+
+    def initialize_metadata_patch(self):
         patch = []
         governor = self.get_governor()
 
@@ -390,9 +555,8 @@ class AnarchySubject(AnarchyCachedKopfObject):
             # The governor does not have a delete handler, so no subject
             # finalizer should be present.
             patch.append({
-                "op": "add",
+                "op": "remove",
                 "path": f"/metadata/finalizers/{self.finalizers.index(Anarchy.subject_label)}",
-                "value": Anarchy.subject_label,
             })
 
         # Apply governor label
@@ -426,8 +590,7 @@ class AnarchySubject(AnarchyCachedKopfObject):
                 "value": self.spec_sha256,
             })
 
-        if patch:
-            await self.json_patch(patch)
+        return patch
 
     async def initialize_status(self):
         governor = self.get_governor()
@@ -443,7 +606,7 @@ class AnarchySubject(AnarchyCachedKopfObject):
                     "runs": {
                         "active": [],
                     },
-                    "supportedActions": governor.supported_actions,
+                    "supportedActions": governor.get_supported_actions_status(),
                 }
             }])
 
@@ -539,37 +702,89 @@ class AnarchySubject(AnarchyCachedKopfObject):
             patch.append({
                 "op": "add",
                 "path": "/status/supportedActions",
-                "value": governor.supported_actions,
+                "value": governor.get_supported_actions_status(),
             })
 
         if patch:
             await self.json_patch_status(patch)
 
-    async def remove_action_from_status(self, anarchy_action):
-        while True:
+    async def json_patch(self, patch):
+        if self.is_buffering_status:
+            await self.flush_status_patch()
+        await super().json_patch(patch)
+
+    async def json_patch_status(self, patch):
+        if not self.is_buffering_status:
+            await super().json_patch_status(patch)
+            return
+        self.apply_status_patch(patch)
+        self.status_patch.extend(patch)
+
+    @asynccontextmanager
+    async def locked(self):
+        """
+        Hold the subject lock within context, reentrant for the task which
+        holds it.
+        """
+        task = asyncio.current_task()
+        if self.lock_task is task:
+            yield
+            return
+        start = time.monotonic()
+        async with self.lock:
+            Metrics.subject_lock_wait.observe(time.monotonic() - start)
+            self.lock_task = task
             try:
-                patch = []
-                if anarchy_action.name == self.active_action_name:
-                    patch.append({
+                yield
+            finally:
+                self.lock_task = None
+
+    async def merge_patch(self, patch):
+        if self.is_buffering_status:
+            await self.flush_status_patch()
+        await super().merge_patch(patch)
+
+    async def merge_patch_status(self, patch):
+        if not self.is_buffering_status:
+            await super().merge_patch_status(patch)
+            return
+        # Only top level keys are merged, which is sufficient for status
+        await self.json_patch_status([
+            {"op": "remove", "path": f"/status/{key}"} if value is None else
+            {"op": "add", "path": f"/status/{key}", "value": value}
+            for key, value in patch.items()
+            if value is not None or key in self.status
+        ])
+
+    async def refresh(self, force=False):
+        if self.is_buffering_status:
+            await self.flush_status_patch()
+        await super().refresh(force=force)
+
+    async def remove_action_from_status(self, anarchy_action):
+        def build_patch():
+            if anarchy_action.name == self.active_action_name:
+                return [{
+                    "op": "remove",
+                    "path": "/status/activeAction",
+                }]
+            patch = []
+            for i, item in enumerate(self.pending_actions):
+                if item['name'] == anarchy_action.name:
+                    patch.insert(0, {
                         "op": "remove",
-                        "path": "/status/activeAction",
+                        "path": f"/status/pendingActions/{i}",
                     })
-                else:
-                    for i, item in enumerate(self.pending_actions):
-                        if item['name'] == anarchy_action.name:
-                            patch.insert(0, {
-                                "op": "remove",
-                                "path": f"/status/pendingActions/{i}",
-                            })
-                if patch:
-                    await self.json_patch_status(patch)
-                return
-            except kubernetes_asyncio.client.rest.ApiException as e:
-                if e.status == 422:
-                    await self.refresh()
-                elif e.status != 404:
-                    logging.error(f"Failed to apply {patch} to {self}")
-                    raise
+            return patch
+        try:
+            await self.update_status(build_patch)
+        except kubernetes_asyncio.client.rest.ApiException as e:
+            if e.status != 404:
+                raise
+            return
+        if not self.active_action_name and self.pending_actions:
+            # Next pending action may be waiting for the active action to clear
+            anarchyaction.AnarchyAction.schedule_manage_by_name(self.pending_actions[0]['name'])
 
     async def remove_anarchy_finalizers(self):
         """
@@ -582,26 +797,31 @@ class AnarchySubject(AnarchyCachedKopfObject):
             }])
 
     async def remove_run_from_status(self, anarchy_run):
-        if self.has_run_in_status(anarchy_run):
-            try:
-                if anarchy_run.name == self.active_run_name:
-                    await self.remove_active_run_from_status(anarchy_run)
-                else:
-                    await self.remove_queued_run_from_status(anarchy_run)
-            except kubernetes_asyncio.client.rest.ApiException as e:
-                if e.status != 404:
-                    raise
+        if not self.has_run_in_status(anarchy_run):
+            return
+        try:
+            if anarchy_run.name == self.active_run_name:
+                await self.remove_active_run_from_status(anarchy_run)
+            else:
+                await self.remove_queued_run_from_status(anarchy_run)
+        except kubernetes_asyncio.client.rest.ApiException as e:
+            if e.status != 404:
+                raise
 
     async def remove_active_run_from_status(self, anarchy_run):
-        try:
-            await self.json_patch_status([{
+        def build_patch():
+            if anarchy_run.name != self.active_run_name:
+                return
+            return [{
                 "op": "test",
                 "path": f"/status/runs/active/0/name",
                 "value": anarchy_run.name,
             }, {
                 "op": "remove",
                 "path": f"/status/runs/active/0",
-            }])
+            }]
+        try:
+            await self.update_status(build_patch)
         except kubernetes_asyncio.client.rest.ApiException as e:
             if e.status == 404:
                 return
@@ -610,9 +830,9 @@ class AnarchySubject(AnarchyCachedKopfObject):
         await self.set_active_run_pending()
 
     async def remove_queued_run_from_status(self, anarchy_run):
-        try:
+        def build_patch():
             patch = []
-            for i, entry in enumerate(self.status['runs']['active']):
+            for i, entry in enumerate(self.active_runs):
                 if entry['name'] == anarchy_run.name:
                     patch.insert(0, {
                         "op": "remove",
@@ -623,8 +843,9 @@ class AnarchySubject(AnarchyCachedKopfObject):
                         "path": f"/status/runs/active/{i}/name",
                         "value": anarchy_run.name,
                     })
-            if patch:
-                await self.json_patch_status(patch)
+            return patch
+        try:
+            await self.update_status(build_patch)
         except kubernetes_asyncio.client.rest.ApiException as e:
             if e.status == 404:
                 return
@@ -647,40 +868,91 @@ class AnarchySubject(AnarchyCachedKopfObject):
             }])
 
     async def set_run_status(self, status, status_message=None):
-        await self.merge_patch_status({
-            "runStatus": status,
-            "runStatusMessage": status_message,
-        })
+        def build_patch():
+            patch = [{
+                "op": "add",
+                "path": "/status/runStatus",
+                "value": status,
+            }]
+            if status_message is not None:
+                patch.append({
+                    "op": "add",
+                    "path": "/status/runStatusMessage",
+                    "value": status_message,
+                })
+            elif 'runStatusMessage' in self.status:
+                patch.append({
+                    "op": "remove",
+                    "path": "/status/runStatusMessage",
+                })
+            return patch
+        await self.update_status(build_patch)
 
     async def set_active_run_pending(self):
+        # Locked so that runs are not created while the active run changes
+        async with self.locked():
+            while True:
+                run_name = self.active_run_name
+                if not run_name:
+                    return
+                try:
+                    anarchy_run = await anarchyrun.AnarchyRun.get(run_name)
+
+                    if self.is_deleting \
+                    and not anarchy_run.is_delete_handler:
+                        await anarchy_run.set_to_canceled()
+                        logging.info("{anarchy_run} canceled because it is not related to pending delete")
+                        await self.remove_run_from_status(anarchy_run)
+                    else:
+                        if anarchy_run.has_action:
+                            anarchy_action = await anarchy_run.get_action()
+                        else:
+                            anarchy_action = None
+                        await anarchy_run.manage(self, anarchy_action)
+                        if anarchy_run.name == self.active_run_name:
+                            return anarchy_run
+                except kubernetes_asyncio.client.rest.ApiException as e:
+                    if e.status == 404:
+                        logging.warning(
+                            f"Attempted to set AnarchyRun {run_name} "
+                            f"in {self} to pending but it was not found."
+                        )
+                        await self.update_status(lambda: [{
+                            "op": "test",
+                            "path": "/status/runs/active/0/name",
+                            "value": run_name,
+                        }, {
+                            "op": "remove",
+                            "path": "/status/runs/active/0",
+                        }] if self.active_run_name == run_name else None)
+                    else:
+                        raise
+
+    async def update_status(self, build_patch):
+        """
+        Apply JSON patch returned by build_patch for the current state.
+
+        Outside of a buffered status patch the write is conditional on the
+        resourceVersion and the patch is rebuilt from refreshed state after a
+        conflict, so no lock is needed.
+        """
+        attempt = 0
         while True:
-            if not self.active_run_name:
+            patch = build_patch()
+            if not patch:
+                return
+            if self.is_buffering_status:
+                await self.json_patch_status(patch)
                 return
             try:
-                anarchy_run = await anarchyrun.AnarchyRun.get(self.active_run_name)
-
-                if self.is_deleting \
-                and not anarchy_run.is_delete_handler:
-                    await anarchy_run.set_to_canceled()
-                    logging.info("{anarchy_run} canceled because it is not related to pending delete")
-                    await self.remove_run_from_status(anarchy_run)
-                else:
-                    if anarchy_run.has_action:
-                        anarchy_action = await anarchy_run.get_action()
-                    else:
-                        anarchy_action = None
-                    await anarchy_run.manage(self, anarchy_action)
-                    if anarchy_run.name == self.active_run_name:
-                        return anarchy_run
+                await super().json_patch_status([{
+                    "op": "test",
+                    "path": "/metadata/resourceVersion",
+                    "value": self.metadata['resourceVersion'],
+                }, *patch])
+                return
             except kubernetes_asyncio.client.rest.ApiException as e:
-                if e.status == 404:
-                    logging.warning(
-                        f"Attempted to set AnarchyRun {self.active_run_name} "
-                        f"in {self} to pending but it was not found."
-                    )
-                    await self.json_patch_status([{
-                        "op": "remove",
-                        "path": "/status/runs/active/0",
-                    }])
-                else:
+                if e.status not in (409, 422) or attempt >= 4:
                     raise
+            attempt += 1
+            await super().refresh(force=True)
@@ -0,0 +1,107 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+
+class BoundedCache(OrderedDict):
+    """
+    Cache of objects by name with least recently used eviction.
+
+    Only objects for which evictable returns true and which are not pinned are
+    evicted. Object size is accounted with the sizeof function. A limit of 0
+    means unlimited.
+    """
+    # Limit on objects examined for eviction per insert or update
+    eviction_scan_limit = 100
+
+    def __init__(self, evictable=None, max_bytes=0, max_objects=0, sizeof=None):
+        super().__init__()
+        self.evictable = evictable
+        self.eviction_count = 0
+        self.max_bytes = max_bytes
+        self.max_objects = max_objects
+        self.pins = {}
+        self.sizeof = sizeof
+        self.sizes = {}
+        self.total_bytes = 0
+
+    def __delitem__(self, name):
+        super().__delitem__(name)
+        self.total_bytes -= self.sizes.pop(name, 0)
+
+    def __setitem__(self, name, obj):
+        super().__setitem__(name, obj)
+        self.updated(name)
+
+    def clear(self):
+        super().clear()
+        self.sizes.clear()
+        self.total_bytes = 0
+
+    @property
+    def is_over_limit(self):
+        return (
+            (self.max_objects and len(self) > self.max_objects) or
+            (self.max_bytes and self.total_bytes > self.max_bytes)
+        )
+
+    def evict(self, keep=None):
+        if not self.evictable or not self.is_over_limit:
+            return
+        for name in list(self.keys())[:self.eviction_scan_limit]:
+            if name == keep:
+                continue
+            if name in self.pins or not self.evictable(self[name]):
+                # In use, move to most recently used to avoid rescanning
+                self.move_to_end(name)
+                continue
+            self.pop(name)
+            self.eviction_count += 1
+            if not self.is_over_limit:
+                return
+
+    def pin(self, name):
+        self.pins[name] = self.pins.get(name, 0) + 1
+
+    @contextmanager
+    def pinned(self, name):
+        """
+        Prevent eviction of object by name within context.
+        """
+        self.pin(name)
+        try:
+            yield
+        finally:
+            self.unpin(name)
+
+    def pop(self, name, *args):
+        if name not in self:
+            return super().pop(name, *args)
+        obj = super().pop(name)
+        self.total_bytes -= self.sizes.pop(name, 0)
+        return obj
+
+    def touch(self, name):
+        """
+        Mark object as recently used.
+        """
+        if name in self:
+            self.move_to_end(name)
+
+    def unpin(self, name):
+        count = self.pins.get(name, 0) - 1
+        if count > 0:
+            self.pins[name] = count
+        else:
+            self.pins.pop(name, None)
+
+    def updated(self, name):
+        """
+        Update size accounting for object and evict if over limits.
+        """
+        if name not in self:
+            return
+        if self.sizeof:
+            size = self.sizeof(self[name])
+            self.total_bytes += size - self.sizes.get(name, 0)
+            self.sizes[name] = size
+        self.move_to_end(name)
+        self.evict(keep=name)
@@ -0,0 +1,157 @@
+import asyncio
+import kubernetes_asyncio
+import logging
+import pytimeparse
+
+from datetime import datetime, timedelta, timezone
+
+from anarchy import Anarchy
+from anarchygovernor import AnarchyGovernor
+from rate_limiter import RateLimiter
+from sharding import Sharding
+
+class GarbageCollector:
+    """
+    Periodically delete finished AnarchyActions and AnarchyRuns once the
+    retention period configured in their AnarchyGovernor has passed.
+
+    Objects are found by the finished label rather than tracked individually
+    and are deleted in rate-limited batches. Objects of governors which no
+    longer exist are removed after the default retention of one day.
+    """
+    default_retention_seconds = pytimeparse.parse('1d')
+    # Run labels which are deleted after removeSuccessfulRuns
+    run_finished_states = ('canceled', 'successful')
+    task = None
+
+    @classmethod
+    async def collect(cls):
+        if Sharding.enabled and not Sharding.owns(cls.__name__):
+            # Only one replica collects garbage when sharded
+            return
+        governor_names = []
+        for anarchy_governor in list(AnarchyGovernor.cache.values()):
+            governor_names.append(anarchy_governor.name)
+            await cls.collect_for_governor_selector(
+                governor_selector = f"{Anarchy.governor_label}={anarchy_governor.name}",
+                remove_finished_actions_after_seconds = anarchy_governor.remove_finished_actions_after_seconds,
+                remove_successful_runs_after_seconds = anarchy_governor.remove_successful_runs_after_seconds,
+            )
+        if governor_names:
+            governor_selector = f"{Anarchy.governor_label} notin ({','.join(sorted(governor_names))})"
+        else:
+            governor_selector = None
+        await cls.collect_for_governor_selector(
+            governor_selector = governor_selector,
+            remove_finished_actions_after_seconds = cls.default_retention_seconds,
+            remove_successful_runs_after_seconds = cls.default_retention_seconds,
+        )
+
+    @classmethod
+    async def collect_for_governor_selector(cls,
+        governor_selector,
+        remove_finished_actions_after_seconds,
+        remove_successful_runs_after_seconds,
+    ):
+        action_selector = Anarchy.finished_label
+        run_selector = f"{Anarchy.finished_label} in ({','.join(cls.run_finished_states)})"
+        if governor_selector:
+            action_selector = f"{action_selector},{governor_selector}"
+            run_selector = f"{run_selector},{governor_selector}"
+        await cls.collect_expired(
+            plural = 'anarchyactions',
+            label_selector = action_selector,
+            retention_seconds = remove_finished_actions_after_seconds,
+            timestamp_field = 'finishedTimestamp',
+        )
+        await cls.collect_expired(
+            plural = 'anarchyruns',
+            label_selector = run_selector,
+            retention_seconds = remove_successful_runs_after_seconds,
+            timestamp_field = 'runPostTimestamp',
+        )
+
+    @classmethod
+    async def collect_expired(cls, plural, label_selector, retention_seconds, timestamp_field):
+        if not retention_seconds:
+            # Nothing to check, delete everything matching in one request
+            await Anarchy.custom_objects_api.delete_collection_namespaced_custom_object(
+                group = Anarchy.domain,
+                label_selector = label_selector,
+                namespace = Anarchy.namespace,
+                plural = plural,
+                version = Anarchy.version,
+            )
+            return
+
+        expired_timestamp = (
+            datetime.now(timezone.utc) - timedelta(seconds=retention_seconds)
+        ).strftime('%FT%TZ')
+        expired_names = []
+        _continue = None
+        while True:
+            object_list = await Anarchy.custom_objects_api.list_namespaced_custom_object(
+                group = Anarchy.domain,
+                label_selector = label_selector,
+                limit = 100,
+                namespace = Anarchy.namespace,
+                plural = plural,
+                version = Anarchy.version,
+                _continue = _continue,
+            )
+            for definition in object_list['items']:
+                if 'deletionTimestamp' in definition['metadata']:
+                    continue
+                timestamp = definition.get('status', {}).get(timestamp_field)
+                # Timestamps are all in the same UTC format and so compare as strings
+                if timestamp and timestamp < expired_timestamp:
+                    expired_names.append(definition['metadata']['name'])
+            _continue = object_list['metadata'].get('continue')
+            if not _continue:
+                break
+
+        for i in range(0, len(expired_names), Anarchy.cleanup_batch_size):
+            if i > 0:
+                await asyncio.sleep(1)
+            await asyncio.gather(*[
+                cls.delete(plural, name)
+                for name in expired_names[i:i + Anarchy.cleanup_batch_size]
+            ])
+        if expired_names:
+            logging.info(f"Deleted {len(expired_names)} expired {plural}")
+
+    @classmethod
+    async def delete(cls, plural, name):
+        try:
+            await Anarchy.custom_objects_api.delete_namespaced_custom_object(
+                group = Anarchy.domain,
+                name = name,
+                namespace = Anarchy.namespace,
+                plural = plural,
+                version = Anarchy.version,
+            )
+        except kubernetes_asyncio.client.rest.ApiException as e:
+            if e.status != 404:
+                logging.exception(f"Failed to delete {plural} {name}")
+
+    @classmethod
+    async def on_cleanup(cls):
+        if cls.task:
+            cls.task.cancel()
+            await cls.task
+
+    @classmethod
+    async def on_startup(cls):
+        cls.task = asyncio.create_task(cls.run())
+
+    @classmethod
+    async def run(cls):
+        while True:
+            try:
+                await asyncio.sleep(Anarchy.cleanup_interval)
+                with RateLimiter.priority(RateLimiter.housekeeping):
+                    await cls.collect()
+            except asyncio.CancelledError:
+                return
+            except Exception:
+                logging.exception("Garbage collection failed")
@@ -0,0 +1,79 @@
+from bounded_cache import BoundedCache
+
+class IndexedCache(BoundedCache):
+    """
+    Cache of objects by name with secondary indexes.
+
+    Indexes are given as a dict of index name to a function which returns the
+    index value for an object or None if the object should not be indexed.
+    Objects must be reindexed when updated in place. Evicted objects are
+    removed from indexes, so lookups are only complete for objects which are
+    never evictable.
+    """
+    def __init__(self, indexes=None, **kwargs):
+        super().__init__(**kwargs)
+        self.indexers = indexes or {}
+        self.indexes = {index: {} for index in self.indexers}
+        self.indexed_values = {}
+
+    def __delitem__(self, name):
+        super().__delitem__(name)
+        self.unindex(name)
+
+    def clear(self):
+        super().clear()
+        self.indexed_values.clear()
+        for index in self.indexes.values():
+            index.clear()
+
+    def lookup(self, index, value):
+        """
+        Return list of objects with value in index.
+        """
+        return [self[name] for name in self.indexes[index].get(value, ())]
+
+    def pop(self, name, *args):
+        if name not in self:
+            return super().pop(name, *args)
+        obj = super().pop(name)
+        self.unindex(name)
+        return obj
+
+    def reindex(self, name):
+        obj = self.get(name)
+        if obj is None:
+            self.unindex(name)
+            return
+        old_values = self.indexed_values.get(name, {})
+        new_values = {}
+        for index, indexer in self.indexers.items():
+            value = indexer(obj)
+            if value is not None:
+                new_values[index] = value
+            old_value = old_values.get(index)
+            if old_value == value:
+                continue
+            if old_value is not None:
+                self.remove_from_index(index, old_value, name)
+            if value is not None:
+                self.indexes[index].setdefault(value, set()).add(name)
+        if new_values:
+            self.indexed_values[name] = new_values
+        else:
+            self.indexed_values.pop(name, None)
+
+    def remove_from_index(self, index, value, name):
+        names = self.indexes[index].get(value)
+        if names is None:
+            return
+        names.discard(name)
+        if not names:
+            del self.indexes[index][value]
+
+    def updated(self, name):
+        self.reindex(name)
+        super().updated(name)
+
+    def unindex(self, name):
+        for index, value in self.indexed_values.pop(name, {}).items():
+            self.remove_from_index(index, value, name)
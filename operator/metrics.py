@@ -0,0 +1,196 @@
+import functools
+import logging
+import prometheus_client
+import time
+
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from anarchy import Anarchy
+
+class Metrics:
+    """
+    Prometheus metrics for the operator served on Anarchy.metrics_port.
+
+    Cache and scheduler metrics are read from registered objects when
+    metrics are collected.
+    """
+    api_request_duration = prometheus_client.Histogram(
+        'anarchy_api_request_duration_seconds',
+        'Kubernetes API request duration',
+        ['verb', 'resource'],
+    )
+    api_request_errors = prometheus_client.Counter(
+        'anarchy_api_request_errors',
+        'Kubernetes API requests which failed',
+        ['verb', 'resource', 'status'],
+    )
+    cache_hits = prometheus_client.Counter(
+        'anarchy_cache_hits',
+        'Object cache lookups found in cache',
+        ['kind'],
+    )
+    cache_misses = prometheus_client.Counter(
+        'anarchy_cache_misses',
+        'Object cache lookups fetched from the API',
+        ['kind'],
+    )
+    caches = {}
+    daemons = prometheus_client.Gauge(
+        'anarchy_daemons',
+        'Running kopf daemons',
+        ['kind'],
+    )
+    handler_duration = prometheus_client.Histogram(
+        'anarchy_handler_duration_seconds',
+        'Handler duration',
+        ['kind', 'handler'],
+    )
+    handler_errors = prometheus_client.Counter(
+        'anarchy_handler_errors',
+        'Handler calls which raised an exception',
+        ['kind', 'handler'],
+    )
+    rate_limiter = None
+    rate_limiter_wait = prometheus_client.Histogram(
+        'anarchy_rate_limiter_wait_seconds',
+        'Time Kubernetes API writes waited for rate limiter',
+        ['priority'],
+        buckets = (0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+    )
+    schedulers = []
+    subject_lock_wait = prometheus_client.Histogram(
+        'anarchy_subject_lock_wait_seconds',
+        'Time waiting to acquire AnarchySubject lock',
+        buckets = (0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+    )
+
+    @classmethod
+    def api_request_labels(cls, resource_path, method, path_params, query_params):
+        """
+        Return verb and resource labels for API request path template.
+        """
+        path_params = path_params or {}
+        segments = resource_path.split('/')
+        if '{namespace}' in segments and segments.index('{namespace}') + 1 < len(segments):
+            resource = segments[segments.index('{namespace}') + 1]
+        else:
+            resource = segments[-1]
+        if resource == '{plural}':
+            resource = path_params.get('plural', resource)
+        if segments[-1] in ('log', 'status'):
+            resource = f"{resource}/{segments[-1]}"
+
+        has_name = '{name}' in segments
+        if method == 'GET':
+            if has_name:
+                verb = 'get'
+            elif any(key == 'watch' and value for key, value in query_params or []):
+                verb = 'watch'
+            else:
+                verb = 'list'
+        elif method == 'DELETE':
+            verb = 'delete' if has_name else 'deletecollection'
+        else:
+            verb = {
+                'PATCH': 'patch',
+                'POST': 'create',
+                'PUT': 'update',
+            }.get(method, method.lower())
+        return verb, resource
+
+    @classmethod
+    def instrument_api_client(cls, api_client):
+        """
+        Count and time requests made through API client.
+        """
+        call_api = api_client.call_api
+
+        async def instrumented_call_api(resource_path, method, path_params=None, query_params=None, *args, **kwargs):
+            verb, resource = cls.api_request_labels(resource_path, method, path_params, query_params)
+            start = time.monotonic()
+            try:
+                return await call_api(resource_path, method, path_params, query_params, *args, **kwargs)
+            except Exception as e:
+                cls.api_request_errors.labels(verb, resource, getattr(e, 'status', None) or 'error').inc()
+                raise
+            finally:
+                cls.api_request_duration.labels(verb, resource).observe(time.monotonic() - start)
+
+        api_client.call_api = instrumented_call_api
+
+    @classmethod
+    async def on_startup(cls):
+        cls.instrument_api_client(Anarchy.api_client)
+        if Anarchy.metrics_port:
+            prometheus_client.start_http_server(Anarchy.metrics_port)
+            logging.info(f"Serving metrics on port {Anarchy.metrics_port}")
+
+    @classmethod
+    def register_cache(cls, kind, cache):
+        cls.caches[kind] = cache
+
+    @classmethod
+    def register_rate_limiter(cls, rate_limiter):
+        cls.rate_limiter = rate_limiter
+
+    @classmethod
+    def register_scheduler(cls, scheduler):
+        cls.schedulers.append(scheduler)
+
+    @classmethod
+    def timed_handler(cls, kind, handler):
+        """
+        Decorator to record duration and errors of async handler.
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                start = time.monotonic()
+                try:
+                    return await func(*args, **kwargs)
+                except Exception:
+                    cls.handler_errors.labels(kind, handler).inc()
+                    raise
+                finally:
+                    cls.handler_duration.labels(kind, handler).observe(time.monotonic() - start)
+            return wrapper
+        return decorator
+
+class MetricsCollector:
+    def collect(self):
+        cache_bytes = GaugeMetricFamily(
+            'anarchy_cache_bytes', 'Approximate size of cached objects', labels=['kind']
+        )
+        cache_evictions = CounterMetricFamily(
+            'anarchy_cache_evictions', 'Objects evicted from cache', labels=['kind']
+        )
+        cache_objects = GaugeMetricFamily(
+            'anarchy_cache_objects', 'Objects in cache', labels=['kind']
+        )
+        rate_limiter_queue_depth = GaugeMetricFamily(
+            'anarchy_rate_limiter_queue_depth', 'Kubernetes API writes waiting for rate limiter', labels=['priority']
+        )
+        scheduler_running = GaugeMetricFamily(
+            'anarchy_scheduler_running', 'Scheduler callbacks in progress', labels=['scheduler']
+        )
+        scheduler_scheduled = GaugeMetricFamily(
+            'anarchy_scheduler_scheduled', 'Keys waiting in scheduler', labels=['scheduler']
+        )
+        for kind, cache in Metrics.caches.items():
+            cache_bytes.add_metric([kind], getattr(cache, 'total_bytes', 0))
+            cache_evictions.add_metric([kind], getattr(cache, 'eviction_count', 0))
+            cache_objects.add_metric([kind], len(cache))
+        if Metrics.rate_limiter:
+            for priority, depth in Metrics.rate_limiter.queue_depth().items():
+                rate_limiter_queue_depth.add_metric([priority], depth)
+        for scheduler in Metrics.schedulers:
+            scheduler_running.add_metric([scheduler.name], len(scheduler.running))
+            scheduler_scheduled.add_metric([scheduler.name], len(scheduler))
+        yield cache_bytes
+        yield cache_evictions
+        yield cache_objects
+        yield rate_limiter_queue_depth
+        yield scheduler_running
+        yield scheduler_scheduled
+
+prometheus_client.REGISTRY.register(MetricsCollector())
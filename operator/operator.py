@@ -2,7 +2,6 @@
 
 import asyncio
 import kopf
-import kubernetes_asyncio
 import logging
 
 from anarchy import Anarchy
@@ -12,12 +11,26 @@ from anarchyaction import AnarchyAction
 from anarchyrun import AnarchyRun
 from anarchyrunner import AnarchyRunner
 from configure_kopf_logging import configure_kopf_logging
+from garbage_collector import GarbageCollector
 from infinite_relative_backoff import InfiniteRelativeBackoff
+from metrics import Metrics
+from rate_limiter import RateLimiter
+from resume_queue import ResumeQueue
+from runner_pod import RunnerPod
+from sharding import Sharding
 
 @kopf.on.startup()
 async def on_startup(settings: kopf.OperatorSettings, logger, **_):
     await Anarchy.on_startup()
+    await Metrics.on_startup()
+    await RateLimiter.on_startup()
     await AnarchyGovernor.preload()
+    await Sharding.on_startup()
+    await AnarchySubject.on_startup()
+    await AnarchyAction.on_startup()
+    await AnarchyRun.on_startup()
+    await ResumeQueue.on_startup()
+    await GarbageCollector.on_startup()
 
     # Never give up from network errors
     settings.networking.error_backoffs = InfiniteRelativeBackoff()
@@ -41,9 +54,17 @@ async def on_startup(settings: kopf.OperatorSettings, logger, **_):
 
 @kopf.on.cleanup()
 async def on_cleanup(**_):
+    await GarbageCollector.on_cleanup()
+    await ResumeQueue.on_cleanup()
+    await AnarchyAction.on_cleanup()
+    await AnarchyRun.on_cleanup()
+    await AnarchySubject.on_cleanup()
+    await Sharding.on_cleanup()
+    await RateLimiter.on_cleanup()
     await Anarchy.on_cleanup()
 
 @kopf.on.event(Anarchy.domain, Anarchy.version, 'anarchygovernors')
+@Metrics.timed_handler('AnarchyGovernor', 'event')
 async def governor_event(event, logger, **_):
     await AnarchyGovernor.handle_event(event)
 
@@ -52,24 +73,28 @@ async def governor_event(event, logger, **_):
     Anarchy.domain, Anarchy.version, 'anarchysubjects',
     labels={Anarchy.ignore_label: kopf.ABSENT},
 )
+@Metrics.timed_handler('AnarchySubject', 'create')
 async def subject_create(**kwargs):
     anarchy_subject = AnarchySubject.load(**kwargs)
-    async with anarchy_subject.lock:
+    async with anarchy_subject.critical_section():
         await anarchy_subject.handle_create()
 
 @kopf.on.delete(
     Anarchy.domain, Anarchy.version, 'anarchysubjects',
     labels={Anarchy.ignore_label: kopf.ABSENT},
 )
+@Metrics.timed_handler('AnarchySubject', 'delete')
+@RateLimiter.prioritized(RateLimiter.critical)
 async def subject_delete(**kwargs):
     anarchy_subject = AnarchySubject.load(**kwargs)
-    async with anarchy_subject.lock:
+    async with anarchy_subject.critical_section():
         await anarchy_subject.handle_delete()
 
 @kopf.on.resume(
     Anarchy.domain, Anarchy.version, 'anarchysubjects',
     labels={Anarchy.ignore_label: kopf.ABSENT},
 )
+@Metrics.timed_handler('AnarchySubject', 'resume')
 async def subject_resume(meta, name, **kwargs):
     if 'deletionTimestamp' in meta \
     and Anarchy.domain not in meta['finalizers'] \
@@ -78,23 +103,25 @@ async def subject_resume(meta, name, **kwargs):
         return
 
     anarchy_subject = AnarchySubject.load(meta=meta, name=name, **kwargs)
-    async with anarchy_subject.lock:
-        await anarchy_subject.handle_resume()
+    if anarchy_subject.resume_required:
+        ResumeQueue.add(str(anarchy_subject), anarchy_subject.handle_resume)
 
 @kopf.on.update(
     Anarchy.domain, Anarchy.version, 'anarchysubjects',
     labels={Anarchy.ignore_label: kopf.ABSENT},
 )
+@Metrics.timed_handler('AnarchySubject', 'update')
 async def subject_update(new, old, **kwargs):
     anarchy_subject = AnarchySubject.load(**kwargs)
     if old['spec'] != new['spec']:
-        async with anarchy_subject.lock:
+        async with anarchy_subject.critical_section():
             await anarchy_subject.handle_update(previous_state=old)
 
 @kopf.on.event(
     Anarchy.domain, Anarchy.version, 'anarchysubjects',
     labels={Anarchy.ignore_label: kopf.ABSENT},
 )
+@Metrics.timed_handler('AnarchySubject', 'event')
 async def subject_event(event, **_):
     obj = event.get('object')
     if not obj or obj.get('apiVersion') != Anarchy.api_version:
@@ -105,8 +132,8 @@ async def subject_event(event, **_):
     finalizers = metadata.get('finalizers', [])
 
     if event['type'] == 'DELETED':
-        logging.info(f"Remove deleted AnarchySubject {name} from cache")
-        AnarchySubject.cache.pop(name, None)
+        # Removed from cache by AnarchySubject watch
+        pass
     elif Anarchy.domain in finalizers:
         # Subject is still handled through kopf framework
         pass
@@ -115,8 +142,9 @@ async def subject_event(event, **_):
         # This should only happen during delete handling.
         if 'deletionTimestamp' in metadata:
             anarchy_subject = AnarchySubject.load_definition(obj)
-            async with anarchy_subject.lock:
-                await anarchy_subject.handle_post_delete_event()
+            with RateLimiter.priority(RateLimiter.critical):
+                async with anarchy_subject.critical_section():
+                    await anarchy_subject.handle_post_delete_event()
         else:
             logging.error(
                 f"AnarchySubject {name} does not have {Anarchy.domain} label "
@@ -130,6 +158,7 @@ async def subject_event(event, **_):
     Anarchy.domain, Anarchy.version, 'anarchyactions',
     labels={Anarchy.ignore_label: kopf.ABSENT},
 )
+@Metrics.timed_handler('AnarchyAction', 'create')
 async def action_create(**kwargs):
     anarchy_action = AnarchyAction.load(**kwargs)
     anarchy_subject = await anarchy_action.get_subject()
@@ -145,13 +174,15 @@ async def action_create(**kwargs):
             delay=30
         )
 
-    async with anarchy_subject.lock:
-        await anarchy_action.handle_create(anarchy_subject)
+    await anarchy_action.handle_create(anarchy_subject)
+    anarchy_action.schedule_manage()
 
 @kopf.on.delete(
     Anarchy.domain, Anarchy.version, 'anarchyactions',
     labels={Anarchy.ignore_label: kopf.ABSENT},
 )
+@Metrics.timed_handler('AnarchyAction', 'delete')
+@RateLimiter.prioritized(RateLimiter.housekeeping)
 async def action_delete(**kwargs):
     anarchy_action = AnarchyAction.load(**kwargs)
     anarchy_action.remove_from_cache()
@@ -166,13 +197,13 @@ async def action_delete(**kwargs):
             delay=30
         )
 
-    async with anarchy_subject.lock:
-        await anarchy_action.handle_delete(anarchy_subject)
+    await anarchy_action.handle_delete(anarchy_subject)
 
 @kopf.on.resume(
     Anarchy.domain, Anarchy.version, 'anarchyactions',
     labels={Anarchy.ignore_label: kopf.ABSENT},
 )
+@Metrics.timed_handler('AnarchyAction', 'resume')
 async def action_resume(**kwargs):
     anarchy_action = AnarchyAction.load(**kwargs)
     anarchy_subject = await anarchy_action.get_subject()
@@ -188,13 +219,15 @@ async def action_resume(**kwargs):
             delay=30
         )
 
-    async with anarchy_subject.lock:
-        await anarchy_action.handle_resume(anarchy_subject)
+    if anarchy_action.resume_required(anarchy_subject):
+        ResumeQueue.add(str(anarchy_action), lambda: anarchy_action.handle_resume(anarchy_subject))
+    anarchy_action.schedule_manage()
 
 @kopf.on.update(
     Anarchy.domain, Anarchy.version, 'anarchyactions',
     labels={Anarchy.ignore_label: kopf.ABSENT},
 )
+@Metrics.timed_handler('AnarchyAction', 'update')
 async def action_update(**kwargs):
     anarchy_action = AnarchyAction.load(**kwargs)
     anarchy_subject = await anarchy_action.get_subject()
@@ -212,43 +245,16 @@ async def action_update(**kwargs):
             delay=30
         )
 
-    async with anarchy_subject.lock:
-        await anarchy_action.handle_update(anarchy_subject)
-
-@kopf.daemon(
-    Anarchy.domain, Anarchy.version, 'anarchyactions',
-    cancellation_timeout=1,
-    labels={Anarchy.ignore_label: kopf.ABSENT},
-)
-async def action_daemon(stopped, **kwargs):
-    anarchy_action = AnarchyAction.load(**kwargs)
-    anarchy_subject = await anarchy_action.get_subject()
-    if not anarchy_subject:
-        await anarchy_action.raise_error_if_still_exists(
-            f"{anarchy_action} references missing AnarchySubject {anarchy_action.subject_name}"
-        )
-        return
-
-    try:
-        while not stopped:
-            async with anarchy_subject.lock:
-                await anarchy_subject.refresh()
-                if anarchy_subject.ignore:
-                    raise kopf.TemporaryError(
-                        f"Refusing to handle {anarchy_action} when {anarchy_subject} is marked with ignore",
-                        delay=30
-                    )
-                sleep_interval = await anarchy_action.manage(anarchy_subject)
-            if sleep_interval:
-                await asyncio.sleep(sleep_interval)
-    except asyncio.CancelledError:
-        pass
+    await anarchy_action.handle_update(anarchy_subject)
+    anarchy_action.schedule_manage()
 
 
 @kopf.on.delete(
     Anarchy.domain, Anarchy.version, 'anarchyruns',
     labels={Anarchy.ignore_label: kopf.ABSENT},
 )
+@Metrics.timed_handler('AnarchyRun', 'delete')
+@RateLimiter.prioritized(RateLimiter.housekeeping)
 async def run_delete(**kwargs):
     anarchy_run = AnarchyRun.load(**kwargs)
     anarchy_run.remove_from_cache()
@@ -274,13 +280,13 @@ async def run_delete(**kwargs):
             delay=30
         )
 
-    async with anarchy_subject.lock:
-        await anarchy_run.handle_delete(anarchy_subject, anarchy_action)
+    await anarchy_run.handle_delete(anarchy_subject, anarchy_action)
 
 @kopf.on.resume(
     Anarchy.domain, Anarchy.version, 'anarchyruns',
     labels={Anarchy.ignore_label: kopf.ABSENT},
 )
+@Metrics.timed_handler('AnarchyRun', 'resume')
 async def run_resume(**kwargs):
     anarchy_run = AnarchyRun.load(**kwargs)
     anarchy_subject = await anarchy_run.get_subject()
@@ -311,13 +317,14 @@ async def run_resume(**kwargs):
             delay=30
         )
 
-    async with anarchy_subject.lock:
-        await anarchy_run.handle_resume(anarchy_subject, anarchy_action)
+    if anarchy_run.resume_required(anarchy_subject):
+        ResumeQueue.add(str(anarchy_run), lambda: anarchy_run.handle_resume(anarchy_subject, anarchy_action))
 
 @kopf.on.update(
     Anarchy.domain, Anarchy.version, 'anarchyruns',
     labels={Anarchy.ignore_label: kopf.ABSENT},
 )
+@Metrics.timed_handler('AnarchyRun', 'update')
 async def run_update(new, old, **kwargs):
     anarchy_run = AnarchyRun.load(**kwargs)
     anarchy_subject = await anarchy_run.get_subject()
@@ -354,77 +361,28 @@ async def run_update(new, old, **kwargs):
 
     new_runner_state = new['metadata'].get('labels', {}).get(Anarchy.runner_label)
     old_runner_state = old['metadata'].get('labels', {}).get(Anarchy.runner_label)
-    async with anarchy_subject.lock:
-        if new_runner_state != old_runner_state:
-            if new_runner_state == 'canceled':
-                await anarchy_run.handle_canceled(anarchy_subject, anarchy_action)
-            elif new_runner_state == 'failed':
-                await anarchy_run.handle_failed(anarchy_subject, anarchy_action)
-            elif new_runner_state == 'lost':
-                await anarchy_run.handle_lost(anarchy_subject, anarchy_action)
-            elif new_runner_state == 'pending':
-                await anarchy_run.handle_pending(anarchy_subject, anarchy_action)
-            elif new_runner_state == 'queued':
-                logging.error(f"{anarchy_run} returned to state queued?")
-            elif new_runner_state == 'successful':
-                await anarchy_run.handle_success(anarchy_subject, anarchy_action)
-            else:
-                await anarchy_run.handle_running(anarchy_subject, anarchy_action)
-
-@kopf.daemon(
-    Anarchy.domain, Anarchy.version, 'anarchyruns',
-    cancellation_timeout=1,
-    labels={Anarchy.ignore_label: kopf.ABSENT},
-)
-async def run_daemon(stopped, **kwargs):
-    anarchy_run = AnarchyRun.load(**kwargs)
-    anarchy_subject = await anarchy_run.get_subject()
-    if not anarchy_subject:
-        await anarchy_run.raise_error_if_still_exists(
-            f"{anarchy_run} references missing AnarchySubject {anarchy_run.subject_name}"
-        )
-        return
-    if anarchy_subject.ignore:
-        raise kopf.TemporaryError(
-            f"Refusing to handle {anarchy_run} when {anarchy_subject} is marked with ignore",
-            delay=30
-        )
-
-    if anarchy_run.has_action:
-        anarchy_action = await anarchy_run.get_action()
-        if not anarchy_action:
-            await anarchy_run.raise_error_if_still_exists(
-                f"{anarchy_run} references missing AnarchyAction {anarchy_run.action_name}"
-            )
-            return
-    else:
-        anarchy_action = None
-
-    try:
-        while not stopped:
-            await anarchy_run.refresh()
-            await anarchy_subject.refresh()
-            if anarchy_run.ignore or anarchy_subject.ignore:
-                return
-            if anarchy_action:
-                await anarchy_action.refresh()
-                if anarchy_action.ignore:
-                    raise kopf.TemporaryError(
-                        f"Refusing to handle {anarchy_run} when {anarchy_action} is marked with ignore",
-                        delay=30
-                    )
-            async with anarchy_subject.lock:
-                sleep_interval = await anarchy_run.manage(anarchy_subject, anarchy_action)
-            if sleep_interval:
-                await asyncio.sleep(sleep_interval)
-    except asyncio.CancelledError:
-        pass
+    if new_runner_state != old_runner_state:
+        if new_runner_state == 'canceled':
+            await anarchy_run.handle_canceled(anarchy_subject, anarchy_action)
+        elif new_runner_state == 'failed':
+            await anarchy_run.handle_failed(anarchy_subject, anarchy_action)
+        elif new_runner_state == 'lost':
+            await anarchy_run.handle_lost(anarchy_subject, anarchy_action)
+        elif new_runner_state == 'pending':
+            await anarchy_run.handle_pending(anarchy_subject, anarchy_action)
+        elif new_runner_state == 'queued':
+            logging.error(f"{anarchy_run} returned to state queued?")
+        elif new_runner_state == 'successful':
+            await anarchy_run.handle_success(anarchy_subject, anarchy_action)
+        else:
+            await anarchy_run.handle_running(anarchy_subject, anarchy_action)
 
 if not Anarchy.running_all_in_one:
     @kopf.on.create(
         Anarchy.domain, Anarchy.version, 'anarchyrunners',
         labels={Anarchy.ignore_label: kopf.ABSENT},
     )
+    @Metrics.timed_handler('AnarchyRunner', 'create')
     async def runner_create(logger, **kwargs):
         anarchy_runner = AnarchyRunner.load(**kwargs)
         async with anarchy_runner.lock:
@@ -434,6 +392,7 @@ if not Anarchy.running_all_in_one:
         Anarchy.domain, Anarchy.version, 'anarchyrunners',
         labels={Anarchy.ignore_label: kopf.ABSENT},
     )
+    @Metrics.timed_handler('AnarchyRunner', 'delete')
     async def runner_delete(logger, **kwargs):
         anarchy_runner = AnarchyRunner.load(**kwargs)
         async with anarchy_runner.lock:
@@ -443,6 +402,7 @@ if not Anarchy.running_all_in_one:
         Anarchy.domain, Anarchy.version, 'anarchyrunners',
         labels={Anarchy.ignore_label: kopf.ABSENT},
     )
+    @Metrics.timed_handler('AnarchyRunner', 'resume')
     async def runner_resume(logger, **kwargs):
         anarchy_runner = AnarchyRunner.load(**kwargs)
         async with anarchy_runner.lock:
@@ -452,6 +412,7 @@ if not Anarchy.running_all_in_one:
         Anarchy.domain, Anarchy.version, 'anarchyrunners',
         labels={Anarchy.ignore_label: kopf.ABSENT},
     )
+    @Metrics.timed_handler('AnarchyRunner', 'update')
     async def runner_update(logger, **kwargs):
         anarchy_runner = AnarchyRunner.load(**kwargs)
         async with anarchy_runner.lock:
@@ -464,33 +425,35 @@ if not Anarchy.running_all_in_one:
     )
     async def runner_daemon(logger, stopped, **kwargs):
         anarchy_runner = AnarchyRunner.load(**kwargs)
-        while not stopped:
-            try:
-                async with anarchy_runner.lock:
-                    await anarchy_runner.manage_pods(logger=logger)
-                await asyncio.sleep(anarchy_runner.scaling_check_interval)
-            except asyncio.CancelledError:
-                pass
-            except Exception:
-                logger.exception(f"Exception in daemon for {anarchy_runner}")
+        with Metrics.daemons.labels('AnarchyRunner').track_inprogress():
+            while not stopped:
+                try:
+                    async with anarchy_runner.lock:
+                        await anarchy_runner.manage_pods(logger=logger)
+                    await asyncio.sleep(anarchy_runner.scaling_check_interval)
+                except asyncio.CancelledError:
+                    pass
+                except Exception:
+                    logger.exception(f"Exception in daemon for {anarchy_runner}")
 
     @kopf.on.event('pods', labels={Anarchy.runner_label: kopf.PRESENT})
+    @Metrics.timed_handler('Pod', 'event')
     async def runner_pod_event(event, logger, **_):
         obj = event.get('object')
         if not obj or obj.get('kind') != 'Pod':
             logging.warning(f"Weird event {event}")
             return
 
-        pod = Anarchy.k8s_obj_from_dict(obj, kubernetes_asyncio.client.V1Pod)
-        anarchy_runner_name = pod.metadata.labels[Anarchy.runner_label]
+        pod = RunnerPod(obj)
+        anarchy_runner_name = pod.runner_name
         anarchy_runner = await AnarchyRunner.get(anarchy_runner_name)
         if not anarchy_runner:
-            logger.warning(f"AnarchyRunner {anarchy_runner_name} not found for Pod {pod.metadata.name}")
+            logger.warning(f"AnarchyRunner {anarchy_runner_name} not found for {pod}")
             return
         if anarchy_runner.ignore:
             return
         async with anarchy_runner.lock:
             if event['type'] == 'DELETED':
                 await anarchy_runner.handle_runner_pod_deleted(pod=pod, logger=logger)
-            elif Anarchy.runner_terminating_label not in pod.metadata.labels:
+            elif not pod.is_marked_for_termination:
                 await anarchy_runner.handle_runner_pod_event(pod=pod, logger=logger)
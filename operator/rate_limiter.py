@@ -0,0 +1,136 @@
+import asyncio
+import contextlib
+import contextvars
+import functools
+import heapq
+import itertools
+import time
+
+from anarchy import Anarchy
+from metrics import Metrics
+
+class RateLimiter:
+    """
+    Token bucket for Kubernetes API writes made through Anarchy.api_client.
+
+    Writes take a token, refilled at Anarchy.kube_write_rate per second up to
+    Anarchy.kube_write_burst. When tokens run out writes wait and are released
+    in priority order so that delete handling and run results go ahead of
+    cleanup and status housekeeping. Reads are not limited.
+    """
+    critical = 0
+    normal = 1
+    housekeeping = 2
+    priority_names = ('critical', 'normal', 'housekeeping')
+
+    current_priority = contextvars.ContextVar('rate_limiter_priority', default=normal)
+    release_task = None
+    sequence = itertools.count()
+    tokens = 0
+    updated = 0
+    waiters = []
+    write_methods = ('DELETE', 'PATCH', 'POST', 'PUT')
+
+    @classmethod
+    async def acquire(cls, priority=None):
+        if not Anarchy.kube_write_rate:
+            return
+        if priority is None:
+            priority = cls.current_priority.get()
+        cls.refill()
+        if not cls.waiters and cls.tokens >= 1:
+            cls.tokens -= 1
+            Metrics.rate_limiter_wait.labels(cls.priority_names[priority]).observe(0)
+            return
+
+        start = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(cls.waiters, (priority, next(cls.sequence), future))
+        if not cls.release_task or cls.release_task.done():
+            cls.release_task = asyncio.create_task(cls.release_waiters())
+        await future
+        Metrics.rate_limiter_wait.labels(cls.priority_names[priority]).observe(time.monotonic() - start)
+
+    @classmethod
+    def instrument_api_client(cls, api_client):
+        """
+        Acquire token before each write request made through API client.
+        """
+        call_api = api_client.call_api
+
+        async def rate_limited_call_api(resource_path, method, *args, **kwargs):
+            if method in cls.write_methods:
+                await cls.acquire()
+            return await call_api(resource_path, method, *args, **kwargs)
+
+        api_client.call_api = rate_limited_call_api
+
+    @classmethod
+    async def on_cleanup(cls):
+        if cls.release_task:
+            cls.release_task.cancel()
+        for priority, sequence, future in cls.waiters:
+            future.cancel()
+        cls.waiters.clear()
+
+    @classmethod
+    async def on_startup(cls):
+        cls.tokens = Anarchy.kube_write_burst
+        cls.updated = time.monotonic()
+        Metrics.register_rate_limiter(cls)
+        cls.instrument_api_client(Anarchy.api_client)
+
+    @classmethod
+    @contextlib.contextmanager
+    def priority(cls, priority):
+        """
+        Set priority for writes made in this context and tasks it creates.
+        """
+        token = cls.current_priority.set(priority)
+        try:
+            yield
+        finally:
+            cls.current_priority.reset(token)
+
+    @classmethod
+    def prioritized(cls, priority):
+        """
+        Decorator to set write priority for async handler.
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with cls.priority(priority):
+                    return await func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @classmethod
+    def queue_depth(cls):
+        """
+        Return count of waiting writes by priority name.
+        """
+        depth = {name: 0 for name in cls.priority_names}
+        for priority, sequence, future in cls.waiters:
+            if not future.done():
+                depth[cls.priority_names[priority]] += 1
+        return depth
+
+    @classmethod
+    def refill(cls):
+        now = time.monotonic()
+        cls.tokens = min(Anarchy.kube_write_burst, cls.tokens + (now - cls.updated) * Anarchy.kube_write_rate)
+        cls.updated = now
+
+    @classmethod
+    async def release_waiters(cls):
+        while cls.waiters:
+            cls.refill()
+            if cls.tokens < 1:
+                await asyncio.sleep((1 - cls.tokens) / Anarchy.kube_write_rate)
+                continue
+            priority, sequence, future = heapq.heappop(cls.waiters)
+            # Cancelled writes do not use a token
+            if not future.done():
+                cls.tokens -= 1
+                future.set_result(None)
@@ -0,0 +1,72 @@
+import asyncio
+import logging
+
+from anarchy import Anarchy
+
+class ResumeQueue:
+    """
+    Rate limited queue for resume handling.
+
+    On startup kopf resumes every object at once. Resume handlers check
+    cached state and only queue objects which need changes, which are then
+    processed at Anarchy.resume_rate per second. Create, update, and delete
+    handling is not queued and so is never delayed behind the backlog.
+    """
+    error_delay = 30
+    keys = set()
+    queue = None
+    task = None
+    tasks = set()
+
+    @classmethod
+    def add(cls, key, callback):
+        """
+        Queue callback to resume object identified by key unless it is
+        already queued.
+        """
+        if key in cls.keys:
+            return
+        cls.keys.add(key)
+        cls.queue.put_nowait((key, callback))
+
+    @classmethod
+    async def on_cleanup(cls):
+        if cls.task:
+            cls.task.cancel()
+            await cls.task
+        for task in list(cls.tasks):
+            task.cancel()
+
+    @classmethod
+    async def on_startup(cls):
+        cls.queue = asyncio.Queue()
+        cls.task = asyncio.create_task(cls.run())
+
+    @classmethod
+    async def process(cls, key, callback):
+        cls.keys.discard(key)
+        try:
+            await callback()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # kopf.TemporaryError and similar exceptions carry a retry delay
+            delay = getattr(e, 'delay', None) or cls.error_delay
+            if hasattr(e, 'delay'):
+                logging.warning(f"Resume {key}: {e}")
+            else:
+                logging.exception(f"Exception resuming {key}")
+            asyncio.get_running_loop().call_later(delay, cls.add, key, callback)
+
+    @classmethod
+    async def run(cls):
+        interval = 1 / Anarchy.resume_rate
+        while True:
+            try:
+                key, callback = await cls.queue.get()
+                task = asyncio.create_task(cls.process(key, callback))
+                cls.tasks.add(task)
+                task.add_done_callback(cls.tasks.discard)
+                await asyncio.sleep(interval)
+            except asyncio.CancelledError:
+                return
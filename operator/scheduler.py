@@ -0,0 +1,119 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+class Scheduler:
+    """
+    Priority queue of deadlines which calls back only for keys that are due.
+
+    The callback is called with the key and returns the number of seconds
+    until the key should be processed again or None to stop scheduling it.
+    """
+    def __init__(self, name, callback, concurrency=50, error_delay=30):
+        self.callback = callback
+        self.concurrency = concurrency
+        self.counter = itertools.count()
+        self.deadlines = {}
+        self.error_delay = error_delay
+        self.heap = []
+        self.name = name
+        self.running = set()
+        self.semaphore = None
+        self.task = None
+        self.tasks = set()
+        self.wakeup = None
+
+    def __contains__(self, key):
+        return key in self.deadlines or key in self.running
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def __str__(self):
+        return f"Scheduler {self.name}"
+
+    def cancel(self, key):
+        self.deadlines.pop(key, None)
+
+    def schedule(self, key, delay=0):
+        """
+        Schedule key to be processed after delay seconds unless it is already
+        scheduled to be processed sooner.
+        """
+        deadline = time.monotonic() + max(delay, 0)
+        current_deadline = self.deadlines.get(key)
+        if current_deadline is not None and current_deadline <= deadline:
+            return
+        self.deadlines[key] = deadline
+        heapq.heappush(self.heap, (deadline, next(self.counter), key))
+        if self.wakeup and self.heap[0][2] == key:
+            self.wakeup.set()
+
+    async def start(self):
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.wakeup = asyncio.Event()
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        tasks = list(self.tasks)
+        for task in tasks:
+            task.cancel()
+        # Wait for cancelled dispatches to finish before cleanup continues
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def dispatch(self, key):
+        delay = None
+        try:
+            async with self.semaphore:
+                delay = await self.callback(key)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # kopf.TemporaryError and similar exceptions carry a retry delay
+            delay = getattr(e, 'delay', None) or self.error_delay
+            if hasattr(e, 'delay'):
+                logging.warning(f"{self} {key}: {e}")
+            else:
+                logging.exception(f"{self} exception processing {key}")
+        finally:
+            self.running.discard(key)
+
+        if key in self.deadlines:
+            # Rescheduled while running, the heap entry may have been discarded
+            heapq.heappush(self.heap, (self.deadlines[key], next(self.counter), key))
+            self.wakeup.set()
+        if delay is not None:
+            self.schedule(key, delay)
+
+    async def run(self):
+        while True:
+            now = time.monotonic()
+            while self.heap and self.heap[0][0] <= now:
+                deadline, _, key = heapq.heappop(self.heap)
+                if self.deadlines.get(key) != deadline:
+                    # Stale entry, key was rescheduled or canceled
+                    continue
+                if key in self.running:
+                    # Processed again when current callback completes
+                    continue
+                del self.deadlines[key]
+                self.running.add(key)
+                task = asyncio.create_task(self.dispatch(key))
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+
+            timeout = self.heap[0][0] - now if self.heap else None
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
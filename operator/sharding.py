@@ -0,0 +1,164 @@
+import asyncio
+import bisect
+import hashlib
+import kubernetes_asyncio
+import logging
+import os
+
+from datetime import datetime, timedelta, timezone
+
+from anarchy import Anarchy
+
+class Sharding:
+    """
+    Assign subjects to operator replicas by consistent hash of subject name.
+
+    Each replica maintains a Lease labeled with the shard group. Replicas with
+    unexpired leases form the hash ring, so ownership is rebalanced when
+    replicas join or leave. Actions and runs are owned by the replica which
+    owns their subject.
+    """
+    enabled = Anarchy.sharding_enabled
+    group = os.environ.get('ANARCHY_SERVICE', 'anarchy')
+    group_label = f"{Anarchy.domain}/shard-group"
+    identity = os.environ.get('HOSTNAME', 'anarchy')
+    members = []
+    rebalance_callbacks = []
+    ring = []
+    ring_keys = []
+    task = None
+    virtual_nodes = 64
+
+    @classmethod
+    def build_ring(cls, members):
+        ring = sorted(
+            (cls.hash_key(f"{member}#{i}"), member)
+            for member in members
+            for i in range(cls.virtual_nodes)
+        )
+        cls.members = members
+        cls.ring = ring
+        cls.ring_keys = [key for key, _ in ring]
+
+    @classmethod
+    def hash_key(cls, key):
+        return int.from_bytes(hashlib.sha256(key.encode('utf-8')).digest()[:8], 'big')
+
+    @classmethod
+    def lease_name(cls):
+        return f"{cls.group}-shard-{cls.identity}"
+
+    @classmethod
+    def on_rebalance(cls, callback):
+        cls.rebalance_callbacks.append(callback)
+
+    @classmethod
+    def owner(cls, subject_name):
+        if not cls.ring:
+            return cls.identity
+        i = bisect.bisect(cls.ring_keys, cls.hash_key(subject_name)) % len(cls.ring)
+        return cls.ring[i][1]
+
+    @classmethod
+    def owns(cls, subject_name):
+        if not cls.enabled:
+            return True
+        return cls.owner(subject_name) == cls.identity
+
+    @classmethod
+    async def on_cleanup(cls):
+        if not cls.task:
+            return
+        cls.task.cancel()
+        await cls.task
+        try:
+            # Release lease so that other replicas rebalance immediately
+            await cls.coordination_v1_api.delete_namespaced_lease(cls.lease_name(), Anarchy.namespace)
+        except kubernetes_asyncio.client.rest.ApiException as e:
+            if e.status != 404:
+                logging.exception(f"Failed to delete Lease {cls.lease_name()}")
+
+    @classmethod
+    async def on_startup(cls):
+        if not cls.enabled:
+            return
+        cls.coordination_v1_api = kubernetes_asyncio.client.CoordinationV1Api(Anarchy.api_client)
+        await cls.renew_lease()
+        await cls.update_members()
+        cls.task = asyncio.create_task(cls.lease_loop())
+
+    @classmethod
+    async def lease_loop(cls):
+        interval = max(Anarchy.shard_lease_duration / 3, 1)
+        while True:
+            try:
+                await asyncio.sleep(interval)
+                await cls.renew_lease()
+                await cls.update_members()
+            except asyncio.CancelledError:
+                return
+            except Exception:
+                logging.exception("Error maintaining shard Lease")
+
+    @classmethod
+    async def renew_lease(cls):
+        now = datetime.now(timezone.utc).strftime('%FT%T.%fZ')
+        try:
+            await cls.coordination_v1_api.patch_namespaced_lease(
+                name = cls.lease_name(),
+                namespace = Anarchy.namespace,
+                body = {
+                    "spec": {
+                        "holderIdentity": cls.identity,
+                        "leaseDurationSeconds": Anarchy.shard_lease_duration,
+                        "renewTime": now,
+                    }
+                },
+                _content_type = 'application/merge-patch+json',
+            )
+        except kubernetes_asyncio.client.rest.ApiException as e:
+            if e.status != 404:
+                raise
+            await cls.coordination_v1_api.create_namespaced_lease(
+                namespace = Anarchy.namespace,
+                body = {
+                    "apiVersion": "coordination.k8s.io/v1",
+                    "kind": "Lease",
+                    "metadata": {
+                        "name": cls.lease_name(),
+                        "labels": {
+                            cls.group_label: cls.group,
+                        },
+                    },
+                    "spec": {
+                        "acquireTime": now,
+                        "holderIdentity": cls.identity,
+                        "leaseDurationSeconds": Anarchy.shard_lease_duration,
+                        "renewTime": now,
+                    },
+                },
+            )
+
+    @classmethod
+    async def update_members(cls):
+        lease_list = await cls.coordination_v1_api.list_namespaced_lease(
+            Anarchy.namespace, label_selector=f"{cls.group_label}={cls.group}"
+        )
+        now = datetime.now(timezone.utc)
+        members = {cls.identity}
+        for lease in lease_list.items:
+            spec = lease.spec
+            if not spec.holder_identity or not spec.renew_time:
+                continue
+            if spec.renew_time + timedelta(seconds=spec.lease_duration_seconds or 0) > now:
+                members.add(spec.holder_identity)
+        members = sorted(members)
+        if members == cls.members:
+            return
+        logging.info(f"Shard members changed from {cls.members} to {members}")
+        cls.build_ring(members)
+        for callback in cls.rebalance_callbacks:
+            try:
+                callback()
+            except Exception:
+                logging.exception("Error handling shard rebalance")
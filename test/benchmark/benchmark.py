@@ -0,0 +1,379 @@
+#!/usr/bin/env python
+"""
+End-to-end throughput benchmark for the Anarchy operator and API.
+
+Runs the operator and API unmodified against the in-memory fake Kubernetes
+API with a stub runner which posts canned results for every AnarchyRun.
+Creates N AnarchySubjects with M AnarchyActions each and writes a JSON
+report for comparison across releases:
+
+    python benchmark.py --subjects 100 --actions 5 --output report.json
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+import logging
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from aiohttp import ClientSession, ClientTimeout
+from datetime import datetime, timezone
+
+from fake_kube_api import ANARCHY_DOMAIN, serve
+
+REPORT_VERSION = 1
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def percentile(values, p):
+    """
+    Return nearest-rank percentile p of values, None if empty.
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    rank = max(1, math.ceil(len(values) * p / 100))
+    return values[rank - 1]
+
+def git_describe():
+    try:
+        return subprocess.run(
+            ['git', 'describe', '--always', '--dirty', '--tags'],
+            capture_output=True, check=True, cwd=REPO_DIR, text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+class Benchmark:
+    def __init__(self,
+        actions_per_subject,
+        subjects,
+        api_port = 5000,
+        log_dir = None,
+        namespace = 'anarchy',
+        timeout = 600,
+    ):
+        self.actions_per_subject = actions_per_subject
+        self.api_port = api_port
+        self.log_dir = log_dir or tempfile.mkdtemp(prefix='anarchy-benchmark-')
+        self.namespace = namespace
+        self.pod_name = 'anarchy-benchmark'
+        self.processes = []
+        self.runner_token = 'benchmark'
+        self.subject_count = subjects
+        self.timeout = timeout
+
+        self.action_created = {}
+        self.action_finished = {}
+        self.run_completed = {}
+        self.runs_posted = 0
+        self.subject_ready = {}
+
+    @property
+    def anarchy_url(self):
+        return f"http://127.0.0.1:{self.api_port}"
+
+    def observe(self, resource, event_type, obj):
+        """
+        Record timestamps from object changes in the fake API.
+        """
+        if event_type == 'DELETED':
+            return
+        now = time.monotonic()
+        name = obj['metadata']['name']
+        labels = obj['metadata'].get('labels', {})
+        if resource.plural == 'anarchysubjects':
+            if name not in self.subject_ready and 'supportedActions' in obj.get('status', {}):
+                self.subject_ready[name] = now
+        elif resource.plural == 'anarchyactions':
+            if name not in self.action_finished and f"{ANARCHY_DOMAIN}/finished" in labels:
+                self.action_finished[name] = now
+        elif resource.plural == 'anarchyruns':
+            action_name = labels.get(f"{ANARCHY_DOMAIN}/action")
+            if action_name \
+            and action_name not in self.run_completed \
+            and labels.get(f"{ANARCHY_DOMAIN}/runner") in ('failed', 'successful'):
+                self.run_completed[action_name] = now
+
+    def create(self, plural, body):
+        body = {
+            "apiVersion": f"{ANARCHY_DOMAIN}/v1",
+            **body,
+        }
+        # Created directly so that harness requests are not counted
+        resource = self.fake_api.find_resource(ANARCHY_DOMAIN, 'v1', plural)
+        return self.fake_api.create(resource, self.namespace, body)
+
+    def create_actions(self):
+        after = datetime.now(timezone.utc).strftime('%FT%TZ')
+        for i in range(self.subject_count):
+            subject_name = f"benchmark-{i}"
+            for j in range(self.actions_per_subject):
+                name = f"{subject_name}-{j}"
+                self.create('anarchyactions', {
+                    "kind": "AnarchyAction",
+                    "metadata": {"name": name},
+                    "spec": {
+                        "action": "benchmark",
+                        "after": after,
+                        "subjectRef": {"name": subject_name},
+                    },
+                })
+                self.action_created[name] = time.monotonic()
+
+    def create_governor(self):
+        self.create('anarchygovernors', {
+            "kind": "AnarchyGovernor",
+            "metadata": {"name": "benchmark"},
+            "spec": {
+                "actions": {
+                    "benchmark": {
+                        "description": "Benchmark action",
+                    },
+                },
+                "removeFinishedActions": {"after": "1h"},
+                "removeSuccessfulRuns": {"after": "1h"},
+            },
+        })
+
+    def create_subjects(self):
+        for i in range(self.subject_count):
+            name = f"benchmark-{i}"
+            self.create('anarchysubjects', {
+                "kind": "AnarchySubject",
+                "metadata": {"name": name},
+                "spec": {
+                    "governor": "benchmark",
+                    "vars": {"index": i},
+                },
+            })
+
+    def request_counts(self):
+        """
+        Return API request counts excluding long running watches.
+        """
+        return collections.Counter({
+            f"{verb} {resource}": count
+            for (verb, resource), count in self.fake_api.request_counts.items()
+            if verb != 'watch'
+        })
+
+    async def run(self):
+        self.fake_api, self.fake_api_runner = await serve('127.0.0.1', 0)
+        self.fake_api.emit = self.wrap_emit(self.fake_api.emit)
+        kube_port = self.fake_api_runner.addresses[0][1]
+        kubeconfig = os.path.join(self.log_dir, 'kubeconfig')
+        self.fake_api.write_kubeconfig(kubeconfig, f"http://127.0.0.1:{kube_port}", self.namespace)
+        try:
+            self.create_governor()
+            await self.start_processes(kubeconfig)
+            async with ClientSession(timeout=ClientTimeout(total=30)) as session:
+                await self.wait_for_api(session)
+                # All-in-one API has a single runner pod so only one run is in progress at a time
+                runner_task = asyncio.create_task(self.stub_runner(session))
+                try:
+                    return await self.run_phases()
+                finally:
+                    runner_task.cancel()
+                    await asyncio.gather(runner_task, return_exceptions=True)
+        finally:
+            await self.stop_processes()
+            await self.fake_api_runner.cleanup()
+
+    async def run_phases(self):
+        start_counts = self.request_counts()
+        subjects_start = time.monotonic()
+        self.create_subjects()
+        await self.wait_for(lambda: len(self.subject_ready) >= self.subject_count, 'subjects ready')
+        subjects_seconds = time.monotonic() - subjects_start
+
+        action_counts = self.request_counts()
+        actions_start = time.monotonic()
+        self.create_actions()
+        await self.wait_for(lambda: len(self.action_finished) >= len(self.action_created), 'actions finished')
+        actions_seconds = time.monotonic() - actions_start
+        end_counts = self.request_counts()
+
+        action_requests = end_counts - action_counts
+        latencies = [
+            self.run_completed[name] - created
+            for name, created in self.action_created.items()
+            if name in self.run_completed
+        ]
+        completed_actions = len(self.action_finished)
+        completed_runs = len(self.run_completed)
+        return {
+            "reportVersion": REPORT_VERSION,
+            "timestamp": datetime.now(timezone.utc).strftime('%FT%TZ'),
+            "version": git_describe(),
+            "environment": {
+                "machine": platform.machine(),
+                "python": platform.python_version(),
+            },
+            "parameters": {
+                "actionsPerSubject": self.actions_per_subject,
+                "subjects": self.subject_count,
+            },
+            "results": {
+                "actionsFinished": completed_actions,
+                "actionsSeconds": round(actions_seconds, 3),
+                "apiRequestsPerAction": round(sum(action_requests.values()) / completed_actions, 2),
+                "apiRequestsPerSubject": round(sum((action_counts - start_counts).values()) / self.subject_count, 2),
+                "latencySeconds": {
+                    "p50": round(percentile(latencies, 50), 3) if latencies else None,
+                    "p99": round(percentile(latencies, 99), 3) if latencies else None,
+                    "max": round(max(latencies), 3) if latencies else None,
+                },
+                "runsCompleted": completed_runs,
+                "runsPerSecond": round(completed_runs / actions_seconds, 2),
+                "runsPosted": self.runs_posted,
+                "subjectsPerSecond": round(self.subject_count / subjects_seconds, 2),
+                "subjectsSeconds": round(subjects_seconds, 3),
+            },
+            "apiRequests": dict(sorted(end_counts.items())),
+            "apiRequestsDuringActions": dict(sorted(action_requests.items())),
+        }
+
+    async def start_process(self, name, args, cwd, env):
+        log = open(os.path.join(self.log_dir, f"{name}.log"), 'w')
+        process = await asyncio.create_subprocess_exec(
+            *args, cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+        log.close()
+        self.processes.append(process)
+        logging.info(f"Started {name} pid {process.pid}, logging to {log.name}")
+
+    async def start_processes(self, kubeconfig):
+        env = {
+            **os.environ,
+            "ANARCHY_RUNNING_ALL_IN_ONE": "true",
+            "HOSTNAME": self.pod_name,
+            "KUBECONFIG": kubeconfig,
+            "METRICS_PORT": "0",
+            "OPERATOR_NAMESPACE": self.namespace,
+            "RUNNER_TOKEN": self.runner_token,
+        }
+        await self.start_process(
+            'operator',
+            [sys.executable, '-m', 'kopf', 'run', '--standalone', '-n', self.namespace, 'operator.py'],
+            cwd = os.path.join(REPO_DIR, 'operator'),
+            env = env,
+        )
+        await self.start_process(
+            'api',
+            [
+                sys.executable, '-m', 'uvicorn', 'app:app', '--host', '127.0.0.1',
+                '--port', str(self.api_port), '--lifespan', 'on',
+            ],
+            cwd = os.path.join(REPO_DIR, 'api'),
+            env = env,
+        )
+
+    async def stop_processes(self):
+        for process in self.processes:
+            if process.returncode is None:
+                process.terminate()
+        for process in self.processes:
+            try:
+                await asyncio.wait_for(process.wait(), 10)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+
+    async def stub_runner(self, session):
+        """
+        Long-poll for runs like anarchy-runner and post a canned successful result.
+        """
+        headers = {"Authorization": f"Bearer default:{self.pod_name}:{self.runner_token}"}
+        while True:
+            try:
+                async with session.get(
+                    f"{self.anarchy_url}/run", headers=headers, params={"wait": "10"},
+                ) as response:
+                    response.raise_for_status()
+                    run = await response.json()
+                if not run:
+                    await asyncio.sleep(0.1)
+                    continue
+                run_name = run['run']['metadata']['name']
+                async with session.post(
+                    f"{self.anarchy_url}/run/{run_name}",
+                    headers = headers,
+                    json = {"result": {"status": "successful"}},
+                ) as response:
+                    response.raise_for_status()
+                self.runs_posted += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.warning(f"Stub runner error: {e}")
+                await asyncio.sleep(1)
+
+    async def wait_for(self, condition, description):
+        deadline = time.monotonic() + self.timeout
+        while not condition():
+            for process in self.processes:
+                if process.returncode is not None:
+                    raise Exception(f"Process {process.pid} exited with {process.returncode}, see {self.log_dir}")
+            if time.monotonic() > deadline:
+                raise Exception(f"Timed out waiting for {description}")
+            await asyncio.sleep(0.05)
+
+    async def wait_for_api(self, session):
+        async def api_ready():
+            try:
+                async with session.get(f"{self.anarchy_url}/run") as response:
+                    # Unauthenticated request is rejected once the API is up
+                    return True
+            except OSError:
+                return False
+
+        deadline = time.monotonic() + self.timeout
+        while not await api_ready():
+            for process in self.processes:
+                if process.returncode is not None:
+                    raise Exception(f"Process {process.pid} exited with {process.returncode}, see {self.log_dir}")
+            if time.monotonic() > deadline:
+                raise Exception("Timed out waiting for API")
+            await asyncio.sleep(0.2)
+
+    def wrap_emit(self, emit):
+        def wrapped_emit(resource, event_type, obj):
+            emit(resource, event_type, obj)
+            self.observe(resource, event_type, obj)
+        return wrapped_emit
+
+def main():
+    parser = argparse.ArgumentParser(description="Anarchy end-to-end throughput benchmark")
+    parser.add_argument('--actions', type=int, default=5, help="AnarchyActions per subject")
+    parser.add_argument('--api-port', type=int, default=5000)
+    parser.add_argument('--log-dir', help="Directory for operator and API logs")
+    parser.add_argument('--output', help="Write JSON report to this path")
+    parser.add_argument('--subjects', type=int, default=100)
+    parser.add_argument('--timeout', type=int, default=600, help="Seconds to wait for each phase")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    benchmark = Benchmark(
+        actions_per_subject = args.actions,
+        api_port = args.api_port,
+        log_dir = args.log_dir,
+        subjects = args.subjects,
+        timeout = args.timeout,
+    )
+    report = asyncio.run(benchmark.run())
+    report_json = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report_json + '\n')
+    print(report_json)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,559 @@
+#!/usr/bin/env python
+"""
+In-memory stand-in for the Kubernetes API server.
+
+Stores Anarchy custom resources, Pods and the few other kinds used by the
+operator, API and kopf so that they can run unmodified for local throughput
+benchmarks. Supports get, list, watch, create, replace, merge and JSON
+patches including test operations, the status subresource, finalizers,
+owner reference cascading delete, label selectors, pagination and
+resourceVersion conflicts.
+
+Run standalone with:
+
+    python fake_kube_api.py --port 8001 --kubeconfig /tmp/fake-kubeconfig
+"""
+
+import argparse
+import asyncio
+import collections
+import copy
+import json
+import jsonpatch
+import logging
+import os
+import re
+import uuid
+
+from aiohttp import web
+from datetime import datetime, timezone
+
+ANARCHY_DOMAIN = os.environ.get('ANARCHY_DOMAIN', 'anarchy.gpte.redhat.com')
+
+class Resource:
+    def __init__(self, group, version, plural, kind, namespaced=True, status=True):
+        self.group = group
+        self.kind = kind
+        self.namespaced = namespaced
+        self.plural = plural
+        self.status = status
+        self.version = version
+
+    @property
+    def api_version(self):
+        return f"{self.group}/{self.version}" if self.group else self.version
+
+    @property
+    def key(self):
+        return (self.group, self.version, self.plural)
+
+RESOURCES = [
+    Resource('', 'v1', 'events', 'Event', status=False),
+    Resource('', 'v1', 'namespaces', 'Namespace', namespaced=False),
+    Resource('', 'v1', 'pods', 'Pod'),
+    Resource('', 'v1', 'secrets', 'Secret', status=False),
+    Resource('', 'v1', 'serviceaccounts', 'ServiceAccount', status=False),
+    Resource('', 'v1', 'services', 'Service'),
+    Resource('coordination.k8s.io', 'v1', 'leases', 'Lease', status=False),
+    Resource('kopf.dev', 'v1', 'clusterkopfpeerings', 'ClusterKopfPeering', namespaced=False, status=False),
+    Resource('kopf.dev', 'v1', 'kopfpeerings', 'KopfPeering', status=False),
+    Resource(ANARCHY_DOMAIN, 'v1', 'anarchyactions', 'AnarchyAction'),
+    Resource(ANARCHY_DOMAIN, 'v1', 'anarchycommunes', 'AnarchyCommune'),
+    Resource(ANARCHY_DOMAIN, 'v1', 'anarchygovernors', 'AnarchyGovernor'),
+    Resource(ANARCHY_DOMAIN, 'v1', 'anarchyrunners', 'AnarchyRunner'),
+    Resource(ANARCHY_DOMAIN, 'v1', 'anarchyruns', 'AnarchyRun'),
+    Resource(ANARCHY_DOMAIN, 'v1', 'anarchysubjects', 'AnarchySubject'),
+]
+
+class ApiError(Exception):
+    def __init__(self, status, reason, message):
+        super().__init__(message)
+        self.message = message
+        self.reason = reason
+        self.status = status
+
+    def as_status(self):
+        return {
+            "apiVersion": "v1",
+            "kind": "Status",
+            "code": self.status,
+            "message": self.message,
+            "metadata": {},
+            "reason": self.reason,
+            "status": "Failure",
+        }
+
+def json_merge_patch(target, patch):
+    """
+    Apply RFC 7386 JSON merge patch.
+    """
+    if not isinstance(patch, dict):
+        return copy.deepcopy(patch)
+    if not isinstance(target, dict):
+        target = {}
+    result = dict(target)
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = json_merge_patch(result.get(key), value)
+    return result
+
+def now_timestamp():
+    return datetime.now(timezone.utc).strftime('%FT%TZ')
+
+class LabelSelector:
+    term_re = re.compile(
+        r'^\s*(?:(?P<absent>!)\s*(?P<absent_key>[^=!\s]+)'
+        r'|(?P<set_key>[^=!\s]+)\s+(?P<set_op>in|notin)\s+\((?P<values>[^)]*)\)'
+        r'|(?P<key>[^=!\s]+)\s*(?:(?P<op>==|=|!=)\s*(?P<value>[^\s]*))?)\s*$'
+    )
+
+    def __init__(self, selector):
+        self.terms = []
+        if not selector:
+            return
+        # Split on commas outside of parentheses
+        for term in re.split(r',(?![^(]*\))', selector):
+            match = self.term_re.match(term)
+            if not match:
+                raise ApiError(400, 'BadRequest', f"Invalid label selector {selector}")
+            if match.group('absent'):
+                self.terms.append(('!', match.group('absent_key'), None))
+            elif match.group('set_key'):
+                values = {v.strip() for v in match.group('values').split(',')}
+                self.terms.append((match.group('set_op'), match.group('set_key'), values))
+            elif match.group('op'):
+                self.terms.append((match.group('op'), match.group('key'), match.group('value')))
+            else:
+                self.terms.append(('exists', match.group('key'), None))
+
+    def matches(self, labels):
+        for op, key, value in self.terms:
+            if op == '!' and key in labels:
+                return False
+            if op == 'exists' and key not in labels:
+                return False
+            if op in ('=', '==') and labels.get(key) != value:
+                return False
+            if op == '!=' and labels.get(key) == value:
+                return False
+            if op == 'in' and labels.get(key) not in value:
+                return False
+            if op == 'notin' and labels.get(key) in value:
+                return False
+        return True
+
+class Watcher:
+    def __init__(self, resource, namespace, label_selector):
+        self.label_selector = label_selector
+        self.namespace = namespace
+        self.queue = asyncio.Queue()
+        self.resource = resource
+
+    def matches(self, resource, obj):
+        if resource is not self.resource:
+            return False
+        if self.namespace and obj['metadata'].get('namespace') != self.namespace:
+            return False
+        return self.label_selector.matches(obj['metadata'].get('labels', {}))
+
+class FakeKubeApi:
+    def __init__(self, resources=RESOURCES, watch_history=100000):
+        self.objects = {resource.key: {} for resource in resources}
+        self.request_counts = collections.Counter()
+        self.resource_version = 0
+        self.resources = {resource.key: resource for resource in resources}
+        self.watch_history = collections.deque(maxlen=watch_history)
+        self.watchers = set()
+        self.app = web.Application()
+        self.app.router.add_route('*', '/{path:.*}', self.handle_request)
+
+    def next_resource_version(self):
+        self.resource_version += 1
+        return str(self.resource_version)
+
+    def emit(self, resource, event_type, obj):
+        obj = copy.deepcopy(obj)
+        self.watch_history.append((int(obj['metadata']['resourceVersion']), resource, event_type, obj))
+        for watcher in self.watchers:
+            if watcher.matches(resource, obj):
+                watcher.queue.put_nowait((event_type, obj))
+
+    def find_resource(self, group, version, plural):
+        resource = self.resources.get((group, version, plural))
+        if not resource:
+            raise ApiError(404, 'NotFound', f"the server could not find the requested resource {plural}")
+        return resource
+
+    def get(self, resource, namespace, name):
+        obj = self.objects[resource.key].get((namespace, name))
+        if not obj:
+            raise ApiError(404, 'NotFound', f"{resource.plural} \"{name}\" not found")
+        return obj
+
+    def list(self, resource, namespace=None, label_selector=None, limit=None, _continue=None):
+        selector = LabelSelector(label_selector)
+        items = [
+            obj for (obj_namespace, _), obj in sorted(self.objects[resource.key].items())
+            if (not namespace or obj_namespace == namespace)
+            and selector.matches(obj['metadata'].get('labels', {}))
+        ]
+        start = int(_continue) if _continue else 0
+        metadata = {"resourceVersion": str(self.resource_version)}
+        if limit:
+            if start + limit < len(items):
+                metadata['continue'] = str(start + limit)
+            items = items[start:start + limit]
+        else:
+            items = items[start:]
+        return {
+            "apiVersion": resource.api_version,
+            "kind": f"{resource.kind}List",
+            "items": copy.deepcopy(items),
+            "metadata": metadata,
+        }
+
+    def create(self, resource, namespace, body):
+        obj = copy.deepcopy(body)
+        metadata = obj.setdefault('metadata', {})
+        if 'name' not in metadata:
+            if 'generateName' not in metadata:
+                raise ApiError(422, 'Invalid', "name or generateName is required")
+            metadata['name'] = metadata['generateName'] + uuid.uuid4().hex[:5]
+        if (namespace, metadata['name']) in self.objects[resource.key]:
+            raise ApiError(409, 'AlreadyExists', f"{resource.plural} \"{metadata['name']}\" already exists")
+        if resource.namespaced:
+            metadata['namespace'] = namespace
+        metadata['creationTimestamp'] = now_timestamp()
+        metadata['generation'] = 1
+        metadata['resourceVersion'] = self.next_resource_version()
+        metadata['uid'] = str(uuid.uuid4())
+        obj['apiVersion'] = resource.api_version
+        obj['kind'] = resource.kind
+        if resource.status:
+            # Status is only set through the status subresource
+            obj['status'] = {}
+        if resource.plural == 'pods':
+            obj['status'] = {"phase": "Running", "podIP": "127.0.0.1"}
+        if resource.plural == 'events':
+            # Events are accepted but not stored
+            return obj
+        self.objects[resource.key][(namespace, metadata['name'])] = obj
+        self.emit(resource, 'ADDED', obj)
+        return obj
+
+    def update(self, resource, namespace, name, new_obj, subresource=None, check_resource_version=True):
+        """
+        Store updated object, applying status subresource rules.
+        """
+        obj = self.get(resource, namespace, name)
+        new_metadata = new_obj.get('metadata', {})
+        if check_resource_version \
+        and new_metadata.get('resourceVersion') \
+        and new_metadata['resourceVersion'] != obj['metadata']['resourceVersion']:
+            raise ApiError(
+                409, 'Conflict',
+                f"Operation cannot be fulfilled on {resource.plural} \"{name}\": "
+                "the object has been modified; please apply your changes to the latest version and try again"
+            )
+        if subresource == 'status':
+            updated = copy.deepcopy(obj)
+            updated['status'] = copy.deepcopy(new_obj.get('status', {}))
+        else:
+            updated = copy.deepcopy(new_obj)
+            if resource.status:
+                updated['status'] = copy.deepcopy(obj.get('status', {}))
+            metadata = updated.setdefault('metadata', {})
+            for field in ('creationTimestamp', 'deletionTimestamp', 'generation', 'name', 'namespace', 'uid'):
+                if field in obj['metadata']:
+                    metadata[field] = obj['metadata'][field]
+                else:
+                    metadata.pop(field, None)
+            if updated.get('spec') != obj.get('spec'):
+                metadata['generation'] = obj['metadata'].get('generation', 1) + 1
+        updated['apiVersion'] = obj['apiVersion']
+        updated['kind'] = obj['kind']
+        if updated == obj:
+            return obj
+        updated['metadata']['resourceVersion'] = self.next_resource_version()
+        if 'deletionTimestamp' in updated['metadata'] \
+        and not updated['metadata'].get('finalizers'):
+            self.remove(resource, updated)
+            return updated
+        self.objects[resource.key][(namespace, name)] = updated
+        self.emit(resource, 'MODIFIED', updated)
+        return updated
+
+    def patch(self, resource, namespace, name, content_type, patch, subresource=None):
+        obj = self.get(resource, namespace, name)
+        if content_type.startswith('application/json-patch+json'):
+            try:
+                new_obj = jsonpatch.apply_patch(obj, patch)
+            except (jsonpatch.JsonPatchException, jsonpatch.JsonPointerException) as e:
+                raise ApiError(422, 'Invalid', str(e))
+            check_resource_version = False
+        else:
+            # Strategic merge is treated as JSON merge
+            new_obj = json_merge_patch(obj, patch)
+            check_resource_version = True
+        return self.update(
+            resource, namespace, name, new_obj,
+            check_resource_version = check_resource_version,
+            subresource = subresource,
+        )
+
+    def delete(self, resource, namespace, name):
+        obj = self.get(resource, namespace, name)
+        if obj['metadata'].get('finalizers'):
+            if 'deletionTimestamp' not in obj['metadata']:
+                obj = copy.deepcopy(obj)
+                obj['metadata']['deletionTimestamp'] = now_timestamp()
+                obj['metadata']['resourceVersion'] = self.next_resource_version()
+                self.objects[resource.key][(namespace, name)] = obj
+                self.emit(resource, 'MODIFIED', obj)
+            return obj
+        self.remove(resource, obj)
+        return obj
+
+    def remove(self, resource, obj):
+        metadata = obj['metadata']
+        self.objects[resource.key].pop((metadata.get('namespace'), metadata['name']), None)
+        metadata['resourceVersion'] = self.next_resource_version()
+        self.emit(resource, 'DELETED', obj)
+        # Cascade delete to dependents
+        for dependent_resource in self.resources.values():
+            for dependent in list(self.objects[dependent_resource.key].values()):
+                for owner_reference in dependent['metadata'].get('ownerReferences', []):
+                    if owner_reference.get('uid') == metadata['uid']:
+                        try:
+                            self.delete(
+                                dependent_resource,
+                                dependent['metadata'].get('namespace'),
+                                dependent['metadata']['name'],
+                            )
+                        except ApiError:
+                            # Already removed by cascade from another owner
+                            pass
+                        break
+
+    def api_resource_list(self, group, version):
+        resources = []
+        for resource in self.resources.values():
+            if resource.group != group or resource.version != version:
+                continue
+            resources.append({
+                "kind": resource.kind,
+                "name": resource.plural,
+                "namespaced": resource.namespaced,
+                "singularName": resource.kind.lower(),
+                "verbs": ["create", "delete", "deletecollection", "get", "list", "patch", "update", "watch"],
+            })
+            if resource.status:
+                resources.append({
+                    "kind": resource.kind,
+                    "name": f"{resource.plural}/status",
+                    "namespaced": resource.namespaced,
+                    "singularName": "",
+                    "verbs": ["get", "patch", "update"],
+                })
+        if not resources:
+            raise ApiError(404, 'NotFound', f"the server could not find the requested resource")
+        return {
+            "apiVersion": "v1",
+            "kind": "APIResourceList",
+            "groupVersion": f"{group}/{version}" if group else version,
+            "resources": resources,
+        }
+
+    def api_group_list(self):
+        groups = {}
+        for resource in self.resources.values():
+            if resource.group:
+                groups.setdefault(resource.group, set()).add(resource.version)
+        return {
+            "apiVersion": "v1",
+            "kind": "APIGroupList",
+            "groups": [{
+                "name": group,
+                "preferredVersion": {"groupVersion": f"{group}/{max(versions)}", "version": max(versions)},
+                "versions": [{"groupVersion": f"{group}/{v}", "version": v} for v in sorted(versions)],
+            } for group, versions in sorted(groups.items())],
+        }
+
+    async def handle_request(self, request):
+        try:
+            return await self.route(request)
+        except ApiError as e:
+            return web.json_response(e.as_status(), status=e.status)
+
+    async def route(self, request):
+        segments = [s for s in request.path.split('/') if s]
+        if segments == ['version']:
+            return web.json_response({"major": "1", "minor": "26", "gitVersion": "v1.26.0-fake"})
+        if segments == ['api']:
+            return web.json_response({"kind": "APIVersions", "versions": ["v1"]})
+        if segments == ['apis']:
+            return web.json_response(self.api_group_list())
+        if segments == ['fake', 'requests']:
+            return web.json_response([
+                {"verb": verb, "resource": resource, "count": count}
+                for (verb, resource), count in sorted(self.request_counts.items())
+            ])
+
+        if segments[:1] == ['api'] and len(segments) >= 2:
+            group, version, rest = '', segments[1], segments[2:]
+        elif segments[:1] == ['apis'] and len(segments) >= 3:
+            group, version, rest = segments[1], segments[2], segments[3:]
+        else:
+            raise ApiError(404, 'NotFound', f"the server could not find the requested resource {request.path}")
+
+        if not rest:
+            return web.json_response(self.api_resource_list(group, version))
+
+        namespace = None
+        if rest[0] == 'namespaces' and len(rest) >= 3:
+            namespace, rest = rest[1], rest[2:]
+        resource = self.find_resource(group, version, rest[0])
+        name = rest[1] if len(rest) > 1 else None
+        subresource = rest[2] if len(rest) > 2 else None
+        if subresource and (subresource != 'status' or not resource.status):
+            raise ApiError(404, 'NotFound', f"{resource.plural}/{subresource} not found")
+
+        query = request.query
+        method = request.method
+        if method == 'GET' and not name and query.get('watch') in ('1', 'true', 'True'):
+            self.request_counts[('watch', resource.plural)] += 1
+            return await self.watch(request, resource, namespace)
+
+        verb = {
+            'DELETE': 'delete' if name else 'deletecollection',
+            'GET': 'get' if name else 'list',
+            'PATCH': 'patch',
+            'POST': 'create',
+            'PUT': 'update',
+        }.get(method)
+        if not verb:
+            raise ApiError(405, 'MethodNotAllowed', f"{method} is not supported")
+        self.request_counts[(verb, resource.plural + (f"/{subresource}" if subresource else ''))] += 1
+
+        if verb == 'get':
+            return web.json_response(self.get(resource, namespace, name))
+        if verb == 'list':
+            return web.json_response(self.list(
+                resource, namespace,
+                label_selector = query.get('labelSelector'),
+                limit = int(query['limit']) if query.get('limit') else None,
+                _continue = query.get('continue'),
+            ))
+        if verb == 'create':
+            return web.json_response(self.create(resource, namespace, await request.json()), status=201)
+        if verb == 'update':
+            return web.json_response(self.update(resource, namespace, name, await request.json(), subresource))
+        if verb == 'patch':
+            return web.json_response(self.patch(
+                resource, namespace, name, request.content_type, await request.json(), subresource
+            ))
+        if verb == 'delete':
+            return web.json_response(self.delete(resource, namespace, name))
+        # deletecollection
+        object_list = self.list(resource, namespace, label_selector=query.get('labelSelector'))
+        for obj in object_list['items']:
+            self.delete(resource, namespace, obj['metadata']['name'])
+        return web.json_response({"apiVersion": "v1", "kind": "Status", "status": "Success", "metadata": {}})
+
+    async def watch(self, request, resource, namespace):
+        label_selector = LabelSelector(request.query.get('labelSelector'))
+        resource_version = request.query.get('resourceVersion')
+        timeout = float(request.query.get('timeoutSeconds', 0)) or None
+
+        watcher = Watcher(resource, namespace, label_selector)
+        if resource_version and resource_version != '0':
+            resource_version = int(resource_version)
+            if self.watch_history \
+            and resource_version < self.watch_history[0][0] - 1 \
+            and resource_version < self.resource_version:
+                initial = [('ERROR', ApiError(410, 'Expired', "too old resource version").as_status())]
+            else:
+                initial = [
+                    (event_type, obj)
+                    for rv, event_resource, event_type, obj in self.watch_history
+                    if rv > resource_version and watcher.matches(event_resource, obj)
+                ]
+        else:
+            initial = [
+                ('ADDED', obj) for obj in
+                self.list(resource, namespace, label_selector=request.query.get('labelSelector'))['items']
+            ]
+        for event in initial:
+            watcher.queue.put_nowait(event)
+        self.watchers.add(watcher)
+
+        response = web.StreamResponse(headers={"Content-Type": "application/json"})
+        await response.prepare(request)
+        try:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + timeout if timeout else None
+            while True:
+                try:
+                    event_type, obj = await asyncio.wait_for(
+                        watcher.queue.get(), deadline - loop.time() if deadline else None
+                    )
+                except asyncio.TimeoutError:
+                    break
+                await response.write(json.dumps({"type": event_type, "object": obj}).encode('utf-8') + b'\n')
+                if event_type == 'ERROR':
+                    break
+        except ConnectionResetError:
+            pass
+        finally:
+            self.watchers.discard(watcher)
+        return response
+
+    def write_kubeconfig(self, path, url, namespace='anarchy'):
+        with open(path, 'w') as f:
+            json.dump({
+                "apiVersion": "v1",
+                "kind": "Config",
+                "clusters": [{"name": "fake", "cluster": {"server": url}}],
+                "contexts": [{"name": "fake", "context": {"cluster": "fake", "namespace": namespace, "user": "fake"}}],
+                "current-context": "fake",
+                "users": [{"name": "fake", "user": {"token": "fake"}}],
+            }, f)
+
+async def serve(host, port):
+    api = FakeKubeApi()
+    runner = web.AppRunner(api.app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    return api, runner
+
+def main():
+    parser = argparse.ArgumentParser(description="In-memory fake Kubernetes API server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--kubeconfig', help="Write kubeconfig for the fake API to this path")
+    parser.add_argument('--namespace', default='anarchy')
+    parser.add_argument('--port', type=int, default=8001)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    async def run():
+        api, runner = await serve(args.host, args.port)
+        url = f"http://{args.host}:{args.port}"
+        if args.kubeconfig:
+            api.write_kubeconfig(args.kubeconfig, url, args.namespace)
+        logging.info(f"Fake Kubernetes API listening on {url}")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
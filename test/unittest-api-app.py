@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+sys.path.append('../api')
+
+from asgi_tools import ResponseError
+
+from anarchy import Anarchy
+from anarchyrun import AnarchyRun
+from anarchyrunner import AnarchyRunner
+from anarchyrunnerpod import AnarchyRunnerPod
+
+import app
+
+class Request:
+    def __init__(self, path_params, runner_name='default', pod_name='anarchy-runner-default-0'):
+        self.headers = {"Authorization": f"Bearer {runner_name}:{pod_name}:secret"}
+        self.path_params = path_params
+
+def runner_pod(runner_name, pod_name):
+    return AnarchyRunnerPod({
+        "metadata": {
+            "labels": {Anarchy.runner_label: runner_name},
+            "name": pod_name,
+            "resourceVersion": "1",
+        },
+        "spec": {
+            "containers": [{"env": [{"name": "RUNNER_TOKEN", "value": "secret"}]}],
+        },
+    })
+
+class TestApp(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        for runner_name in ('default', 'other'):
+            AnarchyRunner.cache[runner_name] = AnarchyRunner({
+                "metadata": {"name": runner_name, "resourceVersion": "1"},
+                "spec": {},
+            })
+            pod_name = f"anarchy-runner-{runner_name}-0"
+            AnarchyRunnerPod.cache[pod_name] = runner_pod(runner_name, pod_name)
+        AnarchyRun.cache['test'] = AnarchyRun({
+            "metadata": {"name": "test", "resourceVersion": "1"},
+            "spec": {},
+            "status": {
+                "result": {"rc": 0, "ansibleRun": {"plays": []}},
+                "runner": {"name": "default"},
+            },
+        })
+
+    def tearDown(self):
+        AnarchyRun.cache.clear()
+        AnarchyRunner.cache.clear()
+        AnarchyRunnerPod.cache.clear()
+
+    async def test_get_run_result(self):
+        self.assertEqual(
+            await app.get_run_result(Request({"anarchy_run_name": "test"})),
+            {"rc": 0, "ansibleRun": {"plays": []}},
+        )
+
+    async def test_get_run_result_other_runner(self):
+        with self.assertRaises(ResponseError) as context:
+            await app.get_run_result(Request(
+                {"anarchy_run_name": "test"},
+                runner_name = 'other',
+                pod_name = 'anarchy-runner-other-0',
+            ))
+        self.assertEqual(context.exception.status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+sys.path.append('../api')
+
+import tempfile
+
+from anarchy import Anarchy
+from blob_store import BlobNotFoundError, BlobStore, FilesystemBlobStore
+
+class TestBlobStore(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        BlobStore.store = FilesystemBlobStore(self.tempdir.name)
+
+    async def asyncTearDown(self):
+        BlobStore.store = None
+        self.tempdir.cleanup()
+
+    async def test_filesystem(self):
+        await BlobStore.store.put('anarchyruns/test.json.gz', {"plays": []})
+        self.assertEqual(await BlobStore.store.get('anarchyruns/test.json.gz'), {"plays": []})
+        await BlobStore.store.delete('anarchyruns/test.json.gz')
+        await BlobStore.store.delete('anarchyruns/test.json.gz')
+        with self.assertRaises(FileNotFoundError):
+            await BlobStore.store.get('anarchyruns/test.json.gz')
+        with self.assertRaises(ValueError):
+            await BlobStore.store.put('../test.json.gz', {})
+
+    async def test_load_result(self):
+        result = {"rc": 0, "ansibleRun": {"plays": []}}
+        self.assertEqual(await BlobStore.load_result(result), result)
+        await BlobStore.store.put('anarchyruns/test.json.gz', {"plays": [{"tasks": []}]})
+        self.assertEqual(
+            await BlobStore.load_result({
+                "rc": 0,
+                "ansibleRunRef": {"key": "anarchyruns/test.json.gz", "store": "filesystem"},
+                "ansibleRunSummary": {"plays": 1, "stats": {}, "tasks": 0},
+            }),
+            {"rc": 0, "ansibleRun": {"plays": [{"tasks": []}]}},
+        )
+        with self.assertRaises(BlobNotFoundError):
+            await BlobStore.load_result({
+                "ansibleRunRef": {"key": "anarchyruns/missing.json.gz", "store": "filesystem"},
+            })
+        BlobStore.store = None
+        with self.assertRaises(BlobNotFoundError):
+            await BlobStore.load_result({
+                "ansibleRunRef": {"key": "anarchyruns/test.json.gz", "store": "filesystem"},
+            })
+
+    async def test_offload_result(self):
+        small = {"rc": 0, "ansibleRun": {"plays": []}}
+        self.assertEqual(await BlobStore.offload_result('anarchyruns/small.json.gz', small), small)
+        ansible_run = {
+            "plays": [{"tasks": [{"name": "x" * Anarchy.result_inline_max_bytes}]}],
+            "stats": {"localhost": {"ok": 1}},
+        }
+        result = await BlobStore.offload_result('anarchyruns/large.json.gz', {"rc": 0, "ansibleRun": ansible_run})
+        self.assertEqual(result, {
+            "rc": 0,
+            "ansibleRunRef": {"key": "anarchyruns/large.json.gz", "store": "filesystem"},
+            "ansibleRunSummary": {"plays": 1, "stats": {"localhost": {"ok": 1}}, "tasks": 1},
+        })
+        self.assertEqual(await BlobStore.load_result(result), {"rc": 0, "ansibleRun": ansible_run})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+sys.path.append('../api')
+
+from run_queue import RunQueue
+
+class TestRunQueue(unittest.TestCase):
+    def test_queue(self):
+        queue = RunQueue()
+        queue.enqueue('default', 'run-a')
+        queue.enqueue('default', 'run-b')
+        queue.enqueue('other', 'run-c')
+        queue.enqueue('default', 'run-a')
+        self.assertEqual(len(queue), 3)
+        self.assertEqual(queue.names('default'), ['run-a', 'run-b'])
+        self.assertEqual(queue.count('other'), 1)
+
+        queue.discard('run-a')
+        self.assertNotIn('run-a', queue)
+        self.assertEqual(queue.dequeue('default'), 'run-b')
+        self.assertIsNone(queue.dequeue('default'))
+        self.assertEqual(queue.dequeue('other'), 'run-c')
+        self.assertIsNone(queue.dequeue('missing'))
+
+    def test_requeue(self):
+        queue = RunQueue()
+        queue.enqueue('default', 'run-a')
+        queue.enqueue('default', 'run-b')
+        queue.discard('run-a')
+        queue.enqueue('default', 'run-a')
+        queue.enqueue('other', 'run-b')
+        self.assertEqual(queue.names('default'), ['run-a'])
+        self.assertEqual(queue.count('default'), 1)
+        self.assertEqual(queue.dequeue('default'), 'run-a')
+        self.assertIsNone(queue.dequeue('default'))
+        self.assertEqual(queue.dequeue('other'), 'run-b')
+
+    def test_compact(self):
+        queue = RunQueue()
+        for i in range(1000):
+            queue.enqueue('default', f"run-{i}")
+            queue.discard(f"run-{i}")
+        self.assertLess(len(queue.queues['default']), 200)
+        self.assertEqual(queue.count('default'), 0)
+
+if __name__ == '__main__':
+    unittest.main()
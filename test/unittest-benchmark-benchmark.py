@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+sys.path.append('benchmark')
+
+from benchmark import Benchmark, percentile
+from fake_kube_api import ANARCHY_DOMAIN, RESOURCES
+
+class TestBenchmark(unittest.TestCase):
+    def test_percentile(self):
+        values = list(range(100, 0, -1))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([3.0], 99), 3.0)
+        self.assertIsNone(percentile([], 50))
+
+    def test_observe_run_completed(self):
+        benchmark = Benchmark(actions_per_subject=1, subjects=1)
+        runs = next(resource for resource in RESOURCES if resource.plural == 'anarchyruns')
+        run = {
+            "metadata": {
+                "name": "benchmark-0-0-abcde",
+                "labels": {
+                    f"{ANARCHY_DOMAIN}/action": "benchmark-0-0",
+                    f"{ANARCHY_DOMAIN}/runner": "anarchy-benchmark",
+                },
+            },
+        }
+        benchmark.observe(runs, 'MODIFIED', run)
+        self.assertEqual(benchmark.run_completed, {})
+        run['metadata']['labels'][f"{ANARCHY_DOMAIN}/runner"] = 'successful'
+        benchmark.observe(runs, 'MODIFIED', run)
+        self.assertIn('benchmark-0-0', benchmark.run_completed)
+
+if __name__ == '__main__':
+    unittest.main()
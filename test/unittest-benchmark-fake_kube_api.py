@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+sys.path.append('benchmark')
+
+import asyncio
+import kubernetes_asyncio
+import os
+import tempfile
+
+from fake_kube_api import ANARCHY_DOMAIN, serve
+
+class TestFakeKubeApi(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.api, self.runner = await serve('127.0.0.1', 0)
+        port = self.runner.addresses[0][1]
+        self.kubeconfig = tempfile.NamedTemporaryFile(suffix='.json', delete=False).name
+        self.api.write_kubeconfig(self.kubeconfig, f"http://127.0.0.1:{port}")
+        await kubernetes_asyncio.config.load_kube_config(config_file=self.kubeconfig)
+        self.api_client = kubernetes_asyncio.client.ApiClient()
+        self.custom_objects_api = kubernetes_asyncio.client.CustomObjectsApi(self.api_client)
+
+    async def asyncTearDown(self):
+        await self.api_client.close()
+        await self.runner.cleanup()
+        os.unlink(self.kubeconfig)
+
+    async def create_subject(self, name='test', **metadata):
+        return await self.custom_objects_api.create_namespaced_custom_object(
+            ANARCHY_DOMAIN, 'v1', 'anarchy', 'anarchysubjects', {
+                "apiVersion": f"{ANARCHY_DOMAIN}/v1",
+                "kind": "AnarchySubject",
+                "metadata": {"name": name, **metadata},
+                "spec": {"governor": "test"},
+                "status": {"ignored": True},
+            }
+        )
+
+    async def test_status_subresource(self):
+        subject = await self.create_subject()
+        self.assertEqual(subject['status'], {})
+        subject = await self.custom_objects_api.patch_namespaced_custom_object_status(
+            ANARCHY_DOMAIN, 'v1', 'anarchy', 'anarchysubjects', 'test',
+            {"status": {"runStatus": "pending"}, "spec": {"governor": "other"}},
+            _content_type = 'application/merge-patch+json',
+        )
+        self.assertEqual(subject['status'], {"runStatus": "pending"})
+        self.assertEqual(subject['spec'], {"governor": "test"})
+
+    async def test_json_patch_test_op(self):
+        subject = await self.create_subject()
+        resource_version = subject['metadata']['resourceVersion']
+        await self.custom_objects_api.patch_namespaced_custom_object_status(
+            ANARCHY_DOMAIN, 'v1', 'anarchy', 'anarchysubjects', 'test', [
+                {"op": "test", "path": "/metadata/resourceVersion", "value": resource_version},
+                {"op": "add", "path": "/status/runStatus", "value": "pending"},
+            ],
+            _content_type = 'application/json-patch+json',
+        )
+        with self.assertRaises(kubernetes_asyncio.client.rest.ApiException) as cm:
+            await self.custom_objects_api.patch_namespaced_custom_object_status(
+                ANARCHY_DOMAIN, 'v1', 'anarchy', 'anarchysubjects', 'test', [
+                    {"op": "test", "path": "/metadata/resourceVersion", "value": resource_version},
+                ],
+                _content_type = 'application/json-patch+json',
+            )
+        self.assertEqual(cm.exception.status, 422)
+
+    async def test_resource_version_conflict(self):
+        subject = await self.create_subject()
+        subject['spec']['vars'] = {"a": 1}
+        await self.custom_objects_api.replace_namespaced_custom_object(
+            ANARCHY_DOMAIN, 'v1', 'anarchy', 'anarchysubjects', 'test', subject
+        )
+        with self.assertRaises(kubernetes_asyncio.client.rest.ApiException) as cm:
+            await self.custom_objects_api.replace_namespaced_custom_object(
+                ANARCHY_DOMAIN, 'v1', 'anarchy', 'anarchysubjects', 'test', subject
+            )
+        self.assertEqual(cm.exception.status, 409)
+
+    async def test_finalizers_and_label_selector(self):
+        await self.create_subject('a', finalizers=['test'], labels={"x": "1"})
+        await self.create_subject('b', labels={"x": "2"})
+        subject_list = await self.custom_objects_api.list_namespaced_custom_object(
+            ANARCHY_DOMAIN, 'v1', 'anarchy', 'anarchysubjects', label_selector='x in (1,3)'
+        )
+        self.assertEqual([i['metadata']['name'] for i in subject_list['items']], ['a'])
+        await self.custom_objects_api.delete_namespaced_custom_object(
+            ANARCHY_DOMAIN, 'v1', 'anarchy', 'anarchysubjects', 'a'
+        )
+        subject = await self.custom_objects_api.get_namespaced_custom_object(
+            ANARCHY_DOMAIN, 'v1', 'anarchy', 'anarchysubjects', 'a'
+        )
+        self.assertIn('deletionTimestamp', subject['metadata'])
+        await self.custom_objects_api.patch_namespaced_custom_object(
+            ANARCHY_DOMAIN, 'v1', 'anarchy', 'anarchysubjects', 'a',
+            {"metadata": {"finalizers": None}},
+            _content_type = 'application/merge-patch+json',
+        )
+        with self.assertRaises(kubernetes_asyncio.client.rest.ApiException):
+            await self.custom_objects_api.get_namespaced_custom_object(
+                ANARCHY_DOMAIN, 'v1', 'anarchy', 'anarchysubjects', 'a'
+            )
+
+    async def test_watch(self):
+        subject_list = await self.custom_objects_api.list_namespaced_custom_object(
+            ANARCHY_DOMAIN, 'v1', 'anarchy', 'anarchysubjects'
+        )
+        events = []
+        async def watch():
+            watch = kubernetes_asyncio.watch.Watch()
+            async for event in watch.stream(
+                self.custom_objects_api.list_namespaced_custom_object,
+                ANARCHY_DOMAIN, 'v1', 'anarchy', 'anarchysubjects',
+                resource_version = subject_list['metadata']['resourceVersion'],
+                timeout_seconds = 1,
+            ):
+                events.append((event['type'], event['object']['metadata']['name']))
+        task = asyncio.create_task(watch())
+        await asyncio.sleep(0.1)
+        await self.create_subject('a')
+        await self.custom_objects_api.delete_namespaced_custom_object(
+            ANARCHY_DOMAIN, 'v1', 'anarchy', 'anarchysubjects', 'a'
+        )
+        await task
+        self.assertEqual(events, [('ADDED', 'a'), ('DELETED', 'a')])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+sys.path.append('../operator')
+
+from datetime import timedelta
+
+from anarchygovernor import AnarchyGovernor
+
+class TestAnarchyGovernor(unittest.TestCase):
+    def setUp(self):
+        self.anarchygovernor = AnarchyGovernor({
+            "metadata": {
+                "name": "test",
+                "namespace": "anarchy",
+                "resourceVersion": "1",
+                "uid": "00000000-0000-0000-0000-000000000000",
+            },
+            "spec": {
+                "actions": {
+                    "start": {
+                        "description": "Start",
+                        "callbackHandlers": {"started": {}},
+                    },
+                    "stop": {
+                        "finishOnSuccessfulRun": False,
+                        "timeEstimate": "5m",
+                    },
+                },
+                "removeFinishedActions": {"after": "1h"},
+                "removeSuccessfulRuns": {"after": "invalid"},
+                "subjectEventHandlers": {"create": {}},
+            },
+        })
+
+    def test_action_configs(self):
+        self.assertTrue(self.anarchygovernor.has_action('start'))
+        self.assertFalse(self.anarchygovernor.has_action('destroy'))
+        self.assertIsNone(self.anarchygovernor.get_action_config('destroy'))
+        start = self.anarchygovernor.get_action_config('start')
+        self.assertIs(start, self.anarchygovernor.get_action_config('start'))
+        self.assertTrue(start.finish_on_successful_run)
+        self.assertTrue(start.has_callback_handlers)
+        stop = self.anarchygovernor.get_action_config('stop')
+        self.assertFalse(stop.finish_on_successful_run)
+        self.assertFalse(stop.has_callback_handlers)
+
+    def test_handlers(self):
+        self.assertTrue(self.anarchygovernor.has_create_handler)
+        self.assertFalse(self.anarchygovernor.has_delete_handler)
+        self.assertFalse(self.anarchygovernor.has_update_handler)
+
+    def test_retention(self):
+        self.assertEqual(self.anarchygovernor.remove_finished_actions_after_seconds, 3600)
+        self.assertEqual(self.anarchygovernor.remove_finished_actions_after_timedelta, timedelta(hours=1))
+        self.assertEqual(self.anarchygovernor.remove_successful_runs_after_seconds, 86400)
+
+    def test_supported_actions(self):
+        self.assertEqual(self.anarchygovernor.supported_actions, {
+            "start": {"description": "Start"},
+            "stop": {"timeEstimate": "5m"},
+        })
+        with self.assertRaises(TypeError):
+            self.anarchygovernor.supported_actions['start']['description'] = 'Changed'
+        supported_actions_status = self.anarchygovernor.get_supported_actions_status()
+        self.assertIs(type(supported_actions_status['start']), dict)
+        supported_actions_status['start']['description'] = 'Changed'
+        self.assertEqual(self.anarchygovernor.supported_actions['start']['description'], 'Start')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,9 +5,15 @@ import sys
 sys.path.append('../operator')
 
 import kubernetes_asyncio
+import time
 
+from collections import deque
 from datetime import datetime, timedelta, timezone
-from anarchyrunner import AnarchyRunner
+from anarchy import Anarchy
+from anarchyrunner import AnarchyRunner, RunStatistics
+from runner_pod import RunnerPod
+
+import anarchygovernor
 
 class TestAnarchyRunner(unittest.TestCase):
     def setUp(self):
@@ -24,12 +30,39 @@ class TestAnarchyRunner(unittest.TestCase):
         self.anarchyrunner.pods = {}
         self.anarchyrunner.pods_preloaded = True
 
+    def test_desired_replicas(self):
+        self.anarchyrunner.spec = {
+            "maxReplicas": 20,
+            "minReplicas": 1,
+            "targetQueueWait": "30s",
+        }
+        self.assertEqual(self.anarchyrunner.desired_replicas, 1)
+
+        # 60 arrivals over 600 seconds each taking 60 seconds
+        now = time.monotonic()
+        RunStatistics.arrivals['test'] = deque((now, 'test') for i in range(60))
+        RunStatistics.durations['test'] = {"test": deque([(now, 60)])}
+        # Statistics of other runners are ignored
+        RunStatistics.arrivals['other'] = deque((now, 'other') for i in range(600))
+        self.anarchyrunner.status = {
+            "pendingRuns": [{"name": f"run-{i}"} for i in range(4)],
+            "pods": [{"name": "anarchy-runner-0", "run": {"name": "run-x"}}],
+        }
+        try:
+            self.assertEqual(self.anarchyrunner.desired_replicas, 10)
+            self.anarchyrunner.spec['maxReplicas'] = 8
+            self.assertEqual(self.anarchyrunner.desired_replicas, 8)
+            self.anarchyrunner.spec['runConcurrency'] = 2
+            self.assertEqual(self.anarchyrunner.desired_replicas, 5)
+        finally:
+            RunStatistics.clear()
+
     def test_max_replicas_reached(self):
         self.anarchyrunner.spec = {
             "maxReplicas": 2,
         }
         self.anarchyrunner.pods = {
-            "anarchy-runner-0": kubernetes_asyncio.client.V1Pod({}),
+            "anarchy-runner-0": RunnerPod({}),
         }
         self.assertFalse(
             self.anarchyrunner.max_replicas_reached,
@@ -37,14 +70,111 @@ class TestAnarchyRunner(unittest.TestCase):
         )
 
         self.anarchyrunner.pods = {
-            "anarchy-runner-0": kubernetes_asyncio.client.V1Pod({}),
-            "anarchy-runner-1": kubernetes_asyncio.client.V1Pod({}),
+            "anarchy-runner-0": RunnerPod({}),
+            "anarchy-runner-1": RunnerPod({}),
         }
         self.assertTrue(
             self.anarchyrunner.max_replicas_reached,
             msg="max_replicas_reached false when at max_replicas",
         )
 
+    def test_pod_template_hash(self):
+        Anarchy.namespace = 'anarchy'
+        Anarchy.pod = kubernetes_asyncio.client.V1Pod(
+            spec = kubernetes_asyncio.client.V1PodSpec(
+                containers = [kubernetes_asyncio.client.V1Container(image='quay.io/anarchy:test', name='manager')],
+            ),
+        )
+        self.anarchyrunner.metadata = {"generation": 1}
+        pod_template_hash = self.anarchyrunner.pod_template_hash
+        self.assertEqual(pod_template_hash, self.anarchyrunner.pod_template_hash)
+
+        pod = RunnerPod(self.anarchyrunner.make_pod_template())
+        self.assertTrue(self.anarchyrunner.pod_matches_template(pod))
+
+        self.anarchyrunner.spec = {
+            "podTemplate": {"spec": {"nodeSelector": {"runner": "true"}}},
+        }
+        self.assertEqual(
+            pod_template_hash, self.anarchyrunner.pod_template_hash,
+            msg="pod_template_hash recalculated without generation change",
+        )
+        self.anarchyrunner.metadata = {"generation": 2}
+        self.assertNotEqual(pod_template_hash, self.anarchyrunner.pod_template_hash)
+        self.assertFalse(self.anarchyrunner.pod_matches_template(pod))
+
+    def test_pod_for_scale_down(self):
+        self.anarchyrunner.spec = {
+            "scaleDownDelay": "5m",
+        }
+        self.anarchyrunner.pods = {
+            name: RunnerPod({"metadata": {"name": name}, "status": {"phase": "Running"}})
+            for name in ("anarchy-runner-0", "anarchy-runner-1")
+        }
+        self.anarchyrunner.status = {
+            "pods": [{
+                "name": "anarchy-runner-0",
+                "run": {"name": "anarchy-run-0"},
+                "runCount": 1,
+            }, {
+                "name": "anarchy-runner-1",
+                "runCount": 1,
+            }]
+        }
+        self.anarchyrunner.update_pod_activity()
+        self.assertIsNone(
+            self.anarchyrunner.get_pod_for_scale_down(),
+            msg="pod for scale down before scaleDownDelay",
+        )
+
+        # Pretend both pods were last active ten minutes ago
+        self.anarchyrunner.pod_activity = {
+            name: (1, last_active - 600)
+            for name, (run_count, last_active) in self.anarchyrunner.pod_activity.items()
+        }
+        self.anarchyrunner.update_pod_activity()
+        self.assertEqual(self.anarchyrunner.get_pod_for_scale_down().name, "anarchy-runner-1")
+
+        self.anarchyrunner.status['pods'][1]['runCount'] = 2
+        self.anarchyrunner.update_pod_activity()
+        self.assertIsNone(
+            self.anarchyrunner.get_pod_for_scale_down(),
+            msg="pod for scale down after run count changed",
+        )
+
+    def test_run_statistics(self):
+        def run(name, state):
+            return {
+                "metadata": {
+                    "name": name,
+                    "labels": {
+                        Anarchy.governor_label: "test",
+                        Anarchy.runner_label: state,
+                    },
+                },
+            }
+        anarchygovernor.AnarchyGovernor.cache['test'] = anarchygovernor.AnarchyGovernor({
+            "metadata": {"name": "test"},
+            "spec": {"runner": "test"},
+        })
+        try:
+            # Runs pending at preload are not arrivals
+            RunStatistics.handle_watch_event('ADDED', run('run-b', 'pending'), preload=True)
+            RunStatistics.handle_watch_event('ADDED', run('run-a', 'pending'))
+            RunStatistics.handle_watch_event('MODIFIED', run('run-a', 'pending'))
+            RunStatistics.handle_watch_event('MODIFIED', run('run-a', 'anarchy-runner-0'))
+            RunStatistics.handle_watch_event('MODIFIED', run('run-a', 'successful'))
+            self.assertEqual(len(RunStatistics.arrivals['test']), 1)
+            self.assertEqual(len(RunStatistics.durations['test']['test']), 1)
+            self.assertEqual(RunStatistics.pending, {"run-b": "test"})
+            self.assertFalse(RunStatistics.started)
+            self.assertLess(RunStatistics.expected_duration('test'), 1)
+            self.assertEqual(RunStatistics.arrival_rate('default'), 0)
+            self.assertEqual(RunStatistics.expected_duration('default'), RunStatistics.default_duration)
+        finally:
+            anarchygovernor.AnarchyGovernor.cache.pop('test', None)
+            RunStatistics.clear()
+
     def test_scale_up_delay(self):
         self.anarchyrunner.spec = {
             "scaleUpDelay": "5m"
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+sys.path.append('../operator')
+
+import asyncio
+import kopf
+import kubernetes_asyncio
+
+from anarchy import Anarchy
+from anarchysubject import AnarchySubject
+
+class StatusPatchRecorder:
+    def __init__(self, definition):
+        self.definition = definition
+        self.patches = []
+
+    async def patch_namespaced_custom_object_status(self, body, **_):
+        self.patches.append(body)
+        test = body[0]
+        if test['path'] == '/metadata/resourceVersion' \
+        and test['value'] != self.definition['metadata']['resourceVersion']:
+            raise kubernetes_asyncio.client.rest.ApiException(status=422, reason="Unprocessable Entity")
+        status = self.definition['status']
+        for op in body[1:]:
+            if op['op'] == 'add':
+                status[op['path'].split('/')[2]] = op['value']
+        self.definition['metadata']['resourceVersion'] = str(int(self.definition['metadata']['resourceVersion']) + 1)
+        return self.definition
+
+    async def get_namespaced_custom_object(self, **_):
+        return self.definition
+
+class TestAnarchySubject(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.definition = {
+            "metadata": {
+                "name": "test",
+                "namespace": "anarchy",
+                "resourceVersion": "1",
+                "uid": "00000000-0000-0000-0000-000000000000",
+            },
+            "spec": {},
+            "status": {},
+        }
+        self.api = StatusPatchRecorder(self.definition)
+        Anarchy.custom_objects_api = self.api
+        Anarchy.namespace = 'anarchy'
+        self.anarchysubject = AnarchySubject.from_definition({
+            "metadata": {**self.definition['metadata']},
+            "spec": {},
+            "status": {},
+        })
+
+    async def test_buffered_status_patch(self):
+        async with self.anarchysubject.buffered_status_patch():
+            await self.anarchysubject.json_patch_status([{
+                "op": "add", "path": "/status/runs", "value": {"active": []},
+            }])
+            await self.anarchysubject.set_run_status('pending')
+            self.assertEqual(self.anarchysubject.status['runStatus'], 'pending')
+            self.assertEqual(self.api.patches, [])
+        self.assertEqual(len(self.api.patches), 1)
+        self.assertEqual(self.api.patches[0][0]['value'], '1')
+        self.assertEqual(len(self.api.patches[0]), 3)
+
+    async def test_buffered_status_patch_conflict(self):
+        self.definition['metadata']['resourceVersion'] = '2'
+        self.definition['status']['pendingActions'] = [{"name": "action-b"}]
+        with self.assertRaises(kopf.TemporaryError):
+            async with self.anarchysubject.buffered_status_patch():
+                await self.anarchysubject.json_patch_status([{
+                    "op": "add", "path": "/status/pendingActions", "value": [{"name": "action-a"}],
+                }])
+                await self.anarchysubject.json_patch_status([{
+                    "op": "remove", "path": "/status/pendingActions/0",
+                }])
+        # Positional ops are not replayed against changed status
+        self.assertEqual(len(self.api.patches), 1)
+        self.assertEqual(self.definition['status']['pendingActions'], [{"name": "action-b"}])
+        self.assertEqual(self.anarchysubject.status['pendingActions'], [{"name": "action-b"}])
+        self.assertIsNone(self.anarchysubject.status_patch)
+
+    async def test_buffered_status_patch_test_failed(self):
+        async with self.anarchysubject.buffered_status_patch():
+            with self.assertRaises(kubernetes_asyncio.client.rest.ApiException):
+                await self.anarchysubject.json_patch_status([{
+                    "op": "test", "path": "/status/activeAction", "value": None,
+                }])
+        self.assertEqual(self.api.patches, [])
+
+    async def test_locked_reentrant(self):
+        async with self.anarchysubject.locked():
+            async with self.anarchysubject.locked():
+                self.assertTrue(self.anarchysubject.lock.locked())
+            self.assertTrue(self.anarchysubject.lock.locked())
+        self.assertFalse(self.anarchysubject.lock.locked())
+
+    async def test_update_status_conflict(self):
+        self.definition['metadata']['resourceVersion'] = '2'
+        await self.anarchysubject.set_run_status('successful')
+        self.assertEqual(len(self.api.patches), 2)
+        self.assertEqual(self.api.patches[0][0]['value'], '1')
+        self.assertEqual(self.api.patches[1][0]['value'], '2')
+        self.assertEqual(self.anarchysubject.status['runStatus'], 'successful')
+        self.assertFalse(self.anarchysubject.lock.locked())
+
+    async def test_update_status_unlocked(self):
+        async def set_run_status():
+            await self.anarchysubject.set_run_status('successful')
+        async with self.anarchysubject.locked():
+            # Status update from another task does not wait for the lock
+            await asyncio.wait_for(asyncio.create_task(set_run_status()), 1)
+        self.assertEqual(self.anarchysubject.status['runStatus'], 'successful')
+
+if __name__ == '__main__':
+    unittest.main()
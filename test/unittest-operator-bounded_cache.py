@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+sys.path.append('../operator')
+
+from bounded_cache import BoundedCache
+
+class Item:
+    def __init__(self, name, size=1, finished=True):
+        self.finished = finished
+        self.name = name
+        self.size = size
+
+class TestBoundedCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = BoundedCache(
+            evictable = lambda item: item.finished,
+            max_bytes = 10,
+            max_objects = 3,
+            sizeof = lambda item: item.size,
+        )
+
+    def test_evict_lru(self):
+        for name in ('a', 'b', 'c'):
+            self.cache[name] = Item(name)
+        self.cache.touch('a')
+        self.cache['d'] = Item('d')
+        self.assertEqual(list(self.cache), ['c', 'a', 'd'])
+        self.assertEqual(self.cache.total_bytes, 3)
+        self.assertEqual(self.cache.eviction_count, 1)
+
+    def test_evict_by_size(self):
+        self.cache['a'] = Item('a', size=6)
+        self.cache['b'] = Item('b', size=6)
+        self.assertEqual(list(self.cache), ['b'])
+        self.assertEqual(self.cache.total_bytes, 6)
+
+    def test_updated_size(self):
+        item = Item('a', size=2)
+        self.cache['a'] = item
+        self.cache['b'] = Item('b', size=2)
+        item.size = 9
+        self.cache.updated('a')
+        self.assertEqual(list(self.cache), ['a'])
+        self.assertEqual(self.cache.total_bytes, 9)
+
+    def test_not_evictable(self):
+        self.cache['a'] = Item('a', finished=False)
+        with self.cache.pinned('b'):
+            self.cache['b'] = Item('b')
+            self.cache['c'] = Item('c')
+            self.cache['d'] = Item('d')
+        self.assertEqual(list(self.cache), ['d', 'a', 'b'])
+        self.assertEqual(self.cache.pins, {})
+
+    def test_pop(self):
+        self.cache['a'] = Item('a', size=4)
+        self.cache.pop('a')
+        self.assertIsNone(self.cache.pop('a', None))
+        self.assertEqual(self.cache.total_bytes, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+sys.path.append('../operator')
+
+from datetime import datetime, timedelta, timezone
+
+from anarchy import Anarchy
+from anarchygovernor import AnarchyGovernor
+from garbage_collector import GarbageCollector
+
+class CustomObjectsRecorder:
+    def __init__(self, items):
+        self.deleted = []
+        self.deleted_collections = []
+        self.items = items
+        self.listed = []
+
+    async def delete_collection_namespaced_custom_object(self, label_selector, **_):
+        self.deleted_collections.append(label_selector)
+
+    async def delete_namespaced_custom_object(self, name, **_):
+        self.deleted.append(name)
+
+    async def list_namespaced_custom_object(self, label_selector, plural, **_):
+        self.listed.append((plural, label_selector))
+        return {"items": self.items, "metadata": {}}
+
+def timestamp(seconds_ago):
+    return (datetime.now(timezone.utc) - timedelta(seconds=seconds_ago)).strftime('%FT%TZ')
+
+class TestGarbageCollector(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.api = CustomObjectsRecorder([
+            {"metadata": {"name": "expired"}, "status": {"finishedTimestamp": timestamp(7200)}},
+            {"metadata": {"name": "retained"}, "status": {"finishedTimestamp": timestamp(60)}},
+            {"metadata": {"name": "deleting", "deletionTimestamp": timestamp(10)}, "status": {"finishedTimestamp": timestamp(7200)}},
+            {"metadata": {"name": "no-timestamp"}, "status": {}},
+        ])
+        Anarchy.custom_objects_api = self.api
+        Anarchy.namespace = 'anarchy'
+
+    async def test_collect(self):
+        anarchy_governor = AnarchyGovernor({
+            "metadata": {"name": "test", "namespace": "anarchy", "resourceVersion": "1"},
+            "spec": {
+                "removeFinishedActions": {"after": "1h"},
+                "removeSuccessfulRuns": {"after": "2h"},
+            },
+        })
+        AnarchyGovernor.cache['test'] = anarchy_governor
+        try:
+            await GarbageCollector.collect()
+        finally:
+            AnarchyGovernor.cache.pop('test')
+        self.assertEqual(self.api.listed, [
+            ('anarchyactions', f"{Anarchy.finished_label},{Anarchy.governor_label}=test"),
+            ('anarchyruns', f"{Anarchy.finished_label} in (canceled,successful),{Anarchy.governor_label}=test"),
+            ('anarchyactions', f"{Anarchy.finished_label},{Anarchy.governor_label} notin (test)"),
+            ('anarchyruns', f"{Anarchy.finished_label} in (canceled,successful),{Anarchy.governor_label} notin (test)"),
+        ])
+        # Only the action is past retention, runs use runPostTimestamp
+        self.assertEqual(self.api.deleted, ['expired'])
+
+    async def test_collect_expired(self):
+        await GarbageCollector.collect_expired(
+            plural = 'anarchyactions',
+            label_selector = Anarchy.finished_label,
+            retention_seconds = 3600,
+            timestamp_field = 'finishedTimestamp',
+        )
+        self.assertEqual(self.api.deleted, ['expired'])
+        self.assertEqual(self.api.deleted_collections, [])
+
+    async def test_collect_without_retention(self):
+        await GarbageCollector.collect_expired(
+            plural = 'anarchyactions',
+            label_selector = Anarchy.finished_label,
+            retention_seconds = 0,
+            timestamp_field = 'finishedTimestamp',
+        )
+        self.assertEqual(self.api.deleted, [])
+        self.assertEqual(self.api.deleted_collections, [Anarchy.finished_label])
+
+if __name__ == '__main__':
+    unittest.main()
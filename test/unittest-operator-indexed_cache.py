@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+sys.path.append('../operator')
+
+from indexed_cache import IndexedCache
+
+class Item:
+    def __init__(self, name, group=None):
+        self.name = name
+        self.group = group
+
+class TestIndexedCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = IndexedCache({
+            "group": lambda item: item.group,
+        })
+
+    def test_lookup(self):
+        a = Item('a', 'x')
+        b = Item('b', 'x')
+        c = Item('c')
+        self.cache['a'] = a
+        self.cache['b'] = b
+        self.cache['c'] = c
+        self.assertCountEqual(self.cache.lookup('group', 'x'), [a, b])
+        self.assertEqual(self.cache.lookup('group', 'y'), [])
+
+    def test_reindex(self):
+        a = Item('a', 'x')
+        self.cache['a'] = a
+        a.group = 'y'
+        self.cache.reindex('a')
+        self.assertEqual(self.cache.lookup('group', 'x'), [])
+        self.assertEqual(self.cache.lookup('group', 'y'), [a])
+        self.assertNotIn('x', self.cache.indexes['group'])
+
+    def test_remove(self):
+        self.cache['a'] = Item('a', 'x')
+        self.cache['b'] = Item('b', 'x')
+        self.cache.pop('a')
+        del self.cache['b']
+        self.assertIsNone(self.cache.pop('c', None))
+        self.assertEqual(self.cache.lookup('group', 'x'), [])
+        self.assertEqual(self.cache.indexes['group'], {})
+        self.assertEqual(self.cache.indexed_values, {})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+sys.path.append('../operator')
+
+import prometheus_client
+
+from metrics import Metrics
+
+class TestMetrics(unittest.IsolatedAsyncioTestCase):
+    def test_api_request_labels(self):
+        self.assertEqual(
+            Metrics.api_request_labels(
+                '/apis/{group}/{version}/namespaces/{namespace}/{plural}/{name}/status',
+                'PATCH', {"plural": "anarchysubjects"}, [],
+            ),
+            ('patch', 'anarchysubjects/status')
+        )
+        self.assertEqual(
+            Metrics.api_request_labels(
+                '/apis/{group}/{version}/namespaces/{namespace}/{plural}',
+                'GET', {"plural": "anarchyruns"}, [('labelSelector', 'a'), ('watch', True)],
+            ),
+            ('watch', 'anarchyruns')
+        )
+        self.assertEqual(
+            Metrics.api_request_labels('/api/v1/namespaces/{namespace}/pods', 'GET', {}, []),
+            ('list', 'pods')
+        )
+        self.assertEqual(
+            Metrics.api_request_labels('/api/v1/namespaces/{namespace}/pods/{name}', 'DELETE', {}, []),
+            ('delete', 'pods')
+        )
+
+    async def test_timed_handler(self):
+        @Metrics.timed_handler('Test', 'fail')
+        async def fail():
+            raise Exception("test")
+
+        with self.assertRaises(Exception):
+            await fail()
+        self.assertEqual(
+            prometheus_client.REGISTRY.get_sample_value(
+                'anarchy_handler_errors_total', {"kind": "Test", "handler": "fail"}
+            ), 1
+        )
+        self.assertEqual(fail.__name__, 'fail')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+sys.path.append('../operator')
+
+import asyncio
+import time
+
+from anarchy import Anarchy
+from rate_limiter import RateLimiter
+
+class TestRateLimiter(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        Anarchy.kube_write_burst = 1
+        Anarchy.kube_write_rate = 50
+        RateLimiter.tokens = 0
+        RateLimiter.updated = time.monotonic()
+
+    async def asyncTearDown(self):
+        await RateLimiter.on_cleanup()
+
+    async def test_priority_order(self):
+        order = []
+
+        async def write(name, priority):
+            with RateLimiter.priority(priority):
+                await RateLimiter.acquire()
+            order.append(name)
+
+        tasks = [
+            asyncio.create_task(write('housekeeping', RateLimiter.housekeeping)),
+            asyncio.create_task(write('normal', RateLimiter.normal)),
+            asyncio.create_task(write('critical', RateLimiter.critical)),
+        ]
+        await asyncio.sleep(0)
+        self.assertEqual(RateLimiter.queue_depth(), {'critical': 1, 'normal': 1, 'housekeeping': 1})
+        await asyncio.gather(*tasks)
+        self.assertEqual(order, ['critical', 'normal', 'housekeeping'])
+
+    async def test_reads_not_limited(self):
+        calls = []
+
+        class ApiClient:
+            async def call_api(self, resource_path, method, *args, **kwargs):
+                calls.append(method)
+
+        api_client = ApiClient()
+        RateLimiter.instrument_api_client(api_client)
+        await asyncio.wait_for(api_client.call_api('/api/v1/pods', 'GET'), 0.01)
+        self.assertEqual(calls, ['GET'])
+
+    async def test_disabled(self):
+        Anarchy.kube_write_rate = 0
+        await asyncio.wait_for(RateLimiter.acquire(), 0.01)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+sys.path.append('../operator')
+
+import asyncio
+
+from anarchy import Anarchy
+from resume_queue import ResumeQueue
+
+class TestResumeQueue(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.calls = []
+        Anarchy.resume_rate = 20
+        ResumeQueue.keys.clear()
+        await ResumeQueue.on_startup()
+
+    async def asyncTearDown(self):
+        await ResumeQueue.on_cleanup()
+
+    def callback(self, key):
+        async def resume():
+            self.calls.append(key)
+        return resume
+
+    async def test_add_once(self):
+        ResumeQueue.add('a', self.callback('a'))
+        ResumeQueue.add('a', self.callback('a'))
+        ResumeQueue.add('b', self.callback('b'))
+        await asyncio.sleep(0.2)
+        self.assertEqual(self.calls, ['a', 'b'])
+
+    async def test_rate(self):
+        for key in range(10):
+            ResumeQueue.add(key, self.callback(key))
+        await asyncio.sleep(0.12)
+        self.assertLess(len(self.calls), 5)
+        await asyncio.sleep(0.5)
+        self.assertEqual(len(self.calls), 10)
+
+    async def test_retry(self):
+        attempts = []
+        async def resume():
+            attempts.append(True)
+            if len(attempts) == 1:
+                raise Exception("test")
+        ResumeQueue.error_delay = 0.1
+        ResumeQueue.add('a', resume)
+        await asyncio.sleep(0.3)
+        self.assertEqual(len(attempts), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+sys.path.append('../operator')
+
+import kubernetes_asyncio
+
+from anarchy import Anarchy
+from runner_pod import RunnerPod
+
+class FakeResponse:
+    def __init__(self, status, data):
+        self.data = data
+        self.reason = 'Test'
+        self.status = status
+
+    async def read(self):
+        return self.data
+
+    @property
+    def headers(self):
+        return {}
+
+class TestRunnerPod(unittest.IsolatedAsyncioTestCase):
+    def test_properties(self):
+        pod = RunnerPod({
+            "metadata": {
+                "labels": {
+                    Anarchy.runner_label: "default",
+                    Anarchy.runner_terminating_label: "",
+                },
+                "name": "anarchy-runner-default-abcde",
+                "namespace": "anarchy",
+            },
+            "spec": {
+                "containers": [{
+                    "env": [
+                        {"name": "POD_NAME", "valueFrom": {"fieldRef": {"fieldPath": "metadata.name"}}},
+                        {"name": "RUNNER_TOKEN", "value": "secret"},
+                    ],
+                    "name": "runner",
+                }],
+            },
+            "status": {
+                "phase": "Running",
+            },
+        })
+        self.assertEqual(pod.runner_name, "default")
+        self.assertEqual(pod.runner_token, "secret")
+        self.assertTrue(pod.is_marked_for_termination)
+        self.assertTrue(pod.is_running)
+        self.assertFalse(pod.is_deleting)
+
+    async def test_read_response(self):
+        self.assertEqual(
+            await RunnerPod.read_response(FakeResponse(200, b'{"kind": "Pod"}')),
+            {"kind": "Pod"},
+        )
+        with self.assertRaises(kubernetes_asyncio.client.rest.ApiException) as cm:
+            await RunnerPod.read_response(FakeResponse(404, b'{"kind": "Status"}'))
+        self.assertEqual(cm.exception.status, 404)
+
+if __name__ == '__main__':
+    unittest.main()
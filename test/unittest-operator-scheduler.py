@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+sys.path.append('../operator')
+
+import asyncio
+
+from scheduler import Scheduler
+
+class TestScheduler(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.calls = []
+        self.delays = {}
+        self.scheduler = Scheduler(name='test', callback=self.callback)
+        await self.scheduler.start()
+
+    async def asyncTearDown(self):
+        await self.scheduler.stop()
+
+    async def callback(self, key):
+        self.calls.append(key)
+        return self.delays.get(key)
+
+    async def test_schedule_due_order(self):
+        self.scheduler.schedule('b', 0.2)
+        self.scheduler.schedule('a', 0.1)
+        await asyncio.sleep(0.3)
+        self.assertEqual(self.calls, ['a', 'b'])
+        self.assertEqual(len(self.scheduler), 0)
+
+    async def test_schedule_sooner_wins(self):
+        self.scheduler.schedule('a', 10)
+        self.scheduler.schedule('a', 0)
+        self.scheduler.schedule('a', 5)
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.calls, ['a'])
+        self.assertEqual(len(self.scheduler), 0, msg="key should not remain scheduled after callback")
+
+    async def test_cancel(self):
+        self.scheduler.schedule('a', 0.05)
+        self.scheduler.cancel('a')
+        await asyncio.sleep(0.1)
+        self.assertEqual(self.calls, [])
+
+    async def test_reschedule_from_callback(self):
+        self.delays['a'] = 0.05
+        self.scheduler.schedule('a')
+        await asyncio.sleep(0.12)
+        self.assertGreaterEqual(len(self.calls), 2)
+        self.assertIn('a', self.scheduler)
+
+    async def test_error_delay(self):
+        async def callback(key):
+            self.calls.append(key)
+            raise TemporaryError()
+
+        class TemporaryError(Exception):
+            delay = 60
+
+        self.scheduler.callback = callback
+        self.scheduler.schedule('a')
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.calls, ['a'])
+        self.assertIn('a', self.scheduler, msg="key should be rescheduled with error delay")
+
+    async def test_stop_waits_for_dispatch(self):
+        cancelled = []
+        async def callback(key):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                await asyncio.sleep(0.01)
+                cancelled.append(key)
+                raise
+
+        self.scheduler.callback = callback
+        self.scheduler.schedule('a')
+        await asyncio.sleep(0.05)
+        await self.scheduler.stop()
+        self.assertEqual(cancelled, ['a'])
+        self.assertEqual(len(self.scheduler.tasks), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+sys.path.append('../operator')
+
+from sharding import Sharding
+
+class TestSharding(unittest.TestCase):
+    def setUp(self):
+        Sharding.enabled = True
+        Sharding.identity = 'anarchy-0'
+
+    def tearDown(self):
+        Sharding.build_ring([])
+        Sharding.enabled = False
+
+    def test_owns_without_members(self):
+        Sharding.build_ring([])
+        self.assertTrue(Sharding.owns('test'))
+
+    def test_distribution(self):
+        Sharding.build_ring(['anarchy-0', 'anarchy-1', 'anarchy-2'])
+        names = [f"subject-{i}" for i in range(3000)]
+        counts = {}
+        for name in names:
+            owner = Sharding.owner(name)
+            counts[owner] = counts.get(owner, 0) + 1
+        self.assertEqual(len(counts), 3)
+        for count in counts.values():
+            self.assertGreater(count, 500)
+
+    def test_rebalance_moves_minimal_subjects(self):
+        names = [f"subject-{i}" for i in range(3000)]
+        Sharding.build_ring(['anarchy-0', 'anarchy-1', 'anarchy-2'])
+        before = {name: Sharding.owner(name) for name in names}
+        Sharding.build_ring(['anarchy-0', 'anarchy-1', 'anarchy-2', 'anarchy-3'])
+        after = {name: Sharding.owner(name) for name in names}
+        for name in names:
+            if before[name] != after[name]:
+                self.assertEqual(after[name], 'anarchy-3')
+
+if __name__ == '__main__':
+    unittest.main()